@@ -0,0 +1,145 @@
+"""
+Binary analytics artifacts with on-demand Excel export.
+
+The results of an analytics run are stored as typed columnar files, one per granularity, in a directory per
+dataset: `data_analytics/<TICKER>/<Daily|Hourly>/Analytics_<TICKER>_<period>_<interval>_<YYYYMMDD>/weekly.parquet`
+(and `monthly`, `yearly`). Writing and reading them back is much faster than going through openpyxl, and
+readers can load a single granularity or only some of its columns with `read_analytics`. Excel workbooks are
+only built when asked for, either for every run with the `excel_export` switch of the analytics configuration
+or for a single dataset from the command line:
+
+    python scripts/analytics_artifacts.py BTC-USD 1y 1d [YYYYMMDD]
+"""
+import os
+import sys
+import shutil
+import logging
+import pandas as pd
+from glob import glob
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+
+ANALYTICS_ROOT = 'data_analytics'
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+
+def dataset_directory(ticker, interval, root=ANALYTICS_ROOT):
+    frequency = 'Hourly' if '1h' in interval else 'Daily'
+    return os.path.join(root, ticker.replace('-USD', ''), frequency)
+
+
+def artifact_directory(ticker, period, interval, date_str=None, root=ANALYTICS_ROOT):
+    """Directory holding the artifacts of a dataset computed on `date_str` (YYYYMMDD, defaults to today)."""
+    date_str = date_str or datetime.now().strftime('%Y%m%d')
+    symbol = ticker.replace('-USD', '')
+    return os.path.join(dataset_directory(ticker, interval, root), f"Analytics_{symbol}_{period}_{interval}_{date_str}")
+
+
+def write_frames(frames, directory, file_format='parquet'):
+    """
+    Write {name: frame} as one file per frame into `directory`, replacing a previous version of the directory.
+
+    Empty or missing frames are left out. The files are written into a temporary directory first, so readers
+    never see a half-written set of artifacts.
+    """
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, df in frames.items():
+        if df is None or df.empty:
+            continue
+        path = os.path.join(tmp_directory, f"{name}{FORMATS[file_format]}")
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        if file_format == 'parquet':
+            pq.write_table(table, path)
+        else:
+            feather.write_feather(table, path)
+    return replace_directory(tmp_directory, directory)
+
+
+def replace_directory(tmp_directory, directory):
+    """Move a fully written `tmp_directory` to `directory`, replacing a previous version of it."""
+    if os.path.exists(directory):
+        old_directory = f"{directory}.old"
+        shutil.rmtree(old_directory, ignore_errors=True)
+        os.replace(directory, old_directory)
+        os.replace(tmp_directory, directory)
+        shutil.rmtree(old_directory)
+    else:
+        os.replace(tmp_directory, directory)
+    return directory
+
+
+def read_frame(directory, name, columns=None):
+    """Read one artifact of a directory, optionally only some columns. Returns None if it does not exist."""
+    for file_format, extension in FORMATS.items():
+        path = os.path.join(directory, f"{name}{extension}")
+        if not os.path.exists(path):
+            continue
+        if columns is not None:
+            # The first column of every artifact is its index
+            index_column = (pq.read_schema(path) if file_format == 'parquet' else feather.read_table(path, memory_map=True).schema).names[0]
+            columns = [index_column] + [column for column in columns if column != index_column]
+        table = pq.read_table(path, columns=columns) if file_format == 'parquet' else feather.read_table(path, columns=columns)
+        df = table.to_pandas()
+        return df.set_index(df.columns[0])
+    return None
+
+
+def read_frames(directory, names=None):
+    """Read every artifact (or the given ones) of a directory into {name: frame}."""
+    if names is None:
+        names = sorted({os.path.splitext(os.path.basename(path))[0] for extension in FORMATS.values() for path in glob(os.path.join(directory, f"*{extension}"))})
+    return {name: read_frame(directory, name) for name in names}
+
+
+def available_dates(ticker, period, interval, root=ANALYTICS_ROOT):
+    """Dates (YYYYMMDD) for which artifacts of a dataset exist, most recent first."""
+    paths = glob(artifact_directory(ticker, period, interval, '[0-9]' * 8, root))
+    return sorted((path.rsplit('_', 1)[-1] for path in paths if os.path.isdir(path)), reverse=True)
+
+
+def read_analytics(ticker, period, interval, granularity='weekly', date_str=None, columns=None, root=ANALYTICS_ROOT):
+    """Read one granularity ('weekly', 'monthly' or 'yearly') of a dataset, from the most recent run by default."""
+    if date_str is None:
+        dates = available_dates(ticker, period, interval, root)
+        if not dates:
+            return None
+        date_str = dates[0]
+    return read_frame(artifact_directory(ticker, period, interval, date_str, root), granularity, columns)
+
+
+def export_excel(directory, force=False):
+    """
+    Build `<directory>.xlsx` from the artifacts of a directory, one sheet per artifact.
+
+    The workbook is only rebuilt when it is missing or older than the artifacts, unless `force` is set.
+    """
+    xlsx_path = f"{directory}.xlsx"
+    if not force and os.path.exists(xlsx_path) and os.path.getmtime(xlsx_path) >= os.path.getmtime(directory):
+        return xlsx_path
+    frames = read_frames(directory)
+    with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+        for name in ('weekly', 'monthly', 'yearly'):
+            if frames.get(name) is not None:
+                frames.pop(name).to_excel(writer, sheet_name=name.capitalize())
+        for name, df in frames.items():
+            df.to_excel(writer, sheet_name=name.capitalize())
+    logging.info(f"Analytics exported to {xlsx_path}")
+    return xlsx_path
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 4:
+        print("Usage: python scripts/analytics_artifacts.py TICKER PERIOD INTERVAL [YYYYMMDD]")
+        sys.exit(1)
+    ticker, period, interval = sys.argv[1:4]
+    date_str = sys.argv[4] if len(sys.argv) > 4 else (available_dates(ticker, period, interval) or [None])[0]
+    directory = artifact_directory(ticker, period, interval, date_str)
+    if date_str is None or not os.path.isdir(directory):
+        print(f"No analytics artifacts for {ticker} {period} {interval}")
+        sys.exit(1)
+    print(export_excel(directory, force=True))
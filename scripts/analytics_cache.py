@@ -0,0 +1,147 @@
+"""
+Content-fingerprint cache of analytics results.
+
+A result is identified by a fingerprint of its inputs: a hash of the input bars (index, columns and values),
+the parameters the results depend on (interval, indicator configuration, output format) and the version of the
+analytics code, i.e. a hash of the source of the modules computing them. Unchanged inputs therefore map to the
+same key whatever the day of the run, and a series refetched during the day maps to a new one.
+
+Every cached result is a copy of its artifact directory (see analytics_artifacts.py) under
+`analytics_cache/<key[:2]>/<key>/`. A hit copies the entry into the artifact directory of the run instead of
+recomputing it, and every artifact directory records the fingerprint it was built from, so a run whose
+artifacts are already current does nothing at all. The cache is bounded by a number of entries and a total
+size, the least recently used entries (by directory modification time, refreshed on every hit) are evicted
+first. Entries are plain directories written atomically, so the worker processes of the analytics executor
+share one cache without locking; a lookup racing an eviction is counted as a miss.
+"""
+import os
+import shutil
+import hashlib
+import logging
+import pandas as pd
+from analytics_artifacts import replace_directory
+
+CACHE_ROOT = 'analytics_cache'
+FINGERPRINT_FILE = '.fingerprint'
+
+
+def code_version(*paths):
+    """Hash of the given source files, changing whenever their code changes."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+class AnalyticsCache:
+    """
+    Size-bounded LRU cache of analytics artifact directories, keyed on content fingerprints.
+
+    Attributes:
+        root (str): Directory holding the cache entries.
+        version (str): Version of the analytics code, part of every fingerprint.
+        max_entries (int): Maximum number of cached results.
+        max_bytes (int): Maximum total size of the cached results.
+        stats (dict): Hit, miss, store and eviction counts of this instance.
+
+    Methods:
+        fingerprint(df, *params): Key of the results computed from a frame with the given parameters.
+        is_current(directory, key): Whether an artifact directory was built from the given key.
+        get(key, directory): Copies a cached result into an artifact directory, returns False on a miss.
+        put(key, directory): Stores the artifacts of a directory under a key and evicts the oldest entries.
+        evict(): Removes the least recently used entries until the cache is within its bounds.
+    """
+    def __init__(self, root=CACHE_ROOT, version='', max_entries=500, max_bytes=2 * 1024 ** 3):
+        self.root = root
+        self.version = version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def fingerprint(self, df, *params):
+        digest = hashlib.sha256(repr((self.version, params, list(df.columns), df.index.name)).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    @staticmethod
+    def read_fingerprint(directory):
+        try:
+            with open(os.path.join(directory, FINGERPRINT_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def is_current(self, directory, key):
+        return self.read_fingerprint(directory) == key
+
+    @staticmethod
+    def mark(directory, key):
+        with open(os.path.join(directory, FINGERPRINT_FILE), 'w') as f:
+            f.write(key)
+
+    def copy(self, source, directory, key):
+        """Copy the artifacts of `source` to `directory` atomically, recording the fingerprint they were built from."""
+        tmp_directory = f"{directory}.tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        shutil.copytree(source, tmp_directory)
+        self.mark(tmp_directory, key)
+        return replace_directory(tmp_directory, directory)
+
+    def get(self, key, directory):
+        entry = self.entry_path(key)
+        try:
+            os.utime(entry)
+            os.makedirs(os.path.dirname(directory), exist_ok=True)
+            self.copy(entry, directory, key)
+        except OSError:
+            # Missing, or evicted by another process while being copied
+            self.stats['misses'] += 1
+            return False
+        self.stats['hits'] += 1
+        return True
+
+    def put(self, key, directory):
+        self.mark(directory, key)
+        entry = self.entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            self.copy(directory, entry, key)
+        except OSError as e:
+            logging.warning(f"Could not cache the analytics of {directory}: {e}")
+            return
+        self.stats['stores'] += 1
+        self.evict()
+
+    def entries(self):
+        """(last use, size, path) of every entry, least recently used first."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_dir() and not entry.name.endswith(('.tmp', '.old')):
+                    try:
+                        entries.append((entry.stat().st_mtime, directory_size(entry.path), entry.path))
+                    except OSError:
+                        continue
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.stats['evictions'] += 1
+            logging.info(f"Evicted the cached analytics {os.path.basename(path)}")
@@ -0,0 +1,110 @@
+"""
+Process-pool execution of independent analytics jobs.
+
+Every job (a ticker and interval with the periods to analyse) is loaded, computed and saved in its own worker
+process, so the pandas work and the result writes of several jobs run on several cores. Every worker builds its
+analytics object once and reuses it for all its jobs. A failing job is reported with its traceback instead of
+aborting the run, and the time spent in each phase of every job is collected, as well as the analytics cache
+statistics of the jobs.
+"""
+import os
+import time
+import logging
+import traceback
+from contextlib import contextmanager
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# One analytics job, `periods` holds every period of the interval analysed by the job
+AnalyticsJob = namedtuple('AnalyticsJob', ['ticker', 'interval', 'periods'])
+
+# The analytics object of a worker process, built once by init_worker
+_worker_analytics = None
+
+
+@contextmanager
+def timed(timings, phase):
+    """Add the seconds spent in the block to timings[phase]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+def init_worker(factory, config):
+    global _worker_analytics
+    _worker_analytics = factory(config)
+
+
+def execute_job(analytics, job):
+    """Run one job on an analytics object, returning its result record instead of raising."""
+    started = time.perf_counter()
+    result = {'job': job, 'pid': os.getpid(), 'status': 'ok', 'paths': [], 'timings': {}, 'error': None}
+    try:
+        result.update(analytics.run_job(job))
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def execute_in_worker(job):
+    return execute_job(_worker_analytics, job)
+
+
+class AnalyticsExecutor:
+    """
+    Runs analytics jobs serially or on a pool of worker processes.
+
+    Attributes:
+        factory (callable): Builds the analytics object of a worker from the configuration, e.g. CryptoAnalytics.
+        config (dict): Analytics configuration passed to the factory.
+        workers (int): Number of worker processes, 1 runs the jobs in the calling process.
+
+    Methods:
+        run(jobs, local): Runs all jobs and returns their result records.
+        report(results, seconds): Logs the run summary and the slowest jobs.
+    """
+    def __init__(self, factory, config, workers=1):
+        self.factory = factory
+        self.config = config
+        self.workers = max(1, workers or 1)
+
+    def run(self, jobs, local=None):
+        """Run the jobs and return one record per job: {'job', 'status', 'paths', 'timings', 'seconds', 'error', 'pid'}."""
+        started = time.perf_counter()
+        if self.workers == 1 or len(jobs) <= 1:
+            analytics = local or self.factory(self.config)
+            results = [execute_job(analytics, job) for job in jobs]
+        else:
+            results = []
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), initializer=init_worker, initargs=(self.factory, self.config)) as pool:
+                futures = {pool.submit(execute_in_worker, job): job for job in jobs}
+                for future in as_completed(futures):
+                    try:
+                        results.append(future.result())
+                    except Exception:
+                        # The worker itself died (e.g. killed or out of memory), the other jobs go on
+                        results.append({'job': futures[future], 'pid': None, 'status': 'failed', 'paths': [], 'timings': {},
+                                        'error': traceback.format_exc(), 'seconds': None})
+        self.report(results, time.perf_counter() - started)
+        return results
+
+    def report(self, results, seconds):
+        failed = [result for result in results if result['status'] == 'failed']
+        busy = sum(result['seconds'] or 0.0 for result in results)
+        logging.info(f"Analytics executor finished {len(results)} jobs in {seconds:.2f}s on {self.workers} workers "
+                     f"({busy:.2f}s of job time, {len(failed)} failed).")
+        cache = {}
+        for result in results:
+            for name, count in result.get('cache', {}).items():
+                cache[name] = cache.get(name, 0) + count
+        if cache:
+            logging.info("Analytics cache: " + ', '.join(f"{count} {name}" for name, count in cache.items()))
+        for result in sorted(results, key=lambda result: result['seconds'] or 0.0, reverse=True)[:5]:
+            phases = ', '.join(f"{phase} {value:.2f}s" for phase, value in result['timings'].items())
+            logging.info(f"  {result['job'].ticker} {result['job'].interval} {list(result['job'].periods)}: {(result['seconds'] or 0.0):.2f}s ({phases})")
+        for result in failed:
+            logging.error(f"Analytics job {result['job']} failed:\n{result['error']}")
@@ -2,7 +2,17 @@ import os
 import logging
 import pandas as pd
 from datetime import datetime
-import openpyxl
+from data_windows import slice_period, period_start, period_rank, plan_downloads
+from price_store import open_store
+from rollups import RollupEngine, IncrementalRollups
+from analytics_executor import AnalyticsExecutor, AnalyticsJob, timed
+from analytics_artifacts import artifact_directory, write_frames, export_excel
+from analytics_cache import AnalyticsCache, code_version
+import rollups
+import indicators
+from indicators import IndicatorEngine
+from memory_profile import apply_profile
+from dataset_catalog import DatasetCatalog, CATALOG_PATH, frame_checksum
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,109 +22,274 @@ class CryptoAnalytics:
     A class to perform and manage analytics on cryptocurrency data.
 
     Methods:
-        load_data(ticker, period, interval): Loads data for a given ticker, period, and interval.
-        calculate_analytics(df): Calculates various analytics on the data.
-        save_analytics(df, ticker, period, interval): Saves the analytics data to a CSV file.
-        run_analytics(): Runs the entire analytics pipeline for a specified configuration.
+        load_data(ticker, period, interval): Loads data for a given ticker, period, and interval, resolving
+            virtual windows from a wider stored download of the same interval (looked up in the dataset catalog),
+            or from the columnar store,
+            and holds it under the configured `memory_profile`.
+        calculate_analytics(df, interval): Calculates the weekly, monthly and yearly analytics in a single pass over the data, plus the indicators.
+        calculate_indicators(df, interval): Calculates the configured technical indicators and the risk summary.
+        save_analytics(weekly, monthly, yearly, ticker, period, interval, extra, key): Saves the analytics as Parquet (or Feather) artifacts.
+        fingerprint(df, interval): Cache key of the analytics computed from a frame.
+        serve_cached(key, ticker, period, interval): Reuses the cached analytics of a fingerprint, if any.
+        run_job(job): Loads, computes and saves the analytics of one (ticker, interval, periods) job.
+        run_analytics(): Runs the entire analytics pipeline for a specified configuration, in parallel with `workers` > 1.
     """
     def __init__(self, config):
         self.config = config
+        self.store = open_store(config)
+        self.catalog = DatasetCatalog(config.get('catalog', CATALOG_PATH))
+        self.rollups = RollupEngine()
+        self.indicators = IndicatorEngine(config['indicators']) if config.get('indicators') else None
+        # Results are reused across runs as long as the input bars and the code computing them are unchanged
+        self.cache = AnalyticsCache(version=code_version(__file__, rollups.__file__, indicators.__file__), **config.get('cache', {}))
         logging.info("CryptoAnalytics class initialized with configuration.")
 
     def load_data(self, ticker, period, interval):
-        frequency = 'Hourly' if '1h' in interval else 'Daily'
-        directory = os.path.join('data', ticker.replace('-USD', ''), frequency)
-        filename = f"{ticker.replace('-USD', '')}_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}.csv"
-        file_path = os.path.join(directory, filename)
-        logging.info(f"Checking existence of data file: {file_path}")
-        if os.path.exists(file_path):
-            logging.info(f"Attempting to load data from {file_path}")
-            df = pd.read_csv(file_path, parse_dates=['Date'], index_col='Date')
-            logging.info(f"Data loaded from {file_path}")
+        return apply_profile(self.read_data(ticker, period, interval), self.config.get('memory_profile', 'default'), f"{ticker} {period} {interval}")
+
+    def read_data(self, ticker, period, interval):
+        if self.store is not None:
+            # Period windows are date-range reads, only the partitions of the window are opened
+            as_of = self.config.get('as_of')
+            if as_of:
+                # Rebuild the data as of a past fetch date (YYYYMMDD), only supported by the versioned store
+                df = self.store.read(ticker, interval, start=period_start(period, datetime.strptime(as_of, '%Y%m%d')), as_of=as_of)
+            else:
+                df = self.store.read(ticker, interval, start=period_start(period))
+            if df is None:
+                logging.error(f"No data in the columnar store for {ticker}, {period}, {interval}, this will skip any further processing.")
             return df
-        else:
-            logging.error(f"Failed to find data file at {file_path}, this will skip any further processing for this file.")
+        date_str = datetime.now().strftime('%Y%m%d')
+        # The window may be virtual, i.e. only stored as part of a wider download of the same interval
+        entry = self.catalog.covering(ticker, period, interval, date_str)
+        if entry is None or not os.path.exists(entry['location']):
+            logging.error(f"No {date_str} data file for {ticker}, {period}, {interval} in the catalog, this will skip any further processing for this file.")
             return None
+        df = pd.read_csv(entry['location'], parse_dates=['Date'], index_col='Date')
+        if entry['period'] != period:
+            df = slice_period(df, period, end=datetime.strptime(date_str, '%Y%m%d'))
+        logging.info(f"Data for the {period} window loaded from {entry['location']}")
+        return df
 
-    def flatten_columns(self, resampled_df):
-        resampled_df.columns = ['_'.join(col).strip() for col in resampled_df.columns.values]
-        return resampled_df
-
-    def calculate_analytics(self, df):
-        weekly = df.resample('W').agg({
-            'Close': ['mean', 'max', 'min', 'last'],
-            'Open': 'first',
-            'Volume': 'sum'
-        })
-        monthly = df.resample('M').agg({
-            'Close': ['mean', 'max', 'min', 'last'],
-            'Open': 'first',
-            'Volume': 'sum'
-        })
-        yearly = df.resample('Y').agg({
-            'Close': ['mean', 'max', 'min', 'last'],
-            'Open': 'first',
-            'Volume': 'sum'
-        })
-
-        weekly = self.flatten_columns(weekly)
-        monthly = self.flatten_columns(monthly)
-        yearly = self.flatten_columns(yearly)
-
-        # Calculate variations
-        for resampled in [weekly, monthly, yearly]:
-            resampled['variation_$_abs'] = resampled['Close_last'] - resampled['Open_first']
-            resampled['variation_%_rel'] = resampled['variation_$_abs'] / resampled['Open_first'] * 100
-
-        return weekly, monthly, yearly
-
-    def save_analytics(self, weekly, monthly, yearly, ticker, period, interval):
-        frequency = 'Hourly' if '1h' in interval else 'Daily'
-        directory = os.path.join('data_analytics', ticker.replace('-USD', ''), frequency)
-        os.makedirs(directory, exist_ok=True)
-        filename = f"Analytics_{ticker.replace('-USD', '')}_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        file_path = os.path.join(directory, filename)
-
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            weekly.to_excel(writer, sheet_name='Weekly')
-            monthly.to_excel(writer, sheet_name='Monthly')
-            if not yearly.empty:  # Only save yearly data if it exists
-                yearly.to_excel(writer, sheet_name='Yearly')
-            logging.info(f"Analytics saved to {file_path}")
-        return file_path  # Return the path to the saved file
+    def calculate_analytics(self, df, interval):
+        """Return (weekly, monthly, yearly, extra), `extra` holding the configured indicators (see calculate_indicators)."""
+        # One scan of the raw bars feeds the weekly, monthly and yearly rollups (see rollups.py)
+        weekly, monthly, yearly = self.rollups.rollup(df)
+        return weekly, monthly, yearly, self.calculate_indicators(df, interval)
 
+    def calculate_indicators(self, df, interval):
+        """Return {'indicators': bar-level indicators, 'risk': one-row risk summary}, empty when no indicators are configured."""
+        if self.indicators is None or df is None or df.empty:
+            return {}
+        indicators, risk = self.indicators.compute(df.sort_index(), interval)
+        return {'indicators': indicators, 'risk': risk}
 
-    def run_analytics(self):
-        logging.info("Starting the analytics process for all configured tickers and timeframes.")
-        for ticker in self.config['tickers']:
-            for period, interval in self.config['combinations']:
-                # Generate the expected file path
-                frequency = 'Hourly' if '1h' in interval else 'Daily'
-                analytics_directory = os.path.join('data_analytics', ticker.replace('-USD', ''), frequency)
-                analytics_filename = f"Analytics_{ticker.replace('-USD', '')}_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}.xlsx"
-                analytics_file_path = os.path.join(analytics_directory, analytics_filename)
-
-                # Check if analytics already exist
-                logging.info(f"Checking if analytics have already been performed for {ticker} at {analytics_file_path}")
-                if os.path.exists(analytics_file_path):
-                    logging.info(f"Analytics already performed for {ticker}, {period}, {interval} and saved at {analytics_file_path}")
-                    continue  # Skip to the next iteration if analytics already exist
-
-                # Load the data
-                df = self.load_data(ticker, period, interval)
-                if df is not None and not df.empty:
-                    logging.info(f"Starting analysis for {ticker} with data from {period} period and {interval} interval.")
-                    weekly, monthly, yearly = self.calculate_analytics(df)
-                    # Save the results
-                    saved_path = self.save_analytics(weekly, monthly, yearly, ticker, period, interval)
-                    logging.info(f"Analytics successfully saved to {saved_path}")
+    def save_analytics(self, weekly, monthly, yearly, ticker, period, interval, extra=None, key=None):
+        """
+        Write the results as one columnar artifact per granularity (plus the `extra` frames), the Excel workbook only if `excel_export` is set.
+
+        The artifacts are also stored in the analytics cache under `key`, the fingerprint of their input bars.
+        """
+        directory = self.analytics_path(ticker, period, interval)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        # An empty yearly frame (window shorter than a year-end) is left out, like the former Yearly sheet
+        frames = {'weekly': weekly, 'monthly': monthly, 'yearly': yearly, **(extra or {})}
+        write_frames(frames, directory, self.config.get('analytics_format', 'parquet'))
+        logging.info(f"Analytics saved to {directory}")
+        if key is not None:
+            self.cache.put(key, directory)
+        if self.config.get('excel_export'):
+            export_excel(directory)
+        return directory  # Return the path to the saved artifacts
+
+    def analytics_path(self, ticker, period, interval):
+        return artifact_directory(ticker, period, interval)
+
+    def fingerprint(self, df, interval):
+        # The period only selects the bars, two windows holding the same bars share their results
+        return self.cache.fingerprint(df, interval, self.config.get('indicators'), self.config.get('analytics_format', 'parquet'))
+
+    def serve_cached(self, key, ticker, period, interval):
+        """Return the artifact directory of a job if its results for `key` are current or could be copied from the cache, None otherwise."""
+        directory = self.analytics_path(ticker, period, interval)
+        if self.cache.is_current(directory, key):
+            logging.info(f"Analytics for {ticker}, {period}, {interval} are up to date at {directory}")
+            return directory
+        if not self.cache.get(key, directory):
+            return None
+        logging.info(f"Analytics for {ticker}, {period}, {interval} served from the cache to {directory}")
+        if self.config.get('excel_export'):
+            export_excel(directory)
+        return directory
+
+    def bars_loader(self, ticker, interval, widest_period):
+        """Return a load_bars(start=None, end=None) function reading the bars of a (ticker, interval) series."""
+        if self.store is not None:
+            profile = self.config.get('memory_profile', 'default')
+            return lambda start=None, end=None: apply_profile(self.store.read(ticker, interval, start=start, end=end), profile, f"{ticker} {interval}")
+        # The CSV snapshots are only readable as a whole, the widest window of the interval is parsed once
+        source = self.load_data(ticker, widest_period, interval)
+        if source is not None:
+            source = source.sort_index()
+
+        def load_bars(start=None, end=None):
+            return None if source is None else source.loc[start:end]
+        return load_bars
+
+    def history_signature(self, ticker, interval, load_bars, before):
+        """
+        Signature of the stored bars of a series before `before`, the open bucket of its rollup state.
+
+        The stores count the writes that revised already stored bars (see ColumnarPriceStore.history_version);
+        the CSV snapshots are rewritten as a whole, their bars before `before` are hashed.
+        """
+        if self.store is not None:
+            return self.store.history_version(ticker, interval)
+        bars = load_bars(end=before - pd.Timedelta(1, 'ns'))
+        e = self.rollups
+        return frame_checksum(bars[[e.close, e.open, e.volume]]) if bars is not None else None
+
+    def refresh_state(self, ticker, interval, load_bars):
+        """
+        Fold the new bars of a (ticker, interval) series into its persisted rollup state.
+
+        Returns (state, recomputed buckets), the state being None when there is no data. The state is rebuilt
+        from the full history when it does not exist yet or when the stored bars before its open bucket no
+        longer match the signature it recorded (a refetch revised closed buckets).
+        """
+        path = os.path.join(self.config.get('state_dir', 'analytics_state'), ticker.replace('-USD', ''), f"{interval}.pkl")
+        state = IncrementalRollups(self.rollups, path)
+        changed = None
+        if state.partials is not None:
+            if state.history is not None and state.history == self.history_signature(ticker, interval, load_bars, state.open_start()):
+                changed = state.update(load_bars(start=state.open_start()))
+            if changed is None:
+                logging.info(f"Bars before the open bucket of {ticker} {interval} changed, rebuilding its rollup state.")
+        if changed is None:
+            bars = load_bars()
+            if bars is None or bars.empty:
+                return None, 0
+            changed = state.rebuild(bars)
+        history = self.history_signature(ticker, interval, load_bars, state.open_start())
+        if changed or history != state.history:
+            state.history = history
+            state.save()
+        logging.info(f"Rollup state of {ticker} {interval}: {changed} buckets recomputed.")
+        return state, changed
+
+    def plan_jobs(self):
+        """One job per (ticker, interval) with all its periods in incremental mode, one per (ticker, period, interval) otherwise."""
+        if self.config.get('incremental') and not self.config.get('as_of'):
+            # The rollup state of a (ticker, interval) is shared by its periods, so they stay in the same job
+            return [AnalyticsJob(ticker, interval, tuple(periods))
+                    for ticker in self.config['tickers']
+                    for interval, (_, periods) in plan_downloads(self.config['combinations']).items()]
+        return [AnalyticsJob(ticker, interval, (period,)) for ticker in self.config['tickers'] for period, interval in self.config['combinations']]
+
+    def run_incremental_job(self, job, timings):
+        ticker, interval = job.ticker, job.interval
+        paths = []
+        with timed(timings, 'load'):
+            load_bars = self.bars_loader(ticker, interval, max(job.periods, key=period_rank))
+        with timed(timings, 'refresh'):
+            state, _ = self.refresh_state(ticker, interval, load_bars)
+        if state is None:
+            logging.warning(f"No data available for analysis for {ticker}, {interval}.")
+            return paths
+        for period in job.periods:
+            # The fingerprint of the window's bars decides, the rollup state matches them (see refresh_state)
+            with timed(timings, 'load'):
+                bars = load_bars(start=period_start(period))
+            if bars is None or bars.empty:
+                logging.warning(f"No data available for analysis for {ticker}, {period}, {interval}.")
+                continue
+            with timed(timings, 'cache'):
+                key = self.fingerprint(bars, interval)
+                cached = self.serve_cached(key, ticker, period, interval)
+            if cached is not None:
+                paths.append(cached)
+                continue
+            with timed(timings, 'compute'):
+                if state.open_bars.index[-1] == bars.index.max():
+                    weekly, monthly, yearly = state.rollup(period_start(period), load_bars)
+                    # Indicators need the raw bars of the window, the rollup state only holds bucket partials
+                    extra = self.calculate_indicators(bars, interval)
                 else:
-                    logging.warning(f"No data available for analysis for {ticker}, {period}, {interval}. Loaded data frame is empty.")
+                    # The series changed since the state was refreshed, its bars are rolled up directly
+                    weekly, monthly, yearly, extra = self.calculate_analytics(bars, interval)
+            with timed(timings, 'save'):
+                paths.append(self.save_analytics(weekly, monthly, yearly, ticker, period, interval, extra, key))
+            logging.info(f"Analytics successfully saved to {paths[-1]}")
+        return paths
+
+    def run_job(self, job):
+        """
+        Load, compute and save the analytics of one job.
 
+        Returns {'paths': saved files, 'timings': seconds per phase, 'cache': cache statistics of the job}.
+        """
+        timings = {}
+        before = dict(self.cache.stats)
+        if self.config.get('incremental') and not self.config.get('as_of'):
+            # Intraday refreshes only fold the new bars into the rollup state instead of skipping until tomorrow
+            paths = self.run_incremental_job(job, timings)
+        else:
+            paths = self.run_full_job(job, timings)
+        return {'paths': paths, 'timings': timings, 'cache': {name: self.cache.stats[name] - before[name] for name in before}}
+
+    def run_full_job(self, job, timings):
+        paths = []
+        ticker, interval = job.ticker, job.interval
+        for period in job.periods:
+            # Load the data
+            with timed(timings, 'load'):
+                df = self.load_data(ticker, period, interval)
+            if df is not None and not df.empty:
+                # Results computed from the same bars are reused, whenever they were computed
+                with timed(timings, 'cache'):
+                    key = self.fingerprint(df, interval)
+                    cached = self.serve_cached(key, ticker, period, interval)
+                if cached is not None:
+                    paths.append(cached)
+                    continue
+                logging.info(f"Starting analysis for {ticker} with data from {period} period and {interval} interval.")
+                with timed(timings, 'compute'):
+                    weekly, monthly, yearly, extra = self.calculate_analytics(df, interval)
+                # Save the results
+                with timed(timings, 'save'):
+                    paths.append(self.save_analytics(weekly, monthly, yearly, ticker, period, interval, extra, key))
+                logging.info(f"Analytics successfully saved to {paths[-1]}")
+            else:
+                logging.warning(f"No data available for analysis for {ticker}, {period}, {interval}. Loaded data frame is empty.")
+        return paths
+
+    def run_analytics(self):
+        """Run every job, on a pool of `workers` processes when configured, and return the per-job result records."""
+        logging.info("Starting the analytics process for all configured tickers and timeframes.")
+        executor = AnalyticsExecutor(CryptoAnalytics, self.config, workers=self.config.get('workers', 1))
+        return executor.run(self.plan_jobs(), local=self)
 
 
 # Configuration dictionary for analytics
 config_analytics = {
+    "storage": "csv",  # 'csv' for dated CSV snapshots, 'parquet' or 'feather' for the columnar store in data_store/, 'versioned' for data_versions/
+    "catalog": "data/catalog.sqlite",  # Manifest of the stored datasets written by the fetcher, see dataset_catalog.py
+    "incremental": True,  # Persist the rollup state in analytics_state/ and only recompute the buckets that received new bars
+    "analytics_format": "parquet",  # 'parquet' or 'feather' artifacts per granularity, see analytics_artifacts.read_analytics
+    "excel_export": False,  # Also build an .xlsx workbook per dataset (slow), see analytics_artifacts.py for single exports
+    "cache": {"max_entries": 500, "max_bytes": 2 * 1024 ** 3},  # Bounds of the fingerprint cache in analytics_cache/, least recently used results are evicted first
+    "memory_profile": "default",  # 'compact' holds the prices as float32 without the redundant Adj Close column, see memory_profile.py
+    "workers": os.cpu_count(),  # Worker processes running the (ticker, interval) jobs, 1 runs them in this process
+    # Technical indicators saved as the 'indicators' and 'risk' artifacts of every dataset, None to skip them (see indicators.py)
+    "indicators": {
+        "sma": [20, 50, 200],
+        "ema": [12, 26],
+        "rsi": 14,
+        "macd": [12, 26, 9],
+        "bollinger": [20, 2.0],
+        "stochastic": [14, 3],
+        "volume_price_corr": 20,
+    },
     "tickers": ["BTC-USD", "ETH-USD", "ADA-USD", "BNB-USD", "SOL-USD"],
     "combinations": [
         ('max', '1d'), 
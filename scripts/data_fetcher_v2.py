@@ -2,8 +2,13 @@ import os
 import logging
 import pandas as pd
 from datetime import datetime
-import yfinance as yf
 from IPython.display import display, HTML
+from data_windows import plan_downloads, slice_period, period_start
+from price_store import open_store
+from fetch_executor import ConcurrentFetchExecutor, FetchJob, YahooFinanceProvider
+from online_indicators import OnlineIndicatorEngine
+from memory_profile import apply_profile
+from dataset_catalog import DatasetCatalog, CATALOG_PATH
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,25 +19,45 @@ class CryptoDataFetcher:
 
     Attributes:
         config (dict): Configuration dictionary with tickers, periods, and intervals.
+        provider: Data source used for downloads, defaults to the Yahoo Finance API.
+        store (ColumnarPriceStore): Columnar or versioned store used instead of the dated CSV files when `storage` is not 'csv'.
+        catalog (DatasetCatalog): Manifest of the stored datasets, updated on every save and used for all lookups.
 
     Methods:
         fetch_data(ticker, period, interval): Fetches historical data for a given ticker.
-        save_data(df, ticker, period, interval): Saves the fetched data to a CSV file.
+        save_data(df, ticker, period, interval): Saves the fetched data to a CSV file or the columnar store.
+        load_saved(ticker, period, interval, location): Loads saved data back from a CSV file or the columnar store.
         fetch_and_save(ticker, period, interval): Fetches and saves data if not fresh.
         ensure_directory(directory): Ensures the specified directory exists.
         build_filename(ticker, period, interval, date_str): Builds a filename for saving data.
-        is_data_fresh(file_path): Checks if the data in the specified file is fresh.
+        is_data_fresh(ticker, period, interval): Returns the location of the dataset if it was fetched today.
+        find_latest_file(ticker, period, interval): Finds the most recent stored file for a dataset in the catalog.
+        merge_data(existing, new): Merges newly fetched bars into an existing series.
+        load_existing(ticker, interval, periods): Loads the latest stored series of each period.
+        apply_delta(ticker, interval, existing, delta): Merges a delta download into the stored series and saves them.
+        update_online(ticker, interval, load_bars): Folds the new bars of a series into its streaming indicator state.
+        plan_incremental(ticker, interval, periods): Plans a single delta download after the last stored timestamp.
+        save_job(job, data): Saves the result of a download job.
+        execute_jobs(jobs): Runs download jobs serially or on the concurrent fetch executor.
+        derive_windows(ticker, plan, data_frames): Derives the shorter windows of an interval from its widest download.
         run_data_fetcher(): Manages the fetching process based on configuration and data freshness.
     """
-    def __init__(self, config):
+    def __init__(self, config, provider=None):
         self.config = config
+        self.provider = provider or YahooFinanceProvider()
+        self.store = open_store(config)
+        self.catalog = DatasetCatalog(config.get('catalog', CATALOG_PATH))
+        self.pending_deltas = {}
+        self.online_latest = {}
         logging.info(f"Initializing CryptoDataFetcher with config: {config}")
 
-    def fetch_data(self, ticker, period, interval):
-        """Fetch historical data for a given cryptocurrency ticker."""
+    def fetch_data(self, ticker, period, interval, start=None):
+        """Fetch historical data for a given cryptocurrency ticker, optionally only from `start` onwards."""
         logging.info(f"Starting data retrieval for {ticker} for period {period} and interval {interval}.")
         try:
-            data = yf.download(ticker, period=period, interval=interval)
+            if start is not None:
+                logging.info(f"Requesting bars for {ticker} from {start} onwards.")
+            data = self.provider.download(ticker, period=period, interval=interval, start=start, timeout=self.config.get('executor', {}).get('timeout'))
             if data.empty:
                 logging.warning(f"No data retrieved for {ticker}")
             else:
@@ -51,17 +76,32 @@ class CryptoDataFetcher:
         # Remove timezone info
         if df.index.tz is not None:
             df.index = df.index.tz_localize(None)
+        date_str = datetime.now().strftime("%Y%m%d")
+
+        if self.store is not None:
+            # The store keeps one series per (ticker, interval), periods are date-range reads of it
+            # A download with a period is a complete dataset, a versioned store snapshots exactly its bars
+            location = self.store.write(df, ticker, interval, replace=period is not None)
+            # The catalog entry describes the whole stored series, not the delta that was just merged into it
+            self.catalog.record(self.store.read(ticker, interval), ticker, None, interval, date_str, location, storage=self.config.get('storage'))
+            return location
 
         frequency = 'Hourly' if '1h' in interval else 'Daily'
-        date_str = datetime.now().strftime("%Y%m%d")
         directory = os.path.join('data', ticker.replace('-USD', ''), frequency)
         self.ensure_directory(directory)
         filename = self.build_filename(ticker, period, interval, date_str)
         file_path = os.path.join(directory, filename)
         df.to_csv(file_path, index=True)
+        self.catalog.record(df, ticker, period, interval, date_str, file_path)
         logging.info(f"Data saved successfully to {file_path} with filename {os.path.basename(file_path)}.")
         return file_path
 
+    def load_saved(self, ticker, period, interval, location):
+        """Load saved data for a period from the columnar store, or from the CSV file at `location`."""
+        if self.store is not None:
+            return self.store.read(ticker, interval, start=period_start(period))
+        return pd.read_csv(location, index_col='Date', parse_dates=['Date'])
+
     def fetch_and_save(self, ticker, period, interval):
         """Combines fetching and saving into a single operation."""
         data = self.fetch_data(ticker, period, interval)
@@ -78,45 +118,227 @@ class CryptoDataFetcher:
         """Build a consistent filename for data files."""
         return f"{ticker.replace('-USD', '')}_{period}_{interval}_{date_str}.csv"
 
-    def is_data_fresh(self, file_path):
-        """Check if the existing data file is fresh based on the current date."""
-        filename = os.path.basename(file_path)
-        date_str = filename.split('_')[-1].split('.')[0]
-        file_date = datetime.strptime(date_str, "%Y%m%d").date()
-        if file_date == datetime.now().date():
-            logging.info(f"Data file {os.path.basename(file_path)} is fresh.")
-            return True
+    def is_data_fresh(self, ticker, period, interval):
+        """Return the location of the dataset if the catalog has a fetch of today for it, None otherwise."""
+        entry = self.catalog.lookup(ticker, period, interval, datetime.now().strftime("%Y%m%d"))
+        if entry is not None and os.path.exists(entry['location']):
+            logging.info(f"Data file {os.path.basename(entry['location'])} is fresh.")
+            return entry['location']
+        logging.info(f"No fresh data for {ticker}, {period}, {interval}.")
+        return None
+
+    def find_latest_file(self, ticker, period, interval):
+        """Return the most recent stored data file for a ticker, period and interval, or None."""
+        entry = self.catalog.lookup(ticker, period, interval)
+        return entry['location'] if entry is not None and os.path.exists(entry['location']) else None
+
+    def merge_data(self, existing, new):
+        """Append new bars to an existing series, keeping the newest copy of any duplicated timestamp."""
+        if new is None or new.empty:
+            return existing
+        if new.index.tz is not None:
+            new.index = new.index.tz_localize(None)
+        merged = pd.concat([existing, new[existing.columns.intersection(new.columns)]])
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        merged.index.name = 'Date'
+        return merged
+
+    def load_existing(self, ticker, interval, periods):
+        """Load the latest stored series of every period of a (ticker, interval), skipping periods without data."""
+        existing = {}
+        for period in periods:
+            latest_file = self.find_latest_file(ticker, period, interval)
+            if latest_file is None:
+                logging.info(f"No stored data for {ticker}, {period}, {interval}, a full download is required.")
+                continue
+            df = pd.read_csv(latest_file, index_col='Date', parse_dates=['Date'])
+            if not df.empty:
+                existing[period] = df
+        return existing
+
+    def apply_delta(self, ticker, interval, existing, delta):
+        """
+        Merge a delta download into each stored period of a (ticker, interval) and save the updated series.
+
+        `existing` maps each period to its stored series; with the columnar store it only lists the periods,
+        since the delta is written once into the shared series and the periods are read back from it.
+        """
+        logging.info(f"Merging {len(delta)} new or updated bars for {ticker}, {interval} into periods {list(existing)}.")
+        data_frames = {}
+        if self.store is not None:
+            self.save_data(delta, ticker, None, interval)
+            for period in existing:
+                data_frames[(ticker, period, interval)] = self.load_saved(ticker, period, interval, None)
+            self.update_online(ticker, interval, lambda start=None: self.store.read(ticker, interval, start=start))
+            return data_frames
+        for period, df in existing.items():
+            merged = slice_period(self.merge_data(df, delta), period)
+            self.save_data(merged, ticker, period, interval)
+            data_frames[(ticker, period, interval)] = merged
+        # The longest stored window holds every bar the other windows have
+        longest = max(data_frames.values(), key=len)
+        self.update_online(ticker, interval, lambda start=None: longest.loc[start:])
+        return data_frames
+
+    def update_online(self, ticker, interval, load_bars):
+        """
+        Fold the new bars of a (ticker, interval) into its persisted streaming indicator state, if `online_indicators` is set.
+
+        Only the bars from the last pushed one (which may have been revised) onwards are read with
+        `load_bars(start)`, so the cost of a refresh does not grow with the history; a missing state is built
+        from all stored bars once. Returns the indicator values at the last bar.
+        """
+        parameters = self.config.get('online_indicators')
+        if not parameters:
+            return None
+        path = os.path.join(self.config.get('state_dir', 'analytics_state'), ticker.replace('-USD', ''), f"{interval}_online.pkl")
+        engine = OnlineIndicatorEngine(None if parameters is True else parameters, path)
+        bars = load_bars(engine.timestamp)
+        pushed = engine.push_frame(bars)
+        if pushed.empty:
+            return engine.latest
+        engine.save()
+        self.online_latest[(ticker, interval)] = engine.latest
+        logging.info(f"Streaming indicators of {ticker}, {interval} updated with {len(pushed)} bars up to {engine.timestamp}.")
+        return engine.latest
+
+    def plan_incremental(self, ticker, interval, periods):
+        """
+        Plan the downloads that refresh every period stored for a (ticker, interval).
+
+        The last stored timestamp of each period is looked up and a single delta job starting at the oldest
+        of them is planned; its bars are merged into each stored series by apply_delta. The last stored bar
+        is fetched again so that a bar which was still open at the previous run gets its final values.
+        Periods without any stored file fall back to a full download job.
+        """
+        if self.store is not None:
+            start = self.store.last_timestamp(ticker, interval)
+            if start is None:
+                return [FetchJob(ticker, period, interval) for period in periods]
+            self.pending_deltas[(ticker, interval)] = list(periods)
+            return [FetchJob(ticker, None, interval, start)]
+
+        existing = self.load_existing(ticker, interval, periods)
+        jobs = [FetchJob(ticker, period, interval) for period in periods if period not in existing]
+        if existing:
+            start = min(df.index.max() for df in existing.values())
+            jobs.append(FetchJob(ticker, None, interval, start))
+            self.pending_deltas[(ticker, interval)] = existing
+        return jobs
+
+    def save_job(self, job, data):
+        """Save the result of a download job and return the resulting data frames keyed by (ticker, period, interval)."""
+        if job.start is not None:
+            existing = self.pending_deltas.pop((job.ticker, job.interval))
+            if data is None or data.empty:
+                # A failed delta download must not be saved as today's dataset, the next run retries it
+                logging.warning(f"No delta retrieved for {job.ticker}, {job.interval}, the stored series are left unchanged.")
+                return {(job.ticker, period, job.interval): None for period in existing}
+            return self.apply_delta(job.ticker, job.interval, existing, data)
+        if data is None or data.empty:
+            logging.warning(f"No data retrieved for {job.ticker}, {job.period}, {job.interval}")
+            return {(job.ticker, job.period, job.interval): None}
+        location = self.save_data(data, job.ticker, job.period, job.interval)
+        return {(job.ticker, job.period, job.interval): self.load_saved(job.ticker, job.period, job.interval, location)}
+
+    def execute_jobs(self, jobs):
+        """Run download jobs serially, or on the concurrent fetch executor when more than one worker is configured."""
+        data_frames = {}
+        workers = self.config.get('workers', 1)
+        if workers > 1:
+            executor = ConcurrentFetchExecutor(self.provider, workers=workers, **self.config.get('executor', {}))
+            for frames in executor.run(jobs, self.save_job).values():
+                data_frames.update(frames or {})
+            # Delta jobs that failed for good never reached save_job
+            for (ticker, interval), existing in self.pending_deltas.items():
+                logging.warning(f"Delta download of {ticker}, {interval} failed, the stored series are left unchanged.")
+                data_frames.update({(ticker, period, interval): None for period in existing})
+            self.pending_deltas.clear()
         else:
-            logging.info(f"Data file {os.path.basename(file_path)} is not fresh.")
-            return False
+            for job in jobs:
+                data_frames.update(self.save_job(job, self.fetch_data(job.ticker, job.period, job.interval, start=job.start)))
+        return data_frames
+
+    def derive_windows(self, ticker, plan, data_frames):
+        """
+        Slice every configured window of an interval out of its widest download.
+
+        With `virtual_windows` enabled only the superset file is kept on disk and the shorter windows are
+        resolved from it on load, otherwise the slices are saved as regular dated files.
+        """
+        derived = {}
+        virtual = self.config.get('virtual_windows', False) or self.store is not None
+        for interval, (widest, periods) in plan.items():
+            superset = data_frames.get((ticker, widest, interval))
+            for period in periods:
+                if period == widest:
+                    continue
+                data = slice_period(superset, period)
+                if data is not None and not virtual:
+                    if self.catalog.lookup(ticker, period, interval, datetime.now().strftime("%Y%m%d")) is None:
+                        self.save_data(data, ticker, period, interval)
+                derived[(ticker, period, interval)] = data
+                logging.info(f"Derived {period} window for {ticker} and interval {interval} from the {widest} download.")
+        return derived
 
     def run_data_fetcher(self):
         """Updated method to check freshness of data before fetching."""
         logging.info("Starting the data fetching process...")
         data_frames = {}
+        jobs = []
+        incremental = self.config.get('mode', 'full') == 'incremental'
+        combinations = self.config['combinations']
+        plan = None
+        if self.config.get('derive_windows', False):
+            # Only download the widest window of every interval, the others are slices of it
+            plan = plan_downloads(combinations)
+            combinations = [(widest, interval) for interval, (widest, _) in plan.items()]
+            logging.info(f"Download plan: {combinations} for {len(self.config['combinations'])} configured windows.")
         for ticker in self.config['tickers']:
-            for period, interval in self.config['combinations']:
-                filename = self.build_filename(ticker, period, interval, datetime.now().strftime("%Y%m%d"))
-                frequency = 'Hourly' if '1h' in interval else 'Daily'
-                directory = os.path.join('data', ticker.replace('-USD', ''), frequency)
-                file_path = os.path.join(directory, filename)
-                self.ensure_directory(directory)
-
-                if os.path.exists(file_path) and self.is_data_fresh(file_path):
+            stale_periods = {}
+            for period, interval in combinations:
+                file_path = None if self.store is not None else self.is_data_fresh(ticker, period, interval)
+                if self.store is not None and self.store.is_fresh(ticker, interval):
+                    logging.info(f"Loading data from the columnar store for {ticker}, {period}, {interval}")
+                    data_frames[(ticker, period, interval)] = self.load_saved(ticker, period, interval, None)
+                elif file_path is not None:
                     logging.info(f"Loading data from existing file: {file_path}")
-                    data = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+                    data_frames[(ticker, period, interval)] = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+                elif incremental:
+                    # Defer to a single delta download per (ticker, interval) below
+                    stale_periods.setdefault(interval, []).append(period)
                 else:
                     logging.info(f"Fetching new data because the file is missing or not fresh. Fetching new data for {ticker}")
-                    data = self.fetch_and_save(ticker, period, interval)
-                    if data is not None:
-                        data = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+                    jobs.append(FetchJob(ticker, period, interval))
+
+            for interval, periods in stale_periods.items():
+                logging.info(f"Incrementally updating {ticker} for interval {interval} and periods {periods}.")
+                jobs.extend(self.plan_incremental(ticker, interval, periods))
+
+        logging.info(f"Running {len(jobs)} download jobs.")
+        data_frames.update(self.execute_jobs(jobs))
 
-                data_frames[(ticker, period, interval)] = data
-                logging.info(f"Data fetching process completed for {ticker} for period {period} and interval {interval}.")
+        if plan is not None:
+            for ticker in self.config['tickers']:
+                data_frames.update(self.derive_windows(ticker, plan, data_frames))
+        # Only the returned frames are compacted, the stored series keep their full precision
+        profile = self.config.get('memory_profile', 'default')
+        for (ticker, period, interval), df in data_frames.items():
+            data_frames[(ticker, period, interval)] = apply_profile(df, profile, f"{ticker} {period} {interval}")
+            logging.info(f"Data fetching process completed for {ticker} for period {period} and interval {interval}.")
         return data_frames
 
 # Configuration dictionary
 config_fetcher = {
+  "mode": "incremental",  # 'full' re-downloads every window, 'incremental' only fetches bars after the last stored one
+  "derive_windows": True,  # Download only the widest window per interval and slice the others from it
+  "virtual_windows": True,  # Keep only the superset files on disk, the analytics resolve the shorter windows on load
+  "online_indicators": True,  # Update the streaming indicators (analytics_state/<TICKER>/<interval>_online.pkl) on incremental runs, True for the defaults of indicators.py or a parameter dict
+  "memory_profile": "default",  # 'compact' returns float32 prices without the redundant Adj Close column, see memory_profile.py
+  "workers": 4,  # Concurrent downloads, 1 runs the jobs one after the other
+  "storage": "csv",  # 'csv' for dated CSV snapshots, 'parquet' or 'feather' for the columnar store in data_store/, 'versioned' for data_versions/
+  "catalog": "data/catalog.sqlite",  # Manifest of the stored datasets, see dataset_catalog.py
+  "executor": {"rate": 2.0, "burst": 4, "retries": 3, "backoff": 1.0, "timeout": 60.0, "queue_size": 8},
   "tickers": ["BTC-USD", "ETH-USD", "ADA-USD", "BNB-USD", "SOL-USD"],
   "combinations": [
     ('max', '1d'), 
@@ -1,80 +1,129 @@
 import os
+import logging
+import threading
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 from plotly.subplots import make_subplots
 import plotly.graph_objs as go
+import numpy as np
 import pandas as pd
-from glob import glob
+from datetime import datetime
+from data_windows import slice_period, period_start
+from price_store import open_store
+from dataset_catalog import DatasetCatalog, CATALOG_PATH
+from data_fetcher_v2 import config_fetcher
+from figure_cache import SeriesCache, POINT_BUDGET, visible_slice, downsample_line, bucket_ohlc, bucket_sum
+from indicators import sma, macd, rsi, bollinger, fibonacci_levels
+from online_indicators import OnlineIndicatorEngine
 
-# Get unique identifiers for dropdown options
+# The dashboard reads the storage layer the fetcher writes, selected by the same `storage` setting
+store = open_store(config_fetcher)
+_catalog = None
+_catalog_lock = threading.Lock()
+
+# The dataset catalog, opened on first use: a missing catalog is rebuilt from the CSV tree, which is not done at import
+def get_catalog():
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = DatasetCatalog(config_fetcher.get('catalog', CATALOG_PATH))
+        return _catalog
+
+# Load price data through the columnar store, falling back to the dated CSV snapshots
+def load_prices(ticker, period, interval, date=None, columns=None):
+    if store is not None and store.last_timestamp(ticker, interval) is not None:
+        end = datetime.strptime(date, '%Y%m%d') if date else None
+        start = period_start(period, end)
+        # Include every bar of the snapshot date
+        last = end + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if end else None
+        return store.read(ticker, interval, start=start, end=last, columns=columns)
+    date = date or datetime.now().strftime('%Y%m%d')
+    entry = get_catalog().covering(ticker, period, interval, date)
+    if entry is None or not os.path.exists(entry['location']):
+        return None
+    df = pd.read_csv(entry['location'], parse_dates=['Date'], index_col='Date', usecols=['Date'] + columns if columns else None)
+    return slice_period(df, period, end=datetime.strptime(date, '%Y%m%d'))
+
+# Load the bars of a dataset from `after` (inclusive, the last cached bar may have been revised) if newer ones were written, else None.
+# Like load_prices, a selected `date` bounds the bars to that fetch date, a past date never receives live bars.
+def load_new_bars(ticker, period, interval, date, after):
+    last = store.last_timestamp(ticker, interval) if store is not None else None
+    if last is not None:
+        end = datetime.strptime(date, '%Y%m%d') + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if date else None
+        # The store metadata tells whether there is anything new, only the partitions from `after` on are read
+        return store.read(ticker, interval, start=after, end=end) if last > after and (end is None or after < end) else None
+    catalog = get_catalog()
+    fetch_date = date or catalog.latest_fetch(ticker, interval)
+    entry = catalog.covering(ticker, period, interval, fetch_date) if fetch_date else None
+    if entry is None or entry['max_timestamp'] is None or pd.Timestamp(entry['max_timestamp']) <= after or not os.path.exists(entry['location']):
+        return None
+    df = pd.read_csv(entry['location'], parse_dates=['Date'], index_col='Date')
+    return df.loc[df.index >= after]
+
+# Dropdown options from the dataset catalog, a single indexed query instead of a scan of the data tree
 def get_dropdown_options():
-    files = glob('data/*/*-USD_*_*.csv')
-    tickers = set()
-    periods = set()
-    intervals = set()
-    dates = set()
-
-    for file in files:
-        path_parts = file.split(os.sep)
-        ticker = path_parts[1]
-        filename = path_parts[-1].split('_')
-        period, interval, date = filename[1], filename[2], filename[3].split('.')[0]
-
-        tickers.add(ticker)
-        periods.add(period)
-        intervals.add(interval)
-        dates.add(date)
-    
-    return {
-        'tickers': [{'label': ticker, 'value': ticker} for ticker in sorted(tickers)],
-        'periods': [{'label': period, 'value': period} for period in sorted(periods)],
-        'intervals': [{'label': interval, 'value': interval} for interval in sorted(intervals)],
-        'dates': [{'label': date, 'value': date} for date in sorted(dates, reverse=True)]
-    }
-
-# Initialize Dash app
-app = dash.Dash(__name__)
+    options = get_catalog().options()
+    return {name: [{'label': value, 'value': value} for value in values] for name, values in options.items()}
+
+# Price frames of the recently viewed datasets and their indicators, shared by all graph callbacks
+series_cache = SeriesCache(lambda ticker, period, interval, date: load_prices(ticker, period, interval, date))
+
+# Seconds between two polls of the storage layer in live mode
+LIVE_POLL_SECONDS = 30
+
+# Initialize Dash app, the graphs are created by the tab callback so their callbacks are registered beforehand
+app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server  # Expose server for deployments
 
-# Populate dropdown options
-dropdown_options = get_dropdown_options()
-
-# Set up the Dash app layout with tabs and subplots
-app.layout = html.Div([
-    html.H1('Cryptocurrency Data Visualization', style={'textAlign': 'center'}),
-    html.Div([
-        dcc.Dropdown(
-            id='ticker-dropdown',
-            options=dropdown_options['tickers'],
-            value='BTC',  # Default value
-            style={'width': '24%', 'display': 'inline-block'}
-        ),
-        dcc.Dropdown(
-            id='period-dropdown',
-            options=dropdown_options['periods'],
-            value='1y',  # Default value
-            style={'width': '24%', 'display': 'inline-block'}
-        ),
-        dcc.Dropdown(
-            id='interval-dropdown',
-            options=dropdown_options['intervals'],
-            value='1d',  # Default value
-            style={'width': '24%', 'display': 'inline-block'}
-        ),
-        dcc.Dropdown(
-            id='date-dropdown',
-            options=dropdown_options['dates'],
-            value=dropdown_options['dates'][0]['value'],  # Default to most recent date
-            style={'width': '24%', 'display': 'inline-block'}
-        ),
-    ], style={'padding': '10px', 'background': '#CCCCCC'}),
-    dcc.Tabs(id="tabs", value='tab-1', children=[
-        dcc.Tab(label='Tab One', value='tab-1'),
-        dcc.Tab(label='Tab Two', value='tab-2'),
-    ]),
-    html.Div(id='tabs-content')
-])
+# Set up the Dash app layout with tabs and subplots, built on every page load so the dropdowns list the current datasets
+def serve_layout():
+    dropdown_options = get_dropdown_options()
+    return html.Div([
+        html.H1('Cryptocurrency Data Visualization', style={'textAlign': 'center'}),
+        html.Div([
+            dcc.Dropdown(
+                id='ticker-dropdown',
+                options=dropdown_options['tickers'],
+                value='BTC',  # Default value
+                style={'width': '24%', 'display': 'inline-block'}
+            ),
+            dcc.Dropdown(
+                id='period-dropdown',
+                options=dropdown_options['periods'],
+                value='1y',  # Default value
+                style={'width': '24%', 'display': 'inline-block'}
+            ),
+            dcc.Dropdown(
+                id='interval-dropdown',
+                options=dropdown_options['intervals'],
+                value='1d',  # Default value
+                style={'width': '24%', 'display': 'inline-block'}
+            ),
+            dcc.Dropdown(
+                id='date-dropdown',
+                options=dropdown_options['dates'],
+                value=dropdown_options['dates'][0]['value'] if dropdown_options['dates'] else None,  # Default to most recent date
+                style={'width': '24%', 'display': 'inline-block'}
+            ),
+            dcc.Checklist(
+                id='live-toggle',
+                options=[{'label': ' Live', 'value': 'live'}],
+                value=[],  # Static by default
+                style={'display': 'inline-block', 'padding-left': '10px'}
+            ),
+        ], style={'padding': '10px', 'background': '#CCCCCC'}),
+        dcc.Interval(id='live-interval', interval=LIVE_POLL_SECONDS * 1000, disabled=True),
+        # Dataset and last bar shown by the graphs of this browser tab, advanced by the live polls
+        dcc.Store(id='live-cursor'),
+        dcc.Tabs(id="tabs", value='tab-1', children=[
+            dcc.Tab(label='Tab One', value='tab-1'),
+            dcc.Tab(label='Tab Two', value='tab-2'),
+        ]),
+        html.Div(id='tabs-content')
+    ])
+
+app.layout = serve_layout
 
 # Callback to update each graph based on dropdown selection
 @app.callback(Output('tabs-content', 'children'),
@@ -94,11 +143,231 @@ def render_content(tab):
             dcc.Graph(id='bollinger-chart'),
         ], style={'display': 'grid', 'grid-template-columns': '1fr 1fr', 'gap': '10px'})
 
-# Define callbacks for updating graphs based on user input...
-# (You will need to implement these based on the financial calculations for each indicator)
+DATASET_INPUTS = [Input('ticker-dropdown', 'value'), Input('period-dropdown', 'value'),
+                  Input('interval-dropdown', 'value'), Input('date-dropdown', 'value')]
 
+INDICATORS = {
+    'sma_50': lambda df: sma(df['Close'].to_numpy(dtype=float), 50),
+    'sma_200': lambda df: sma(df['Close'].to_numpy(dtype=float), 200),
+    'macd': lambda df: macd(df['Close'].to_numpy(dtype=float)),
+    'rsi': lambda df: rsi(df['Close'].to_numpy(dtype=float)),
+    'bollinger': lambda df: bollinger(df['Close'].to_numpy(dtype=float)),
+}
+
+# Indicators of the graphs maintained bar by bar in live mode, and the engine values making up each memoized column
+LIVE_INDICATORS = {'sma': [50, 200], 'rsi': 14, 'macd': [12, 26, 9], 'bollinger': [20, 2.0]}
+LIVE_COLUMNS = {
+    'sma_50': 'sma_50',
+    'sma_200': 'sma_200',
+    'macd': ('macd', 'macd_signal', 'macd_histogram'),
+    'rsi': 'rsi',
+    'bollinger': ('bollinger_middle', 'bollinger_upper', 'bollinger_lower'),
+}
+
+# Streaming indicator state of the datasets viewed live, seeded once from their cached frame
+live_engines = {}
+
+# Merge the bars written since the last cached one into the series cache, with their indicator values. Returns the number of merged bars.
+def merge_new_bars(key):
+    df = series_cache.prices(key)
+    if df is None or df.empty:
+        return 0
+    bars = load_new_bars(key[0], key[1], key[2], key[3], df.index[-1])
+    if bars is None or bars.empty or bars.index[-1] <= df.index[-1]:
+        return 0
+    bars = bars.sort_index().reindex(columns=df.columns)
+    for stale in [cached for cached in live_engines if cached not in series_cache.entries]:
+        del live_engines[stale]
+    if key not in live_engines:
+        live_engines[key] = OnlineIndicatorEngine(LIVE_INDICATORS)
+        live_engines[key].push_frame(df)
+    # The first bar revises the last cached one, the engine folds it in again instead of counting it twice
+    values = live_engines[key].push_frame(bars)
+    columns = {name: values[fields].to_numpy(dtype=float) if isinstance(fields, str) else tuple(values[field].to_numpy(dtype=float) for field in fields)
+               for name, fields in LIVE_COLUMNS.items()}
+    series_cache.append(key, bars, columns)
+    return len(bars)
+
+@app.callback(Output('live-interval', 'disabled'), [Input('live-toggle', 'value')])
+def toggle_live(value):
+    return 'live' not in (value or [])
+
+# Advance the cursor of a browser tab to the last cached bar, after merging the bars written since the previous poll
+@app.callback(Output('live-cursor', 'data'), [Input('live-interval', 'n_intervals')] + DATASET_INPUTS, [State('live-cursor', 'data')])
+def poll_live(n_intervals, ticker, period, interval, date, cursor):
+    key = (ticker, period, interval, date)
+    df = series_cache.prices(key)
+    if df is None or df.empty:
+        return None
+    if dash.callback_context.triggered_id != 'live-interval' or not cursor or tuple(cursor['key']) != key:
+        # The graphs of a new dataset are drawn with every cached bar, nothing to extend them with
+        return {'key': list(key), 'since': None, 'last': str(df.index[-1])}
+    merged = merge_new_bars(key)
+    last = str(series_cache.prices(key).index[-1])
+    if last == cursor['last']:
+        return dash.no_update
+    logging.info(f"Live update of {key}: {merged} bars merged, extending the graphs from {cursor['last']} to {last}")
+    return {'key': list(key), 'since': cursor['last'], 'last': last}
+
+# Prepare the visible bars of a graph: the cached price frame and the slice in view of its relayoutData
+def visible(key, relayout):
+    df = series_cache.prices(key)
+    if df is None or df.empty:
+        return None, None
+    return df, visible_slice(df.index, relayout)
+
+def empty_figure(title):
+    return go.Figure(layout={'title': f"{title}: no data"})
+
+def line(df, view, values, name, **style):
+    x, y = downsample_line(df.index[view], values[view], POINT_BUDGET)
+    return go.Scattergl(x=x, y=y, mode='lines', name=name, **style)
+
+# Horizontal reference lines across the whole graph, as layout shapes (much faster to build than add_hline)
+def level_lines(figure, levels, dash, labels=None):
+    figure.update_layout(
+        shapes=[{'type': 'line', 'xref': 'paper', 'x0': 0, 'x1': 1, 'y0': level, 'y1': level, 'line': {'dash': dash, 'color': 'grey', 'width': 1}} for level in levels],
+        annotations=[{'xref': 'paper', 'x': 1, 'y': level, 'text': label, 'showarrow': False, 'xanchor': 'right', 'yanchor': 'bottom'}
+                     for level, label in zip(levels, labels or [])],
+    )
+    return figure
+
+def finish_figure(figure, title, key):
+    # A constant uirevision per dataset keeps the user's zoom while the graph is redrawn with more detail
+    figure.update_layout(title=title, uirevision=str(key), margin={'l': 40, 'r': 10, 't': 40, 'b': 30})
+    return figure
+
+# Figure builders by graph id, the live tail of a graph redraws it with its builder when its view is downsampled
+BUILDERS = {}
+
+# Register a graph builder, redrawn on dataset changes and, for the visible range, on zoom
+def graph_callback(graph_id):
+    def register(build):
+        BUILDERS[graph_id] = build
+        @app.callback(Output(graph_id, 'figure'), DATASET_INPUTS + [Input(graph_id, 'relayoutData')])
+        def update(ticker, period, interval, date, relayout):
+            key = (ticker, period, interval, date)
+            if dash.callback_context.triggered_id != graph_id:
+                # A new dataset resets the zoom (its uirevision changes), the previous range does not apply to it
+                relayout = None
+            df, view = visible(key, relayout)
+            if df is None:
+                return empty_figure(graph_id)
+            return finish_figure(build(key, df, view), f"{ticker} {period} {interval}", key)
+        return build
+    return register
+
+# Register the live tail of a graph: tail(key, df, new) returns the extendData update of the bars at positions `new`
+# and the indices of the traces it extends, in the order of the traces of the graph builder. A view holding more
+# bars than the point budget is drawn downsampled or bucketed, raw bars appended to it would mix resolutions on a
+# trace, so such a graph is redrawn from the updated cache instead.
+def live_callback(graph_id):
+    def register(tail):
+        @app.callback([Output(graph_id, 'extendData'), Output(graph_id, 'figure', allow_duplicate=True)],
+                      [Input('live-cursor', 'data')], [State(graph_id, 'relayoutData')], prevent_initial_call=True)
+        def extend(cursor, relayout):
+            if not cursor or cursor['since'] is None:
+                return dash.no_update, dash.no_update
+            key = tuple(cursor['key'])
+            df, view = visible(key, relayout)
+            if df is None:
+                return dash.no_update, dash.no_update
+            new = slice(df.index.searchsorted(pd.Timestamp(cursor['since']), side='right'),
+                        df.index.searchsorted(pd.Timestamp(cursor['last']), side='right'))
+            if new.start >= new.stop:
+                return dash.no_update, dash.no_update
+            if view.stop - view.start > POINT_BUDGET:
+                return dash.no_update, finish_figure(BUILDERS[graph_id](key, df, view), f"{key[0]} {key[1]} {key[2]}", key)
+            return tail(key, df, new), dash.no_update
+        return tail
+    return register
+
+# Plain lists for extendData, which is applied as is by Plotly.extendTraces
+def tail_x(df, new):
+    return [str(timestamp) for timestamp in df.index[new]]
+
+def tail_y(values, new):
+    return [None if value != value else value for value in np.asarray(values, dtype=float)[new].tolist()]
+
+@graph_callback('candlestick-chart')
+def candlestick_figure(key, df, view):
+    candles = bucket_ohlc(df.iloc[view], POINT_BUDGET)
+    return go.Figure(go.Candlestick(x=candles.index, open=candles['Open'], high=candles['High'], low=candles['Low'], close=candles['Close'], name='OHLC'))
+
+@live_callback('candlestick-chart')
+def candlestick_tail(key, df, new):
+    return {'x': [tail_x(df, new)], **{column.lower(): [tail_y(df[column], new)] for column in ('Open', 'High', 'Low', 'Close')}}, [0]
+
+@graph_callback('trend-chart')
+def trend_figure(key, df, view):
+    close = df['Close'].to_numpy(dtype=float)
+    return go.Figure([
+        line(df, view, close, 'Close'),
+        line(df, view, series_cache.column(key, 'sma_50', INDICATORS['sma_50']), 'SMA 50'),
+        line(df, view, series_cache.column(key, 'sma_200', INDICATORS['sma_200']), 'SMA 200'),
+    ])
+
+@live_callback('trend-chart')
+def trend_tail(key, df, new):
+    columns = [df['Close'], series_cache.column(key, 'sma_50', INDICATORS['sma_50']), series_cache.column(key, 'sma_200', INDICATORS['sma_200'])]
+    return {'x': [tail_x(df, new)] * 3, 'y': [tail_y(values, new) for values in columns]}, [0, 1, 2]
+
+@graph_callback('volume-chart')
+def volume_figure(key, df, view):
+    x, y = bucket_sum(df.index[view], df['Volume'].to_numpy()[view], POINT_BUDGET)
+    return go.Figure(go.Bar(x=x, y=y, name='Volume'))
+
+@live_callback('volume-chart')
+def volume_tail(key, df, new):
+    return {'x': [tail_x(df, new)], 'y': [tail_y(df['Volume'], new)]}, [0]
+
+@graph_callback('macd-chart')
+def macd_figure(key, df, view):
+    macd_line, signal_line, histogram = series_cache.column(key, 'macd', INDICATORS['macd'])
+    x, y = downsample_line(df.index[view], histogram[view], POINT_BUDGET)
+    return go.Figure([line(df, view, macd_line, 'MACD'), line(df, view, signal_line, 'Signal'), go.Bar(x=x, y=y, name='Histogram')])
+
+@live_callback('macd-chart')
+def macd_tail(key, df, new):
+    columns = series_cache.column(key, 'macd', INDICATORS['macd'])
+    return {'x': [tail_x(df, new)] * 3, 'y': [tail_y(values, new) for values in columns]}, [0, 1, 2]
+
+@graph_callback('rsi-chart')
+def rsi_figure(key, df, view):
+    return level_lines(go.Figure(line(df, view, series_cache.column(key, 'rsi', INDICATORS['rsi']), 'RSI')), [30, 70], 'dash')
+
+@live_callback('rsi-chart')
+def rsi_tail(key, df, new):
+    return {'x': [tail_x(df, new)], 'y': [tail_y(series_cache.column(key, 'rsi', INDICATORS['rsi']), new)]}, [0]
+
+@graph_callback('bollinger-chart')
+def bollinger_figure(key, df, view):
+    middle, upper, lower = series_cache.column(key, 'bollinger', INDICATORS['bollinger'])
+    return go.Figure([
+        line(df, view, upper, 'Upper band', line={'width': 1}),
+        line(df, view, lower, 'Lower band', line={'width': 1}, fill='tonexty'),
+        line(df, view, middle, 'Middle band'),
+        line(df, view, df['Close'].to_numpy(dtype=float), 'Close'),
+    ])
+
+@live_callback('bollinger-chart')
+def bollinger_tail(key, df, new):
+    middle, upper, lower = series_cache.column(key, 'bollinger', INDICATORS['bollinger'])
+    return {'x': [tail_x(df, new)] * 4, 'y': [tail_y(values, new) for values in (upper, lower, middle, df['Close'])]}, [0, 1, 2, 3]
+
+@graph_callback('fibonacci-chart')
+def fibonacci_figure(key, df, view):
+    # Retracement levels of the visible range, recomputed on zoom
+    visible_bars = df.iloc[view]
+    levels = fibonacci_levels(visible_bars['High'].to_numpy(dtype=float), visible_bars['Low'].to_numpy(dtype=float))
+    figure = go.Figure(line(df, view, df['Close'].to_numpy(dtype=float), 'Close'))
+    return level_lines(figure, list(levels.values()), 'dot', [name.replace('fib_', '') for name in levels])
+
+@live_callback('fibonacci-chart')
+def fibonacci_tail(key, df, new):
+    # The retracement levels stay those of the drawn range until the graph is redrawn
+    return {'x': [tail_x(df, new)], 'y': [tail_y(df['Close'], new)]}, [0]
+
+# Run the app, without the debug reloader, which restarts the server (and empties the series cache) on every file change
 if __name__ == '__main__':
-    app.run_server(debug=True)
-# Run the app
-if __name__ == '__main__':
-    app.run_server(debug=True)
\ No newline at end of file
+    app.run(debug=False)
@@ -0,0 +1,62 @@
+"""
+Helpers for the nested Yahoo Finance history windows ('max', '10y', '5y', '1y', '6mo', '3mo', ...).
+
+Every shorter window of an interval is a slice of the widest one, so the fetcher only needs to download
+the widest window per (ticker, interval) and can derive the others, either as saved slices or as virtual
+datasets that the analytics resolve from the superset file on load (see DatasetCatalog.covering).
+"""
+import pandas as pd
+
+
+def period_offset(period):
+    """Return the pd.DateOffset covered by a period string, or None for the open-ended 'max' and 'ytd'."""
+    if period in ('max', 'ytd'):
+        return None
+    if period.endswith('mo'):
+        return pd.DateOffset(months=int(period[:-2]))
+    if period.endswith('wk'):
+        return pd.DateOffset(weeks=int(period[:-2]))
+    if period.endswith('y'):
+        return pd.DateOffset(years=int(period[:-1]))
+    if period.endswith('d'):
+        return pd.DateOffset(days=int(period[:-1]))
+    raise ValueError(f"Unknown period: {period}")
+
+
+def period_start(period, end=None):
+    """Return the first timestamp included in a period window ending at `end` (defaults to today)."""
+    end = pd.Timestamp.now() if end is None else pd.Timestamp(end)
+    if period == 'ytd':
+        return end.normalize().replace(month=1, day=1)
+    offset = period_offset(period)
+    if offset is None:
+        return None
+    return end.normalize() - offset
+
+
+def period_rank(period):
+    """Sort key that orders periods from the shortest to the widest window."""
+    reference = pd.Timestamp('2000-12-31')
+    start = period_start(period, end=reference)
+    return float('inf') if start is None else (reference - start).days
+
+
+def slice_period(df, period, end=None):
+    """Slice a superset series down to a period window ending at `end` (defaults to today)."""
+    if df is None:
+        return None
+    start = period_start(period, end)
+    return df if start is None else df[df.index >= start]
+
+
+def plan_downloads(combinations):
+    """
+    Group (period, interval) combinations by interval and pick the widest period of each group.
+
+    Returns a dict {interval: (widest_period, [periods])} where the periods keep their configured order.
+    """
+    plan = {}
+    for period, interval in combinations:
+        plan.setdefault(interval, []).append(period)
+    return {interval: (max(periods, key=period_rank), periods) for interval, periods in plan.items()}
+
@@ -0,0 +1,226 @@
+"""
+Persistent catalog of the stored price datasets.
+
+Every dataset written by the fetcher is recorded in a SQLite manifest, `data/catalog.sqlite`, with its ticker,
+interval, period, fetch date, storage ('csv' or the columnar store), location, row count, first and last
+timestamp and a checksum of its content. Writers upsert a row in a transaction, so readers never see a
+half-recorded dataset, and several fetcher threads or processes can share the file: it is in WAL mode, so reads
+never wait for a writer, and a writer waits up to BUSY_TIMEOUT seconds for another one to commit. Readers look
+datasets up on the primary key instead of building filenames and scanning directories:
+
+    lookup(ticker, period, interval, fetch_date)    one dataset, the latest fetch by default
+    covering(ticker, period, interval, fetch_date)  the dataset of the period or of the narrowest wider window
+    latest_fetch(ticker, interval)                  the most recent fetch date of the snapshots of a series
+    fingerprint(ticker, interval)                   a hash of every dataset of a series, the input of its analytics
+    options()                                       the tickers, periods, intervals and fetch dates on record
+
+A catalog that does not exist yet is built once from the existing `data/<TICKER>/<Daily|Hourly>/*.csv` tree.
+Run this module with `rebuild` to re-index the tree after files were added or removed by hand:
+
+    python scripts/dataset_catalog.py rebuild
+"""
+import os
+import sys
+import sqlite3
+import hashlib
+import logging
+import pandas as pd
+from glob import glob
+from contextlib import closing
+from data_windows import period_rank
+
+CATALOG_PATH = os.path.join('data', 'catalog.sqlite')
+
+# Seconds a writer waits for the lock held by another writer, the pipeline runs the fetch tasks in parallel processes
+BUSY_TIMEOUT = 120
+
+# Period of the datasets of the columnar stores, which hold one series per (ticker, interval)
+SERIES = '*'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    ticker TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    period TEXT NOT NULL,
+    fetch_date TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    location TEXT NOT NULL,
+    rows INTEGER,
+    min_timestamp TEXT,
+    max_timestamp TEXT,
+    checksum TEXT,
+    recorded_at TEXT,
+    PRIMARY KEY (ticker, interval, period, fetch_date)
+);
+CREATE INDEX IF NOT EXISTS idx_datasets_fetch_date ON datasets (fetch_date);
+"""
+
+COLUMNS = ['ticker', 'interval', 'period', 'fetch_date', 'storage', 'location', 'rows', 'min_timestamp', 'max_timestamp', 'checksum', 'recorded_at']
+
+
+def symbol(ticker):
+    """Catalog tickers are the symbols of the file tree, 'BTC' for 'BTC-USD'."""
+    return ticker.replace('-USD', '')
+
+
+def frame_checksum(df):
+    """Content hash of a frame (index, columns and values)."""
+    digest = hashlib.sha256(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class DatasetCatalog:
+    """
+    SQLite manifest of the stored datasets, keyed on (ticker, interval, period, fetch date).
+
+    Attributes:
+        path (str): SQLite file of the catalog.
+
+    Methods:
+        record(df, ticker, period, interval, fetch_date, location, storage): Upserts the entry of a written dataset.
+        lookup(ticker, period, interval, fetch_date): Returns one entry, the latest fetch by default.
+        covering(ticker, period, interval, fetch_date): Returns the entry a period can be read or sliced from.
+        latest_fetch(ticker, interval): Returns the most recent fetch date of the dated snapshots of a series.
+        fingerprint(ticker, interval): Returns a hash of the datasets on record for a (ticker, interval).
+        entries(ticker, interval, fetch_date): Lists entries, optionally filtered.
+        options(): Returns the distinct tickers, periods, intervals and fetch dates on record.
+        rebuild(data_dir): Re-indexes the dated CSV snapshots of the data tree.
+    """
+    def __init__(self, path=CATALOG_PATH, data_dir='data'):
+        self.path = path
+        exists = os.path.exists(path)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with closing(self.connect()) as connection:
+            # The journal mode is stored in the file, readers then no longer block writers nor the other way round
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        if not exists:
+            self.rebuild(data_dir)
+
+    def connect(self):
+        # One short-lived connection per operation, so threads and processes never share one
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @staticmethod
+    def entry(df, ticker, period, interval, fetch_date, location, storage='csv'):
+        """Catalog row of the dataset `df` stored at `location`."""
+        return {
+            'ticker': symbol(ticker),
+            'interval': interval,
+            'period': period or SERIES,
+            'fetch_date': fetch_date,
+            'storage': storage,
+            'location': location,
+            'rows': len(df),
+            'min_timestamp': str(df.index.min()) if len(df) else None,
+            'max_timestamp': str(df.index.max()) if len(df) else None,
+            'checksum': frame_checksum(df),
+            'recorded_at': pd.Timestamp.now().isoformat(timespec='seconds'),
+        }
+
+    @staticmethod
+    def upsert(connection, entries):
+        connection.executemany(f"INSERT OR REPLACE INTO datasets ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                               [[entry[column] for column in COLUMNS] for entry in entries])
+
+    def record(self, df, ticker, period, interval, fetch_date, location, storage='csv'):
+        """Upsert the entry of the dataset `df` written at `location`, in one transaction."""
+        entry = self.entry(df, ticker, period, interval, fetch_date, location, storage)
+        with closing(self.connect()) as connection, connection:
+            self.upsert(connection, [entry])
+        return entry
+
+    def query(self, sql, params=()):
+        with closing(self.connect()) as connection:
+            return [dict(row) for row in connection.execute(sql, params).fetchall()]
+
+    def lookup(self, ticker, period, interval, fetch_date=None):
+        """Entry of a dataset fetched on `fetch_date` (YYYYMMDD), or of its latest fetch. None if there is none."""
+        sql = "SELECT * FROM datasets WHERE ticker = ? AND interval = ? AND period = ?"
+        params = [symbol(ticker), interval, period or SERIES]
+        if fetch_date is not None:
+            sql += " AND fetch_date = ?"
+            params.append(fetch_date)
+        rows = self.query(sql + " ORDER BY fetch_date DESC LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def covering(self, ticker, period, interval, fetch_date):
+        """
+        Entry from which the `period` window fetched on `fetch_date` can be read: the dataset itself, or else the
+        narrowest wider window of the same interval and fetch date (a virtual window is sliced out of it).
+        """
+        rows = self.query("SELECT * FROM datasets WHERE ticker = ? AND interval = ? AND fetch_date = ? AND period != ?",
+                          (symbol(ticker), interval, fetch_date, SERIES))
+        candidates = [row for row in rows if row['period'] == period or period_rank(row['period']) > period_rank(period)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda row: period_rank(row['period']))
+
+    def latest_fetch(self, ticker, interval):
+        """Most recent fetch date (YYYYMMDD) of the dated snapshots of a (ticker, interval), None if there is none."""
+        rows = self.query("SELECT MAX(fetch_date) AS fetch_date FROM datasets WHERE ticker = ? AND interval = ? AND period != ?",
+                          (symbol(ticker), interval, SERIES))
+        return rows[0]['fetch_date']
+
+    def fingerprint(self, ticker, interval):
+        """Hash of the (period, fetch date, checksum) of every dataset of a (ticker, interval), changing whenever one is written with new content."""
+        digest = hashlib.sha256()
+        for entry in self.entries(ticker, interval):
+            digest.update(f"{entry['period']}|{entry['fetch_date']}|{entry['checksum']}\n".encode())
+        return digest.hexdigest()
+
+    def entries(self, ticker=None, interval=None, fetch_date=None):
+        conditions, params = [], []
+        for column, value in (('ticker', ticker and symbol(ticker)), ('interval', interval), ('fetch_date', fetch_date)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.query(f"SELECT * FROM datasets{where} ORDER BY ticker, interval, period, fetch_date", params)
+
+    def options(self):
+        """{'tickers', 'periods', 'intervals', 'dates'}: sorted distinct values on record, the dates most recent first."""
+        with closing(self.connect()) as connection:
+            distinct = lambda column, where='': [row[0] for row in connection.execute(f"SELECT DISTINCT {column} FROM datasets{where} ORDER BY {column}")]
+            return {
+                'tickers': distinct('ticker'),
+                'periods': sorted(distinct('period', f" WHERE period != '{SERIES}'"), key=period_rank),
+                'intervals': distinct('interval'),
+                'dates': distinct('fetch_date')[::-1],
+            }
+
+    def rebuild(self, data_dir='data'):
+        """Record every dated CSV snapshot of `data_dir/<TICKER>/<Daily|Hourly>/`, returns the number of recorded files."""
+        files = glob(os.path.join(data_dir, '*', '*', '*.csv'))
+        entries = []
+        for file_path in files:
+            parts = os.path.basename(file_path)[:-len('.csv')].split('_')
+            if len(parts) != 4:
+                continue
+            ticker, period, interval, fetch_date = parts
+            try:
+                df = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+            except (ValueError, pd.errors.ParserError) as e:
+                logging.warning(f"Skipping {file_path} while indexing the catalog: {e}")
+                continue
+            entries.append(self.entry(df, ticker, period, interval, fetch_date, file_path))
+        # Snapshots deleted by hand must not stay on record, readers see the old or the new index but never a partial one
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM datasets WHERE storage = 'csv'")
+            self.upsert(connection, entries)
+        recorded = len(entries)
+        if recorded:
+            logging.info(f"Indexed {recorded} datasets of {data_dir} into the catalog {self.path}")
+        return recorded
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if sys.argv[1:] != ['rebuild']:
+        print("Usage: python scripts/dataset_catalog.py rebuild")
+        sys.exit(1)
+    catalog = DatasetCatalog()
+    print(f"Indexed {catalog.rebuild()} datasets into {catalog.path}")
@@ -0,0 +1,184 @@
+"""
+Concurrent, rate-limited execution of data download jobs.
+
+The network step (provider downloads) runs on a thread pool behind a token-bucket rate limiter, with retries
+using jittered exponential backoff and a per-attempt timeout enforced by the provider's own request. Downloaded
+frames are handed to a single saver thread through a bounded queue, so slow disk or database writes apply
+back-pressure to the downloads instead of piling up in memory. Data sources are pluggable: anything with a
+`download(ticker, period, interval, start, timeout)` method can be used, e.g. `LocalCsvProvider` to replay the
+stored `data/` tree without network access.
+"""
+import os
+import time
+import queue
+import random
+import logging
+import threading
+from glob import glob
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# A single download request, `start` is only set for incremental (delta) downloads
+FetchJob = namedtuple('FetchJob', ['ticker', 'period', 'interval', 'start'], defaults=[None])
+
+
+class YahooFinanceProvider:
+    """Downloads bars from the Yahoo Finance API, raising on failure so that the executor can retry."""
+    def download(self, ticker, period=None, interval='1d', start=None, timeout=None):
+        import yfinance as yf
+        # yf.download collects its results in a module-global dict shared by all threads, a Ticker per call does not.
+        # auto_adjust=False keeps the Adj Close column of yf.download, `timeout` bounds the HTTP request itself
+        history = yf.Ticker(ticker).history
+        options = {'interval': interval, 'auto_adjust': False, 'actions': False, **({'timeout': timeout} if timeout else {})}
+        if start is not None:
+            data = history(start=start, **options)
+        else:
+            data = history(period=period, **options)
+        # yfinance reports failed downloads (network errors, unknown tickers, rate limits) as an empty frame
+        if data is None or data.empty:
+            raise ValueError(f"No data returned by Yahoo Finance for {ticker}, {period or start}, {interval}")
+        data.index.name = 'Date'
+        return data
+
+
+class LocalCsvProvider:
+    """
+    Serves bars from the stored `data/<TICKER>/<Daily|Hourly>/*.csv` tree, mainly to exercise the executor offline.
+
+    Attributes:
+        data_dir (str): Root directory of the CSV tree.
+        latency (float): Simulated network latency in seconds per request.
+        failure_rate (float): Probability that a request raises, to exercise the retry path.
+    """
+    def __init__(self, data_dir='data', latency=0.0, failure_rate=0.0):
+        self.data_dir = data_dir
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    def download(self, ticker, period=None, interval='1d', start=None, timeout=None):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError(f"Simulated failure for {ticker}")
+        frequency = 'Hourly' if '1h' in interval else 'Daily'
+        symbol = ticker.replace('-USD', '')
+        pattern = f"{symbol}_{period or '*'}_{interval}_*.csv"
+        files = sorted(glob(os.path.join(self.data_dir, symbol, frequency, pattern)))
+        if not files:
+            return pd.DataFrame()
+        data = pd.read_csv(files[-1], index_col='Date', parse_dates=['Date'])
+        return data[data.index >= pd.Timestamp(start)] if start is not None else data
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts of up to `capacity` requests."""
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ConcurrentFetchExecutor:
+    """
+    Runs download jobs concurrently and saves their results from a single saver thread.
+
+    Attributes:
+        provider: Data source with a `download(ticker, period, interval, start)` method.
+        workers (int): Number of concurrent download threads.
+        rate (float): Maximum number of requests per second across all workers (None disables the limiter).
+        burst (int): Number of requests that may be issued at once before the rate applies.
+        retries (int): Number of retries after a failed or timed out attempt.
+        backoff (float): Base delay in seconds of the exponential backoff between retries.
+        max_backoff (float): Upper bound for a single backoff delay.
+        timeout (float): Per-attempt timeout in seconds, passed to the provider.
+        queue_size (int): Maximum number of downloaded frames waiting to be saved.
+
+    Methods:
+        run(jobs, save_fn): Downloads all jobs and calls save_fn(job, data) for each of them, returns the results.
+    """
+    def __init__(self, provider, workers=4, rate=2.0, burst=4, retries=3, backoff=1.0, max_backoff=30.0, timeout=60.0, queue_size=8):
+        self.provider = provider
+        self.workers = workers
+        self.limiter = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key):
+        """Increment a run statistic from any thread."""
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def fetch_job(self, job, results):
+        """Download a job with retries and hand the result over to the saver queue."""
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            try:
+                # The provider times the attempt out itself, so no abandoned attempt keeps running next to its retry
+                data = self.provider.download(job.ticker, period=job.period, interval=job.interval, start=job.start, timeout=self.timeout)
+                logging.info(f"Downloaded {len(data)} rows for {job.ticker}, {job.period}, {job.interval} on attempt {attempt + 1}.")
+                self.results_queue.put((job, data))
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    logging.error(f"Giving up on {job.ticker}, {job.period}, {job.interval} after {attempt + 1} attempts: {e}")
+                    results[job] = None
+                    self.count('failed')
+                    return
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logging.warning(f"Attempt {attempt + 1} for {job.ticker}, {job.period}, {job.interval} failed ({e}), retrying in {delay:.2f}s.")
+                self.count('retries')
+                time.sleep(delay)
+
+    def save_worker(self, save_fn, results):
+        """Consume downloaded frames from the queue until the end-of-run sentinel arrives."""
+        while True:
+            item = self.results_queue.get()
+            if item is None:
+                break
+            job, data = item
+            try:
+                results[job] = save_fn(job, data)
+                self.count('saved')
+            except Exception as e:
+                logging.error(f"Failed to save data for {job.ticker}, {job.period}, {job.interval}: {e}")
+                results[job] = None
+                self.count('failed')
+
+    def run(self, jobs, save_fn):
+        """Download all jobs concurrently, saving each result with save_fn(job, data) as soon as it arrives."""
+        self.results_queue = queue.Queue(maxsize=self.queue_size)
+        self.stats = {'jobs': len(jobs), 'saved': 0, 'failed': 0, 'retries': 0}
+        results = {}
+        started = time.perf_counter()
+        saver = threading.Thread(target=self.save_worker, args=(save_fn, results), daemon=True)
+        saver.start()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for future in [pool.submit(self.fetch_job, job, results) for job in jobs]:
+                future.result()
+        self.results_queue.put(None)
+        saver.join()
+        self.stats['seconds'] = time.perf_counter() - started
+        logging.info(f"Fetch executor finished: {self.stats}")
+        return results
@@ -0,0 +1,184 @@
+"""
+Server-side series cache and downsampling for the Dash dashboard.
+
+A dropdown change or a zoom redraws the graphs from prepared series kept in memory rather than from disk:
+`SeriesCache` holds the price frame of every recently viewed (ticker, period, interval, date) dataset in an
+LRU, and memoizes the indicator columns computed from it, so switching graphs or zooming never recomputes them.
+
+The browser only receives a bounded number of points per trace, whatever the length of the history:
+
+    minmax(y, budget)           minimum and maximum of every bucket of a line, the envelope drawn at pixel width
+    bucket_ohlc(df, budget)     candles merged into `budget` OHLC buckets (first open, max high, min low, last close)
+    bucket_sum(x, y, budget)    bars summed per bucket (volumes)
+
+`visible_slice` turns the `relayoutData` of a graph into the slice of the series in view, so a zoomed-in graph
+is redrawn from the full-resolution bars of the visible range and shows every bar once it holds fewer of them
+than the point budget.
+
+In live mode the dashboard merges the bars written since the last poll into the cached frames with
+`SeriesCache.append`, splicing the indicator values computed for them onto the memoized columns, so the cache
+stays current without reloading or recomputing whole series.
+"""
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Points sent per trace, about two per horizontal pixel of a dashboard graph
+POINT_BUDGET = 1500
+
+
+class SeriesCache:
+    """
+    LRU cache of the price frames of the dashboard datasets and of the indicator columns computed from them.
+
+    Attributes:
+        loader (callable): loader(ticker, period, interval, date) returning the price frame of a dataset or None.
+        max_entries (int): Number of datasets kept in memory.
+        stats (dict): Hit and miss counts of the price frames and of the indicator columns.
+
+    Methods:
+        prices(key): Price frame of a (ticker, period, interval, date) key.
+        column(key, name, compute): Memoized compute(prices) for a key, e.g. an indicator.
+        append(key, bars, columns): Merges newer bars into the cached frame of a key.
+    """
+    def __init__(self, loader, max_entries=16):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'column_hits': 0, 'column_misses': 0}
+
+    def entry(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return self.entries[key]
+        self.stats['misses'] += 1
+        df = self.loader(*key)
+        if df is not None:
+            df = df.sort_index()
+        entry = {'prices': df, 'columns': {}}
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            logging.info(f"Evicted dashboard series {evicted}")
+        return entry
+
+    def prices(self, key):
+        return self.entry(key)['prices']
+
+    def column(self, key, name, compute):
+        entry = self.entry(key)
+        if entry['prices'] is None:
+            return None
+        if name not in entry['columns']:
+            self.stats['column_misses'] += 1
+            entry['columns'][name] = compute(entry['prices'])
+        else:
+            self.stats['column_hits'] += 1
+        return entry['columns'][name]
+
+    def append(self, key, bars, columns=None):
+        """
+        Merge time-sorted `bars` into the cached frame of a key, the cached bars from the first merged one on being
+        replaced (a revised last bar). `columns` maps memoized columns to their values at the merged bars, arrays
+        or tuples of arrays like the memoized values, which are spliced in; the other memoized columns are dropped
+        and recomputed on their next use. Returns False if the key is not cached.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['prices'] is None or bars is None or bars.empty:
+            return False
+        df = entry['prices']
+        kept = df.index.searchsorted(bars.index[0])
+        entry['prices'] = pd.concat([df.iloc[:kept], bars])
+        spliced = {}
+        for name, values in (columns or {}).items():
+            if name in entry['columns']:
+                spliced[name] = splice(entry['columns'][name], kept, values)
+        entry['columns'] = spliced
+        return True
+
+
+def splice(memoized, kept, values):
+    """The first `kept` values of a memoized column (an array or a tuple of arrays) followed by `values`."""
+    if isinstance(memoized, tuple):
+        return tuple(splice(old, kept, new) for old, new in zip(memoized, values))
+    return np.concatenate([np.asarray(memoized, dtype=float)[:kept], np.asarray(values, dtype=float)])
+
+
+def relayout_range(relayout):
+    """The (start, end) x range of a graph from its relayoutData, None when it shows everything."""
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        return pd.Timestamp(relayout['xaxis.range[0]']), pd.Timestamp(relayout['xaxis.range[1]'])
+    if 'xaxis.range' in relayout:
+        start, end = relayout['xaxis.range']
+        return pd.Timestamp(start), pd.Timestamp(end)
+    return None
+
+
+def visible_slice(index, relayout):
+    """Positions of the bars of a sorted DatetimeIndex shown with a relayoutData, with one bar of margin on each side."""
+    view = relayout_range(relayout)
+    if view is None:
+        return slice(0, len(index))
+    start, end = index.searchsorted(view[0]), index.searchsorted(view[1], side='right')
+    return slice(max(start - 1, 0), min(end + 1, len(index)))
+
+
+def bucket_starts(n, budget):
+    """First position of each of the `budget` equal-count buckets of n points."""
+    return np.unique(np.linspace(0, n, budget, endpoint=False).astype(np.int64))
+
+
+def minmax(y, budget=POINT_BUDGET):
+    """
+    Return the sorted positions of the minimum and maximum of each of `budget` // 2 equal-count buckets of a line.
+
+    Drawn at the width of a graph, the kept points trace the same envelope as the full line. The first and last
+    points are always kept and NaN values are never selected unless a whole bucket is NaN.
+    """
+    n = len(y)
+    if n <= budget or budget < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    buckets = budget // 2 - 1
+    width = -(-n // buckets)
+    padded = np.full(buckets * width, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, width)
+    offsets = np.arange(buckets) * width
+    lowest = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highest = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    positions = np.unique(np.concatenate([[0, n - 1], lowest, highest]))
+    return positions[positions < n]
+
+
+def bucket_ohlc(df, budget=POINT_BUDGET, open='Open', high='High', low='Low', close='Close'):
+    """Merge candles into at most `budget` candles (first open, highest high, lowest low, last close), labelled with their first bar."""
+    if len(df) <= budget:
+        return df
+    starts = bucket_starts(len(df), budget)
+    ends = np.append(starts[1:], len(df)) - 1
+    return pd.DataFrame({
+        open: df[open].to_numpy()[starts],
+        high: np.fmax.reduceat(df[high].to_numpy(dtype=float), starts),
+        low: np.fmin.reduceat(df[low].to_numpy(dtype=float), starts),
+        close: df[close].to_numpy()[ends],
+    }, index=df.index[starts])
+
+
+def bucket_sum(x, y, budget=POINT_BUDGET):
+    """Sum bars (e.g. volumes) into at most `budget` buckets, labelled with their first x."""
+    if len(y) <= budget:
+        return x, y
+    starts = bucket_starts(len(y), budget)
+    return x[starts], np.add.reduceat(np.nan_to_num(np.asarray(y, dtype=float)), starts)
+
+
+def downsample_line(index, values, budget=POINT_BUDGET):
+    """(x, y) of a line thinned to the budget with min/max buckets, x being the DatetimeIndex of the values."""
+    values = np.asarray(values, dtype=float)
+    positions = minmax(values, budget)
+    return index[positions], values[positions]
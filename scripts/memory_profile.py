@@ -0,0 +1,64 @@
+"""
+Memory profiles of the OHLCV frames held by the pipeline.
+
+With the 'default' profile the loaders return the frames as stored: float64 prices, int64 volumes and the
+`Adj Close` column. The 'compact' profile shrinks them so the hourly data of every ticker fits in the RAM of a
+modest analytics worker:
+
+    - prices are downcast to float32 (about 7 significant digits, the rollups and indicators still compute in
+      float64 since they convert their inputs),
+    - volumes become int64 when they have no missing values (not uint64, whose arithmetic with signed values
+      silently turns into float64 in pandas),
+    - `Adj Close`, identical to `Close` for crypto, is dropped when it duplicates it,
+    - the index becomes a DatetimeIndex when it holds strings or Python datetimes. A datetime64 index already is
+      an array of int64 epoch values, so it is kept as it is, which also keeps date slicing and resampling working.
+
+Every compaction logs the memory of the dataset before and after.
+"""
+import logging
+import numpy as np
+import pandas as pd
+
+PROFILES = ('default', 'compact')
+
+# Redundant columns and the column they duplicate, for the CSV/store and the SQL column names
+REDUNDANT_COLUMNS = {'Adj Close': 'Close', 'adj_close': 'close'}
+
+VOLUME_COLUMNS = ('Volume', 'volume')
+
+
+def frame_memory(df):
+    """Bytes held by a frame, index and object values included."""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def compact_frame(df, label=None):
+    """Return a compact copy of an OHLCV frame, see the module docstring. `label` names the dataset in the memory report."""
+    if df is None or df.empty:
+        return df
+    before = frame_memory(df)
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df = df.set_axis(pd.DatetimeIndex(pd.to_datetime(df.index), name=df.index.name), axis=0)
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        duplicated = REDUNDANT_COLUMNS.get(column)
+        if duplicated in df.columns and np.array_equal(values.to_numpy(), df[duplicated].to_numpy(), equal_nan=True):
+            continue
+        if column in VOLUME_COLUMNS:
+            if not values.isna().any():
+                values = values.astype(np.int64)
+        elif values.dtype.kind == 'f':
+            values = values.astype(np.float32)
+        columns[column] = values
+    compact = pd.DataFrame(columns, index=df.index)
+    after = frame_memory(compact)
+    logging.info(f"Memory of {label or 'dataset'}: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB ({len(compact)} rows).")
+    return compact
+
+
+def apply_profile(df, profile='default', label=None):
+    """Return `df` as held under a memory profile ('default' keeps it unchanged, 'compact' compacts it)."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown memory profile {profile!r}, expected one of {PROFILES}")
+    return compact_frame(df, label) if profile == 'compact' else df
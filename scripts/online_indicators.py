@@ -0,0 +1,467 @@
+"""
+Streaming indicators and rollups, updated in O(1) per bar.
+
+`OnlineIndicatorEngine` holds the running state of the indicators of indicators.py (and of the open weekly,
+monthly and yearly rollup rows of rollups.py) for one (ticker, interval) series and folds every new bar in with
+`push(bar)`, so an hourly refresh costs the same whatever the length of the history. The building blocks are:
+
+    RunningEMA          exponential moving average (EMA, MACD, Wilder's RSI smoothing)
+    RunningWindow       sliding-window mean and standard deviation with Welford add/remove updates (SMA, Bollinger)
+    RunningExtreme      sliding-window maximum or minimum with a monotonic deque (stochastic oscillator)
+    RunningCorrelation  sliding-window Pearson correlation with Welford co-moments (volume/price correlation)
+
+Each of them has `push(x)`, which folds a value in and returns the indicator, and `peek(x)`, which returns the
+indicator as if `x` had been pushed without changing the state. The engine relies on the latter for the last
+bar, which is usually still open: it is kept aside and only committed when the next bar arrives, so that a
+refresh re-fetching the last bar revises it instead of counting it twice. The values match the vectorized
+indicators of the same bars, up to rounding.
+
+The whole state pickles into a small file, so a restarted process resumes where it stopped without replaying
+the history. The fetcher feeds the engine from its incremental (delta) download path, see
+CryptoDataFetcher.update_online.
+"""
+import os
+import math
+import logging
+from collections import deque
+import numpy as np
+import pandas as pd
+from indicators import DEFAULT_INDICATORS
+from rollups import period_end, GRANULARITIES
+
+NAN = float('nan')
+
+
+def welford_add(n, mean, m2, x):
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return n, mean, m2 + delta * (x - mean)
+
+
+def welford_remove(n, mean, m2, x):
+    if n == 1:
+        return 0, 0.0, 0.0
+    n -= 1
+    delta = x - mean
+    mean -= delta / n
+    return n, mean, m2 - delta * (x - mean)
+
+
+class RunningEMA:
+    """Exponential moving average in the recursive form (pandas `ewm(adjust=False)`), NaN values are skipped."""
+    def __init__(self, span=None, alpha=None, min_periods=0):
+        self.alpha = alpha if alpha is not None else 2 / (span + 1)
+        self.min_periods = max(min_periods, 1)
+        self.value = None
+        self.count = 0
+
+    def advance(self, x):
+        if x != x:
+            return self.value, self.count
+        return (x if self.value is None else self.value + self.alpha * (x - self.value)), self.count + 1
+
+    def result(self, value, count):
+        return NAN if value is None or count < self.min_periods else value
+
+    def peek(self, x):
+        return self.result(*self.advance(x))
+
+    def push(self, x):
+        self.value, self.count = self.advance(x)
+        return self.result(self.value, self.count)
+
+
+class SlidingWindow:
+    """Bookkeeping shared by the sliding-window indicators: the window values and the positions of the last NaN and change."""
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.count = 0
+        self.last_nan = -1
+        self.last_change = 0
+        self.last_value = None
+
+    def evicted(self):
+        """The value leaving the window when the next one is pushed, None while the window is filling up."""
+        return self.values[0] if len(self.values) == self.window else None
+
+    def complete(self, nan):
+        """Whether the window ending at the next value is full and free of NaN (like pandas `rolling(window)`)."""
+        start = self.count + 1 - self.window
+        return start >= 0 and not nan and self.last_nan < start
+
+    def flat(self, value):
+        """Whether the window ending at the next value holds a single repeated value, its variance is then exactly 0."""
+        last_change = self.count if self.count and value != self.last_value else self.last_change
+        return last_change <= self.count + 1 - self.window
+
+    def append(self, value, nan):
+        self.values.append(value)
+        if nan:
+            self.last_nan = self.count
+        if self.count and value != self.last_value:
+            self.last_change = self.count
+        self.last_value = value
+        self.count += 1
+
+
+class RunningWindow(SlidingWindow):
+    """Sliding-window mean and standard deviation, returned as a (mean, std) pair."""
+    def __init__(self, window, ddof=0):
+        super().__init__(window)
+        self.ddof = ddof
+        self.stats = (0, 0.0, 0.0)  # Welford (count, mean, m2) of the non-NaN values of the window
+
+    def advance(self, x):
+        stats = self.stats
+        old = self.evicted()
+        if old is not None and old == old:
+            stats = welford_remove(*stats, old)
+        if x == x:
+            stats = welford_add(*stats, x)
+        return stats
+
+    def result(self, stats, nan):
+        if not self.complete(nan):
+            return NAN, NAN
+        n, mean, m2 = stats
+        return mean, math.sqrt(max(m2, 0.0) / (n - self.ddof)) if n > self.ddof else NAN
+
+    def peek(self, x):
+        mean, std = self.result(self.advance(x), x != x)
+        return (mean, 0.0) if std == std and self.flat(x) else (mean, std)
+
+    def push(self, x):
+        value = self.peek(x)
+        self.stats = self.advance(x)
+        self.append(x, x != x)
+        return value
+
+
+class RunningExtreme(SlidingWindow):
+    """
+    Sliding-window maximum or minimum with a monotonic deque of (position, value) candidates.
+
+    A value drops every older candidate it dominates, so the deque stays sorted and its head is the extreme of
+    the window; each value enters and leaves the deque once, which is O(1) amortized per push.
+    """
+    def __init__(self, window, how='max'):
+        super().__init__(window)
+        self.values = None  # Only the candidates are kept
+        self.how = how
+        self.candidates = deque()
+
+    def better(self, a, b):
+        return a >= b if self.how == 'max' else a <= b
+
+    def peek(self, x):
+        if not self.complete(x != x):
+            return NAN
+        # At most the head candidate leaves the window at the next position, the one after it is then the extreme
+        for i in range(min(2, len(self.candidates))):
+            position, value = self.candidates[i]
+            if position > self.count - self.window:
+                return value if self.better(value, x) else x
+        return x
+
+    def push(self, x):
+        value = self.peek(x)
+        if x == x:
+            while self.candidates and self.better(x, self.candidates[-1][1]):
+                self.candidates.pop()
+            self.candidates.append((self.count, x))
+        else:
+            self.last_nan = self.count
+        while self.candidates and self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+        self.count += 1
+        return value
+
+
+class RunningCorrelation(SlidingWindow):
+    """Sliding-window Pearson correlation of two series, windows with a NaN in either series are NaN."""
+    def __init__(self, window):
+        super().__init__(window)
+        self.stats = (0, 0.0, 0.0, 0.0, 0.0, 0.0)  # count, mean x, mean y, m2 x, m2 y, co-moment
+        self.flat_x, self.flat_y = SlidingWindow(window), SlidingWindow(window)
+
+    @staticmethod
+    def add(stats, x, y):
+        n, mean_x, mean_y, m2_x, m2_y, comoment = stats
+        n += 1
+        dx, dy = x - mean_x, y - mean_y
+        mean_x += dx / n
+        mean_y += dy / n
+        return n, mean_x, mean_y, m2_x + dx * (x - mean_x), m2_y + dy * (y - mean_y), comoment + dx * (y - mean_y)
+
+    @staticmethod
+    def remove(stats, x, y):
+        n, mean_x, mean_y, m2_x, m2_y, comoment = stats
+        if n == 1:
+            return 0, 0.0, 0.0, 0.0, 0.0, 0.0
+        n -= 1
+        dx, dy = x - mean_x, y - mean_y
+        mean_x -= dx / n
+        mean_y -= dy / n
+        return n, mean_x, mean_y, m2_x - dx * (x - mean_x), m2_y - dy * (y - mean_y), comoment - dx * (y - mean_y)
+
+    def advance(self, x, y):
+        stats = self.stats
+        old = self.evicted()
+        if old is not None and old[0] == old[0] and old[1] == old[1]:
+            stats = self.remove(stats, *old)
+        if x == x and y == y:
+            stats = self.add(stats, x, y)
+        return stats
+
+    def result(self, stats, nan):
+        if not self.complete(nan):
+            return NAN
+        _, _, _, m2_x, m2_y, comoment = stats
+        spread = math.sqrt(max(m2_x, 0.0) * max(m2_y, 0.0))
+        return comoment / spread if spread > 0 else NAN
+
+    def peek(self, x, y):
+        if self.flat_x.flat(x) or self.flat_y.flat(y):
+            return NAN
+        return self.result(self.advance(x, y), x != x or y != y)
+
+    def push(self, x, y):
+        value = self.peek(x, y)
+        self.stats = self.advance(x, y)
+        self.append((x, y), x != x or y != y)
+        self.flat_x.append(x, False)
+        self.flat_y.append(y, False)
+        return value
+
+
+class RunningRSI:
+    """Relative strength index with Wilder's smoothing of the average gains and losses."""
+    def __init__(self, period=14):
+        self.gain = RunningEMA(alpha=1 / period, min_periods=period)
+        self.loss = RunningEMA(alpha=1 / period, min_periods=period)
+        self.previous = None
+
+    def moves(self, x):
+        delta = NAN if self.previous is None else x - self.previous
+        return (max(delta, 0.0), max(-delta, 0.0)) if delta == delta else (NAN, NAN)
+
+    @staticmethod
+    def result(gain, loss):
+        return 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+
+    def peek(self, x):
+        up, down = self.moves(x)
+        return self.result(self.gain.peek(up), self.loss.peek(down))
+
+    def push(self, x):
+        up, down = self.moves(x)
+        self.previous = x
+        return self.result(self.gain.push(up), self.loss.push(down))
+
+
+class RunningMACD:
+    """MACD line, signal line and histogram."""
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast, self.slow, self.signal = RunningEMA(span=fast), RunningEMA(span=slow), RunningEMA(span=signal)
+
+    def peek(self, x):
+        line = self.fast.peek(x) - self.slow.peek(x)
+        signal = self.signal.peek(line)
+        return line, signal, line - signal
+
+    def push(self, x):
+        line = self.fast.push(x) - self.slow.push(x)
+        signal = self.signal.push(line)
+        return line, signal, line - signal
+
+
+class RunningStochastic:
+    """Stochastic oscillator %K and its moving average %D."""
+    def __init__(self, window=14, smooth=3):
+        self.highest, self.lowest = RunningExtreme(window, 'max'), RunningExtreme(window, 'min')
+        self.smooth = RunningWindow(smooth)
+
+    @staticmethod
+    def k(close, highest, lowest):
+        return (close - lowest) / (highest - lowest) * 100 if highest != lowest else NAN
+
+    def peek(self, close, high, low):
+        k = self.k(close, self.highest.peek(high), self.lowest.peek(low))
+        return k, self.smooth.peek(k)[0]
+
+    def push(self, close, high, low):
+        k = self.k(close, self.highest.push(high), self.lowest.push(low))
+        return k, self.smooth.push(k)[0]
+
+
+class OnlineRollups:
+    """
+    The open weekly, monthly and yearly rollup rows of a series, with the columns of RollupEngine.
+
+    Each granularity keeps the partial aggregates (sum, count, max, min, last close, first open, volume) of its
+    current bin; a bar of a later bin starts a new one.
+    """
+    def __init__(self, close='Close', open='Open', volume='Volume'):
+        self.close, self.open, self.volume = close, open, volume
+        self.bins = {granularity: None for granularity in GRANULARITIES}
+
+    @staticmethod
+    def fold(current, label, close, open_, volume):
+        if current is None or current[0] != label:
+            current = [label, 0.0, 0, NAN, NAN, NAN, NAN, 0.0]
+        _, total, count, high, low, last, first, volume_sum = current
+        if close == close:
+            total, count, high, low, last = total + close, count + 1, max(high, close) if high == high else close, min(low, close) if low == low else close, close
+        if first != first:
+            first = open_
+        return [label, total, count, high, low, last, first, volume_sum + (volume if volume == volume else 0.0)]
+
+    def advance(self, timestamp, close, open_, volume):
+        day = np.datetime64(timestamp.date(), 'D')
+        return {granularity: self.fold(self.bins[granularity], period_end(day, freq), close, open_, volume)
+                for granularity, freq in GRANULARITIES.items()}
+
+    def row(self, current):
+        label, total, count, high, low, last, first, volume_sum = current
+        variation = last - first
+        return {
+            'Date': pd.Timestamp(label),
+            f'{self.close}_mean': total / count if count else NAN,
+            f'{self.close}_max': high,
+            f'{self.close}_min': low,
+            f'{self.close}_last': last,
+            f'{self.open}_first': first,
+            f'{self.volume}_sum': volume_sum,
+            'variation_$_abs': variation,
+            'variation_%_rel': variation / first * 100 if first else NAN,
+        }
+
+    def peek(self, timestamp, close, open_, volume):
+        return {granularity: self.row(current) for granularity, current in self.advance(timestamp, close, open_, volume).items()}
+
+    def push(self, timestamp, close, open_, volume):
+        self.bins = self.advance(timestamp, close, open_, volume)
+        return {granularity: self.row(current) for granularity, current in self.bins.items()}
+
+
+class OnlineIndicatorEngine:
+    """
+    Streaming counterpart of IndicatorEngine for one (ticker, interval) series, with persisted state.
+
+    Attributes:
+        config (dict): Indicator parameters, see indicators.DEFAULT_INDICATORS.
+        path (str): Pickle file holding the state, None to keep it in memory only.
+        timestamp (pd.Timestamp): Time of the last pushed bar, which is still open to revisions.
+        latest (dict): Indicator values at the last pushed bar, with the column names of IndicatorEngine.
+        rollups (dict): Open weekly, monthly and yearly rollup rows at the last pushed bar.
+
+    Methods:
+        push(bar, timestamp): Folds one bar in and returns the indicator values at that bar.
+        push_frame(df): Pushes the bars of a frame and returns the indicator values of every pushed bar.
+        save(): Writes the state atomically.
+    """
+    def __init__(self, config=None, path=None, close='Close', high='High', low='Low', volume='Volume', open='Open'):
+        self.config = DEFAULT_INDICATORS if config is None else config
+        self.path = path
+        self.columns = (close, high, low, volume, open)
+        self.reset()
+        if path is not None and os.path.exists(path):
+            state = pd.read_pickle(path)
+            if state['config'] == self.config and state['columns'] == self.columns:
+                self.__dict__.update(state['engine'])
+            else:
+                logging.info(f"Indicator configuration of {path} changed, its online state is rebuilt.")
+
+    def reset(self):
+        config = self.config
+        close, _, _, volume, open_ = self.columns
+        self.timestamp = None
+        self.open_bar = None
+        self.latest = {}
+        self.rollups = {}
+        self.previous_close = None
+        self.peak = NAN
+        self.sma = {window: RunningWindow(window) for window in config.get('sma', [])}
+        self.ema = {span: RunningEMA(span=span) for span in config.get('ema', [])}
+        self.rsi = RunningRSI(config['rsi']) if 'rsi' in config else None
+        self.macd = RunningMACD(*config['macd']) if 'macd' in config else None
+        self.bollinger = (RunningWindow(config['bollinger'][0]), config['bollinger'][1]) if 'bollinger' in config else None
+        self.stochastic = RunningStochastic(*config['stochastic']) if 'stochastic' in config else None
+        self.correlation = RunningCorrelation(config['volume_price_corr']) if 'volume_price_corr' in config else None
+        self.rollup_bins = OnlineRollups(close, open_, volume)
+
+    def evaluate(self, bar, commit):
+        """Indicator values at `bar` (close, high, low, volume, open), folding it into the state if `commit` is set."""
+        close, high, low, volume, open_ = bar
+        step = 'push' if commit else 'peek'
+        values = {}
+        for window, running in self.sma.items():
+            values[f'sma_{window}'] = getattr(running, step)(close)[0]
+        for span, running in self.ema.items():
+            values[f'ema_{span}'] = getattr(running, step)(close)
+        if self.rsi is not None:
+            values['rsi'] = getattr(self.rsi, step)(close)
+        if self.macd is not None:
+            values['macd'], values['macd_signal'], values['macd_histogram'] = getattr(self.macd, step)(close)
+        if self.bollinger is not None:
+            running, k = self.bollinger
+            middle, std = getattr(running, step)(close)
+            values['bollinger_middle'], values['bollinger_upper'], values['bollinger_lower'] = middle, middle + k * std, middle - k * std
+        if self.stochastic is not None:
+            values['stochastic_k'], values['stochastic_d'] = getattr(self.stochastic, step)(close, high, low)
+        bar_return = NAN if self.previous_close is None else close / self.previous_close - 1
+        if self.correlation is not None:
+            values['volume_price_corr'] = getattr(self.correlation, step)(abs(bar_return), volume)
+        peak = close if self.peak != self.peak else max(self.peak, close)
+        values['drawdown_%'] = (close / peak - 1) * 100
+        rollups = getattr(self.rollup_bins, step)(self.timestamp, close, open_, volume)
+        if commit:
+            self.previous_close, self.peak = close, peak
+        return values, rollups
+
+    def push(self, bar, timestamp=None):
+        """
+        Fold one bar (a mapping with the price columns, e.g. a row of a price frame) in and return its indicator values.
+
+        `timestamp` defaults to the name of the row. A bar with the time of the last pushed one revises it, older
+        bars are already part of the state and are ignored (None is returned).
+        """
+        timestamp = pd.Timestamp(bar.name if timestamp is None else timestamp)
+        values = tuple(float(bar[column]) for column in self.columns)
+        return self.push_values(timestamp, values)
+
+    def push_values(self, timestamp, values):
+        if self.timestamp is not None:
+            if timestamp < self.timestamp:
+                return None
+            if timestamp > self.timestamp:
+                # The previous bar is final once a later one arrives
+                self.evaluate(self.open_bar, commit=True)
+        self.timestamp, self.open_bar = timestamp, values
+        self.latest, self.rollups = self.evaluate(values, commit=False)
+        return self.latest
+
+    def push_frame(self, df):
+        """Push every bar of a time-sorted frame, returns the indicator values of the pushed bars as a frame."""
+        rows, index = [], []
+        if df is None or df.empty:
+            return pd.DataFrame()
+        index_name = df.index.name
+        df = df[list(self.columns)].astype(float)
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        for timestamp, *values in df.itertuples(name=None):
+            values = self.push_values(timestamp, tuple(values))
+            if values is not None:
+                rows.append(values)
+                index.append(timestamp)
+        return pd.DataFrame(rows, index=pd.DatetimeIndex(index, name=index_name))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        engine = {key: value for key, value in self.__dict__.items() if key not in ('config', 'path', 'columns')}
+        temporary = f"{self.path}.tmp"
+        pd.to_pickle({'config': self.config, 'columns': self.columns, 'engine': engine}, temporary)
+        os.replace(temporary, self.path)
@@ -0,0 +1,167 @@
+"""
+Panel (cross-ticker) analytics.
+
+Instead of running the analytics ticker by ticker, all tickers of an interval are loaded once and aligned into
+one column-stacked frame (columns (ticker, field)). The rollups and variations of every ticker are computed by a
+single vectorized pass of the rollup engine over the panel and only then split back into the per-ticker
+artifacts of data_analytics_v2. The panel also yields cross-sectional outputs: the correlation matrix of the bar
+returns, a relative performance table against a benchmark over the date range all tickers share and the month-end
+closes rebased to 100.
+
+Usage: python scripts/panel_analytics.py
+"""
+import os
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from data_windows import period_start, plan_downloads
+from rollups import period_end
+from analytics_artifacts import dataset_directory, write_frames, export_excel
+from data_analytics_v2 import CryptoAnalytics, config_analytics
+
+FIELDS = ['Close', 'Open', 'Volume']
+
+
+class PanelAnalytics:
+    """
+    Computes the analytics of all configured tickers of an interval at once.
+
+    Attributes:
+        config (dict): Analytics configuration, see config_analytics.
+        analytics (CryptoAnalytics): Loads the series and saves the per-ticker artifacts.
+        engine (RollupEngine): Rollup engine shared with the per-ticker analytics.
+        benchmark (str): Ticker the relative performance is measured against.
+
+    Methods:
+        load_panel(interval, widest_period): Loads every ticker into one aligned (ticker, field) frame, plus the per-ticker bars.
+        rollup_panel(panel, series): Rolls up all tickers in one pass, returns the per-ticker frames and the wide frames.
+        cross_sectional(panel, monthly): Correlation matrix, relative performance and rebased month-end closes.
+        run(): Runs the panel analytics for every configured (period, interval) combination.
+    """
+    def __init__(self, config, analytics=None):
+        self.config = config
+        self.analytics = analytics or CryptoAnalytics(config)
+        self.engine = self.analytics.rollups
+        self.benchmark = config.get('benchmark', 'BTC-USD')
+        logging.info("PanelAnalytics class initialized with configuration.")
+
+    def load_panel(self, interval, widest_period):
+        """Return (panel, {ticker: bars}), the bars as the per-ticker analytics load them, or (None, {}) without data."""
+        series = {}
+        for ticker in self.config['tickers']:
+            bars = self.analytics.bars_loader(ticker, interval, widest_period)()
+            if bars is None or bars.empty:
+                logging.warning(f"No data available for {ticker}, {interval}, it is left out of the panel.")
+                continue
+            series[ticker] = bars.sort_index()
+        if not series:
+            return None, series
+        # One outer join over all tickers, a ticker has NaN rows where it has no bar
+        panel = pd.concat({ticker: bars[FIELDS] for ticker, bars in series.items()}, axis=1).sort_index()
+        logging.info(f"Loaded a {interval} panel of {len(series)} tickers and {len(panel)} bars.")
+        return panel, series
+
+    def rollup_panel(self, panel, series=None):
+        """
+        Return ({ticker: (weekly, monthly, yearly)}, (weekly, monthly, yearly) wide frames) from one rollup of the panel.
+
+        The alignment turns integer volumes into floats, the per-ticker frames get back the volume dtype of the
+        ticker's bars in `series`, like a rollup of its series alone.
+        """
+        tickers = list(dict.fromkeys(panel.columns.get_level_values(0)))
+        close, open_, volume = (panel.xs(field, axis=1, level=1)[tickers].to_numpy(dtype=float) for field in FIELDS)
+        partials = self.engine.partials(panel.index, close, open_, volume)
+        wides = tuple(wide.sort_index(axis=1, level=0, sort_remaining=False) for wide in self.engine.rollup_wide(partials, tickers, panel.index.name))
+
+        # Every ticker keeps the bins between its own first and last bar, like a rollup of its series alone
+        present = ~(np.isnan(close) & np.isnan(open_) & np.isnan(volume))
+        days = panel.index.values.astype('datetime64[D]')
+        first_days = days[present.argmax(axis=0)]
+        last_days = days[len(days) - 1 - present[::-1].argmax(axis=0)]
+        bounds = {freq: (period_end(first_days, freq), period_end(last_days, freq)) for freq in ('W', 'M', 'Y')}
+        volume_column = f'{self.engine.volume}_sum'
+
+        results = {}
+        for column, ticker in enumerate(tickers):
+            frames = tuple(
+                wide[ticker].loc[bounds[freq][0][column]:bounds[freq][1][column]]
+                for wide, freq in zip(wides, ('W', 'M', 'Y'))
+            )
+            dtype = series[ticker][self.engine.volume].dtype if series and ticker in series else None
+            if dtype is not None and pd.api.types.is_integer_dtype(dtype):
+                frames = tuple(frame.astype({volume_column: dtype}) if frame[volume_column].notna().all() else frame for frame in frames)
+            results[ticker] = frames
+        return results, wides
+
+    def cross_sectional(self, panel, monthly):
+        """Return the return correlation matrix, the relative performance table and the rebased month-end closes."""
+        close = panel.xs('Close', axis=1, level=1)
+        returns = close.pct_change(fill_method=None)
+        correlation = returns.corr().rename_axis(index='Ticker', columns=None)
+
+        # Returns are only comparable over the same dates, so the table covers the range every ticker has bars in
+        common_start, common_end = close.apply(pd.Series.first_valid_index).max(), close.apply(pd.Series.last_valid_index).min()
+        common = close.loc[common_start:common_end]
+        if common.empty:
+            logging.warning("The tickers of the panel share no date range, the performance table is left empty.")
+        first = common.bfill().iloc[0] if not common.empty else pd.Series(np.nan, index=close.columns)
+        last = common.ffill().iloc[-1] if not common.empty else pd.Series(np.nan, index=close.columns)
+        performance = pd.DataFrame({
+            'first_date': common_start,
+            'last_date': common_end,
+            'first_close': first,
+            'last_close': last,
+            'return_%': (last / first - 1) * 100,
+            'volatility_%': common.pct_change(fill_method=None).std() * 100,
+        })
+        if self.benchmark in performance.index:
+            performance[f'excess_vs_{self.benchmark}_%'] = performance['return_%'] - performance.loc[self.benchmark, 'return_%']
+        performance['rank'] = performance['return_%'].rank(ascending=False, method='min')
+        performance = performance.rename_axis('Ticker')
+
+        month_end = monthly.xs(f'{self.engine.close}_last', axis=1, level=1)
+        rebased = month_end / month_end.bfill().iloc[0] * 100
+        return correlation, performance.sort_values('rank'), rebased
+
+    def save_cross_sectional(self, correlation, performance, rebased, period, interval):
+        directory = os.path.join(dataset_directory('Panel', interval), f"Panel_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}")
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        write_frames({'correlation': correlation, 'performance': performance, 'rebased': rebased}, directory, self.config.get('analytics_format', 'parquet'))
+        logging.info(f"Panel analytics saved to {directory}")
+        if self.config.get('excel_export'):
+            export_excel(directory)
+        return directory
+
+    def run(self):
+        logging.info("Starting the panel analytics process for all configured tickers and timeframes.")
+        for interval, (widest_period, periods) in plan_downloads(self.config['combinations']).items():
+            panel, series = self.load_panel(interval, widest_period)
+            if panel is None:
+                logging.warning(f"No data available for the {interval} panel.")
+                continue
+            for period in periods:
+                start = period_start(period)
+                window = panel if start is None else panel[panel.index >= start]
+                # Tickers without a bar in the window are left out as a whole, never a single one of their fields
+                tickers = [ticker for ticker in series if window[ticker].notna().to_numpy().any()]
+                if not tickers:
+                    logging.warning(f"No data in the {period} window of the {interval} panel.")
+                    continue
+                window = window[tickers].dropna(how='all')
+                results, (weekly, monthly, yearly) = self.rollup_panel(window, series)
+                for ticker, (ticker_weekly, ticker_monthly, ticker_yearly) in results.items():
+                    # The artifacts carry the fingerprint and the indicators of the per-ticker run, which can reuse them
+                    bars = series[ticker] if start is None else series[ticker].loc[start:]
+                    key = self.analytics.fingerprint(bars, interval)
+                    extra = self.analytics.calculate_indicators(bars, interval)
+                    self.analytics.save_analytics(ticker_weekly, ticker_monthly, ticker_yearly, ticker, period, interval, extra, key)
+                self.save_cross_sectional(*self.cross_sectional(window, monthly), period, interval)
+
+
+# The panel runs on the analytics configuration, with the benchmark of the relative performance table
+config_panel = {**config_analytics, "benchmark": "BTC-USD"}
+
+if __name__ == '__main__':
+    panel_analytics = PanelAnalytics(config_panel)
+    panel_analytics.run()
@@ -0,0 +1,418 @@
+"""
+Columnar storage for OHLCV price series.
+
+Each (ticker, interval) is kept as one de-duplicated series of typed columnar files partitioned by year,
+`data_store/<TICKER>/<interval>/<year>.parquet`, so loading a multi-year hourly set no longer parses dates from
+text. Reads support column projection and predicate pushdown on the date range: partitions outside the range
+are never opened and, for Parquet, row groups outside it are skipped from their statistics. Period windows
+('1y', '6mo', ...) are simply date-range reads, see `data_windows.period_start`.
+
+`VersionedPriceStore` is the append-only variant that keeps every fetch reproducible without storing a full
+copy of the series per run date.
+
+Run this module directly to migrate the existing `data/<TICKER>/<Daily|Hourly>/*.csv` tree into the columnar
+store, or with the `versioned` argument into the versioned store.
+"""
+import os
+import json
+import logging
+import pandas as pd
+from glob import glob
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+from data_windows import period_rank
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def revises_history(old, new, before):
+    """Whether the bars of `new` change any bar of `old` older than `before`, the last stored bar (which deltas re-fetch)."""
+    if before is None:
+        return False
+    common = old.index.intersection(new.index)
+    common = common[common < before]
+    if common.empty:
+        return False
+    columns = old.columns.intersection(new.columns)
+    old_values, new_values = old.loc[common, columns], new.loc[common, columns]
+    return bool(((old_values != new_values) & ~(old_values.isna() & new_values.isna())).to_numpy().any())
+
+
+class ColumnarPriceStore:
+    """
+    A year-partitioned columnar store for OHLCV data.
+
+    Attributes:
+        root (str): Root directory of the store.
+        file_format (str): 'parquet' (default, supports row group pruning) or 'feather' (Arrow IPC, fastest to read).
+
+    Methods:
+        write(df, ticker, interval, fetch_date, replace): Upserts bars into the year partitions they fall in.
+        read(ticker, interval, start, end, columns): Reads a date range with optional column projection.
+        last_timestamp(ticker, interval): Returns the last stored bar timestamp.
+        last_updated(ticker, interval): Returns the date of the last write.
+        history_version(ticker, interval): Returns the number of writes that revised bars before the last stored one.
+        is_fresh(ticker, interval): Checks whether the series was written today.
+        migrate_csv_tree(data_dir): One-shot import of the dated CSV snapshots.
+    """
+    def __init__(self, root='data_store', file_format='parquet'):
+        self.root = root
+        self.file_format = file_format
+        self.extension = 'parquet' if file_format == 'parquet' else 'feather'
+
+    def series_directory(self, ticker, interval):
+        return os.path.join(self.root, ticker.replace('-USD', ''), interval)
+
+    def partition_path(self, ticker, interval, year):
+        return os.path.join(self.series_directory(ticker, interval), f"{year}.{self.extension}")
+
+    def partitions(self, ticker, interval, start=None, end=None):
+        """List the partition files of a series whose year overlaps the [start, end] range, oldest first."""
+        paths = glob(os.path.join(self.series_directory(ticker, interval), f"*.{self.extension}"))
+        selected = []
+        for path in paths:
+            year = int(os.path.basename(path).split('.')[0])
+            if start is not None and year < pd.Timestamp(start).year:
+                continue
+            if end is not None and year > pd.Timestamp(end).year:
+                continue
+            selected.append((year, path))
+        return [path for _, path in sorted(selected)]
+
+    def normalize(self, df):
+        """Return a copy with a tz-naive 'Date' index and typed price columns."""
+        df = df.copy()
+        if df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        df.index = pd.DatetimeIndex(df.index, name='Date')
+        for column in df.columns:
+            if column == 'Volume' and not df[column].isna().any():
+                df[column] = df[column].astype('int64')
+            else:
+                df[column] = df[column].astype('float64')
+        return df
+
+    def read_partition(self, path, start=None, end=None, columns=None):
+        read_columns = None if columns is None else ['Date'] + [c for c in columns if c != 'Date']
+        if self.file_format == 'parquet':
+            filters = []
+            if start is not None:
+                filters.append(('Date', '>=', pd.Timestamp(start)))
+            if end is not None:
+                filters.append(('Date', '<=', pd.Timestamp(end)))
+            table = pq.read_table(path, columns=read_columns, filters=filters or None)
+        else:
+            table = feather.read_table(path, columns=read_columns)
+        df = table.to_pandas().set_index('Date')
+        if self.file_format != 'parquet':
+            if start is not None:
+                df = df[df.index >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df.index <= pd.Timestamp(end)]
+        return df
+
+    def write_partition(self, df, path):
+        """Atomically replace a partition file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        tmp_path = f"{path}.tmp"
+        if self.file_format == 'parquet':
+            pq.write_table(table, tmp_path)
+        else:
+            feather.write_feather(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    def write(self, df, ticker, interval, fetch_date=None, replace=False):
+        """
+        Upsert bars into the store, only rewriting the year partitions the new bars fall in.
+
+        `replace` marks a complete download; the columnar store keeps no snapshots and upserts it like a delta.
+        """
+        if df is None or df.empty:
+            return self.series_directory(ticker, interval)
+        df = self.normalize(df)
+        previous_last = self.last_timestamp(ticker, interval)
+        revised = False
+        for year, bars in df.groupby(df.index.year):
+            path = self.partition_path(ticker, interval, year)
+            if os.path.exists(path):
+                existing = self.read_partition(path)
+                revised = revised or revises_history(existing, bars, previous_last)
+                bars = pd.concat([existing, bars[existing.columns.intersection(bars.columns)]])
+                bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+            self.write_partition(bars, path)
+        fetch_date = fetch_date or datetime.now().strftime('%Y%m%d')
+        self.write_meta(ticker, interval, self.meta_updates(ticker, interval, fetch_date, df, revised))
+        logging.info(f"Stored {len(df)} bars for {ticker}, {interval} in {self.series_directory(ticker, interval)}")
+        return self.series_directory(ticker, interval)
+
+    def read(self, ticker, interval, start=None, end=None, columns=None):
+        """Read a series between start and end (inclusive), optionally only the given columns. Returns None if empty."""
+        frames = [self.read_partition(path, start, end, columns) for path in self.partitions(ticker, interval, start, end)]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return None
+        return pd.concat(frames).sort_index()
+
+    def meta_path(self, ticker, interval):
+        return os.path.join(self.series_directory(ticker, interval), '_meta.json')
+
+    def read_meta(self, ticker, interval):
+        path = self.meta_path(ticker, interval)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as file:
+            return json.load(file)
+
+    def write_meta(self, ticker, interval, updates):
+        meta = self.read_meta(ticker, interval)
+        for key in ('last_updated', 'last_timestamp'):
+            if key in updates and key in meta:
+                updates[key] = max(updates[key], meta[key])
+        meta.update(updates)
+        tmp_path = f"{self.meta_path(ticker, interval)}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, self.meta_path(ticker, interval))
+
+    def meta_updates(self, ticker, interval, fetch_date, df, revised):
+        updates = {'last_updated': fetch_date, 'last_timestamp': str(df.index.max())}
+        if revised:
+            # Readers holding state derived from the older bars (e.g. the rollup state) rebuild it when this changes
+            updates['history_version'] = self.history_version(ticker, interval) + 1
+        return updates
+
+    def history_version(self, ticker, interval):
+        """Number of writes that changed bars before the then last stored bar, 0 for a series only ever appended to."""
+        return self.read_meta(ticker, interval).get('history_version', 0)
+
+    def last_timestamp(self, ticker, interval):
+        """Return the timestamp of the last stored bar, or None if the series does not exist."""
+        meta = self.read_meta(ticker, interval)
+        return pd.Timestamp(meta['last_timestamp']) if 'last_timestamp' in meta else None
+
+    def last_updated(self, ticker, interval):
+        """Return the date (YYYYMMDD) of the last write, or None if the series does not exist."""
+        return self.read_meta(ticker, interval).get('last_updated')
+
+    def is_fresh(self, ticker, interval):
+        """Check whether the series has been written today."""
+        return self.last_updated(ticker, interval) == datetime.now().strftime('%Y%m%d')
+
+    def migrate_csv_tree(self, data_dir='data'):
+        """
+        Import every dated CSV snapshot of `data/<TICKER>/<Daily|Hourly>/` into the store.
+
+        Snapshots are applied from the oldest to the newest fetch date, so the newest copy of a bar wins and all
+        windows of an interval collapse into a single series. The windows of a fetch date are applied from the
+        widest one, the narrower ones then only confirm its bars. Returns the number of imported files.
+        """
+        files = glob(os.path.join(data_dir, '*', '*', '*.csv'))
+        # Filenames look like BTC_max_1d_20240421.csv, sort on the fetch date so newer snapshots are applied last
+        files.sort(key=lambda path: (os.path.basename(path).split('_')[-1], -period_rank(os.path.basename(path).split('_')[1])))
+        for file_path in files:
+            symbol, period, interval, date_str = os.path.basename(file_path).split('.')[0].split('_')
+            df = pd.read_csv(file_path, index_col='Date', parse_dates=['Date'])
+            self.write(df, f"{symbol}-USD", interval, fetch_date=date_str, replace=True)
+            logging.info(f"Migrated {file_path} ({period}) into the columnar store.")
+        return len(files)
+
+
+def row_ranges(rows):
+    """Collapse the (_segment, _row) columns of a frame read with_rows into [segment, start, stop] ranges of consecutive rows."""
+    ranges = []
+    for name, numbers in rows.groupby('_segment')['_row']:
+        numbers = sorted(numbers)
+        start = previous = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number != previous + 1:
+                ranges.append([name, start, previous + 1])
+                start = number
+            previous = number
+    return ranges
+
+
+class VersionedPriceStore(ColumnarPriceStore):
+    """
+    An append-only price store that keeps every bar version once and can rebuild the data as of any fetch date.
+
+    Each write only appends the bars that are new or changed since the previous snapshot as a segment file,
+    `data_versions/<TICKER>/<interval>/segments/<fetch_date>.parquet`, so storage grows with the number of new
+    bars instead of with the number of run days. `manifest.json` records every segment with the fetch it came
+    from and, for every fetch date, the row ranges of the segments that make up the dataset at that date, so a
+    snapshot is rebuilt by slicing those ranges without any de-duplication. A delta write extends the previous
+    snapshot, a `replace` write (a complete download) makes the snapshot exactly the bars it holds, together
+    with the bars written earlier on the same fetch date (the other windows of that day's fetch).
+
+    Methods:
+        write(df, ticker, interval, fetch_date, replace): Appends the new or changed bars as a new snapshot.
+        read(ticker, interval, start, end, columns, as_of, with_source): Rebuilds the data as of a fetch date.
+        snapshots(ticker, interval): Lists the fetch dates that can be rebuilt.
+    """
+    def __init__(self, root='data_versions'):
+        super().__init__(root, 'parquet')
+
+    def manifest_path(self, ticker, interval):
+        return os.path.join(self.series_directory(ticker, interval), 'manifest.json')
+
+    def read_manifest(self, ticker, interval):
+        path = self.manifest_path(ticker, interval)
+        if not os.path.exists(path):
+            return {'segments': {}, 'snapshots': []}
+        with open(path) as file:
+            return json.load(file)
+
+    def write_manifest(self, ticker, interval, manifest):
+        tmp_path = f"{self.manifest_path(ticker, interval)}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file)
+        os.replace(tmp_path, self.manifest_path(ticker, interval))
+
+    def segment_path(self, ticker, interval, name):
+        return os.path.join(self.series_directory(ticker, interval), 'segments', f"{name}.parquet")
+
+    def snapshots(self, ticker, interval):
+        """List the fetch dates (YYYYMMDD) whose dataset can be rebuilt, oldest first."""
+        return [snapshot['fetch_date'] for snapshot in self.read_manifest(ticker, interval)['snapshots']]
+
+    def find_snapshot(self, manifest, as_of=None):
+        """Return the latest snapshot taken on or before `as_of` (YYYYMMDD), or None."""
+        snapshots = [s for s in manifest['snapshots'] if as_of is None or s['fetch_date'] <= as_of]
+        return snapshots[-1] if snapshots else None
+
+    def read_ranges(self, ticker, interval, manifest, ranges, start=None, end=None, columns=None, with_rows=False, with_source=False):
+        """Read the given segment row ranges, skipping segments whose date span lies outside [start, end]."""
+        read_columns = None if columns is None else ['Date'] + [c for c in columns if c != 'Date']
+        tables = {}
+        frames = []
+        for name, row_start, row_stop in ranges:
+            segment = manifest['segments'][name]
+            if start is not None and pd.Timestamp(segment['max_date']) < pd.Timestamp(start):
+                continue
+            if end is not None and pd.Timestamp(segment['min_date']) > pd.Timestamp(end):
+                continue
+            if name not in tables:
+                tables[name] = pq.read_table(self.segment_path(ticker, interval, name), columns=read_columns)
+            frame = tables[name].slice(row_start, row_stop - row_start).to_pandas()
+            if with_rows:
+                frame['_segment'] = name
+                frame['_row'] = range(row_start, row_stop)
+            if with_source:
+                frame['fetch_date'] = segment['fetch_date']
+            frames.append(frame)
+        if not frames:
+            return None
+        df = pd.concat(frames).set_index('Date').sort_index()
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index <= pd.Timestamp(end)]
+        return df
+
+    def read(self, ticker, interval, start=None, end=None, columns=None, as_of=None, with_source=False):
+        """
+        Rebuild the series as it was at fetch date `as_of` (YYYYMMDD, defaults to the latest snapshot).
+
+        With `with_source` a 'fetch_date' column tells which fetch every bar came from. Returns None if empty.
+        """
+        manifest = self.read_manifest(ticker, interval)
+        snapshot = self.find_snapshot(manifest, as_of)
+        if snapshot is None:
+            return None
+        return self.read_ranges(ticker, interval, manifest, snapshot['ranges'], start, end, columns, with_source=with_source)
+
+    def write(self, df, ticker, interval, fetch_date=None, replace=False):
+        """
+        Append the bars that are new or changed since the latest snapshot and record a snapshot for `fetch_date`.
+
+        With `replace`, bars of an earlier fetch that are missing from `df` are left out of the new snapshot.
+        """
+        if df is None or df.empty:
+            return self.series_directory(ticker, interval)
+        fetch_date = fetch_date or datetime.now().strftime('%Y%m%d')
+        df = self.normalize(df)
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        manifest = self.read_manifest(ticker, interval)
+        previous = self.find_snapshot(manifest)
+        if previous is not None and previous['fetch_date'] > fetch_date:
+            raise ValueError(f"Cannot append a {fetch_date} fetch after the {previous['fetch_date']} snapshot, the store is append-only.")
+
+        ranges = []
+        delta = df
+        revised = False
+        # A previous snapshot without any row (e.g. an empty fetch) contributes nothing
+        current = None if previous is None else self.read_ranges(ticker, interval, manifest, previous['ranges'], with_rows=True)
+        if current is not None:
+            common = df.index.intersection(current.index)
+            columns = df.columns.intersection(current.columns)
+            new_values = df.loc[common, columns]
+            old_values = current.loc[common, columns]
+            changed = ((new_values != old_values) & ~(new_values.isna() & old_values.isna())).any(axis=1)
+            changed_dates = common[changed.to_numpy()]
+            delta = df.loc[df.index.difference(current.index).union(changed_dates)]
+            removed = current.index[:0]
+            if replace and previous['fetch_date'] != fetch_date:
+                removed = current.index.difference(df.index)
+            previous_last = self.last_timestamp(ticker, interval)
+            revised = previous_last is not None and bool((changed_dates.union(removed) < previous_last).any())
+            # Drop the superseded and removed rows from the previous ranges, splitting a range where needed
+            superseded = current.loc[changed_dates.union(removed)].groupby('_segment')['_row'].apply(set).to_dict()
+            for name, row_start, row_stop in previous['ranges']:
+                rows = sorted(row for row in superseded.get(name, ()) if row_start <= row < row_stop)
+                for row in rows + [row_stop]:
+                    if row > row_start:
+                        ranges.append([name, row_start, row])
+                    row_start = row + 1
+            if previous['fetch_date'] == fetch_date:
+                # Another window of the same fetch may bring back bars a narrower window left out of the snapshot,
+                # those still stored unchanged in the snapshot of an earlier fetch are referenced, not written again
+                earlier = [snapshot for snapshot in manifest['snapshots'] if snapshot['fetch_date'] < fetch_date]
+                base = self.read_ranges(ticker, interval, manifest, earlier[-1]['ranges'], with_rows=True) if earlier else None
+                if base is not None:
+                    candidates = delta.index.difference(current.index).intersection(base.index)
+                    columns = df.columns.intersection(base.columns)
+                    new_values = df.loc[candidates, columns]
+                    old_values = base.loc[candidates, columns]
+                    same = ((new_values == old_values) | (new_values.isna() & old_values.isna())).all(axis=1)
+                    restored = candidates[same.to_numpy()]
+                    ranges.extend(row_ranges(base.loc[restored]))
+                    delta = delta.drop(restored)
+
+        if not delta.empty:
+            name = fetch_date
+            suffix = 1
+            while name in manifest['segments']:
+                name = f"{fetch_date}_{suffix}"
+                suffix += 1
+            self.write_partition(delta, self.segment_path(ticker, interval, name))
+            manifest['segments'][name] = {'fetch_date': fetch_date, 'rows': len(delta), 'min_date': str(delta.index.min()), 'max_date': str(delta.index.max())}
+            ranges.append([name, 0, len(delta)])
+
+        snapshot = {'fetch_date': fetch_date, 'ranges': ranges}
+        if previous is not None and previous['fetch_date'] == fetch_date:
+            manifest['snapshots'][-1] = snapshot
+        else:
+            manifest['snapshots'].append(snapshot)
+        self.write_manifest(ticker, interval, manifest)
+        self.write_meta(ticker, interval, self.meta_updates(ticker, interval, fetch_date, df, revised))
+        logging.info(f"Appended {len(delta)} new or changed bars out of {len(df)} for {ticker}, {interval} as of {fetch_date}")
+        return self.series_directory(ticker, interval)
+
+
+def open_store(config):
+    """Return the price store selected by the `storage` setting of a config, or None for the dated CSV files."""
+    storage = config.get('storage', 'csv')
+    if storage == 'csv':
+        return None
+    if storage == 'versioned':
+        return VersionedPriceStore(config.get('store_root', 'data_versions'))
+    return ColumnarPriceStore(config.get('store_root', 'data_store'), file_format=storage)
+
+if __name__ == '__main__':
+    import sys
+    store = VersionedPriceStore() if 'versioned' in sys.argv[1:] else ColumnarPriceStore()
+    migrated = store.migrate_csv_tree('data')
+    print(f"Migrated {migrated} CSV files into {store.root}")
@@ -0,0 +1,318 @@
+"""
+Single-pass multi-granularity rollups for the analytics stage.
+
+The raw bars are scanned once: every bar is assigned to a (week, month) bucket, the intersection of its week
+and its month, and the partial aggregates of every bucket (sum, count, max, min, last close, first open, volume
+sum) are reduced in one vectorized pass over the sorted bars. Weekly values are combined from the partials of
+their buckets, monthly values from theirs, and yearly values from the monthly partials, so the raw data is never
+resampled again. The output has the same columns and bins as the former `resample('W'/'M'/'Y').agg(...)`
+passes, including the empty bins between the first and the last bar.
+
+Partials are kept as 2-D arrays with one column per series, so the same code rolls up a single ticker or a
+whole panel of tickers at once. `IncrementalRollups` persists the bucket partials of a series, so that a refresh
+only recomputes the buckets from the last, still open one onwards.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+# Output granularities and the pandas frequencies of their bins
+GRANULARITIES = {'weekly': 'W', 'monthly': 'M', 'yearly': 'Y'}
+
+# How each partial aggregate is combined into a coarser bucket
+COMBINE = {'sum': 'sum', 'count': 'sum', 'max': 'max', 'min': 'min', 'last': 'last', 'first': 'first', 'volume': 'sum'}
+
+
+def period_end(days, freq):
+    """Return the label (period end date) of the weekly (W-SUN), monthly or yearly bin of each datetime64[D] day."""
+    if freq == 'W':
+        weekday = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday, Monday is 0
+        return days + (6 - weekday)
+    unit = 'datetime64[M]' if freq == 'M' else 'datetime64[Y]'
+    return (days.astype(unit) + 1).astype('datetime64[D]') - 1
+
+
+def segment_starts(*labels):
+    """Return the first row of every run of equal labels, the labels being sorted."""
+    change = np.zeros(len(labels[0]), dtype=bool)
+    change[:1] = True
+    for label in labels:
+        change[1:] |= label[1:] != label[:-1]
+    return np.flatnonzero(change)
+
+
+def segment_reduce(values, starts, how):
+    """Reduce the rows of a 2-D array per segment, skipping NaN values like the pandas aggregations do."""
+    if how == 'sum':
+        if values.dtype.kind == 'f':
+            values = np.where(np.isnan(values), 0, values)
+        return np.add.reduceat(values, starts, axis=0)
+    if how == 'max':
+        return np.fmax.reduceat(values, starts, axis=0)
+    if how == 'min':
+        return np.fmin.reduceat(values, starts, axis=0)
+    # first/last: position of the first/last non-NaN row of every segment, NaN when the segment has none
+    rows = np.arange(len(values))[:, None]
+    valid = ~np.isnan(values)
+    if how == 'last':
+        position = np.maximum.reduceat(np.where(valid, rows, -1), starts, axis=0)
+        found = position >= starts[:, None]
+    else:
+        ends = np.append(starts[1:], len(values))
+        position = np.minimum.reduceat(np.where(valid, rows, len(values)), starts, axis=0)
+        found = position < ends[:, None]
+    picked = np.take_along_axis(values, np.clip(position, 0, len(values) - 1), axis=0)
+    return np.where(found, picked, np.nan)
+
+
+class RollupEngine:
+    """
+    Computes weekly, monthly and yearly rollups of OHLCV bars from a single scan of the raw data.
+
+    Attributes:
+        close (str): Name of the close price column.
+        open (str): Name of the open price column.
+        volume (str): Name of the volume column.
+        variations (bool): Whether to add the 'variation_$_abs' and 'variation_%_rel' columns.
+
+    Methods:
+        partials(index, close, open_, volume): Scans 2-D arrays of raw bars once into (week, month) bucket partials.
+        combine(partials, freq): Combines bucket partials into weekly or monthly partials, monthly ones into yearly.
+        finalize(partials, freq, column, index_name): Builds the output frame of one series from its partials.
+        finalize_wide(partials, freq, names, index_name): Builds the output frames of all series as one wide frame.
+        rollup(df): Returns the weekly, monthly and yearly frames of a single series.
+    """
+    def __init__(self, close='Close', open='Open', volume='Volume', variations=True):
+        self.close = close
+        self.open = open
+        self.volume = volume
+        self.variations = variations
+
+    def partials(self, index, close, open_, volume):
+        """Aggregate time-sorted raw bars (2-D arrays, one column per series) into partials per (week, month) bucket."""
+        days = pd.DatetimeIndex(index).tz_localize(None).values.astype('datetime64[D]')
+        week, month = period_end(days, 'W'), period_end(days, 'M')
+        starts = segment_starts(week, month)
+        return {
+            'week': week[starts],
+            'month': month[starts],
+            'sum': segment_reduce(close, starts, 'sum'),
+            'count': segment_reduce((~np.isnan(close)).astype(np.int64), starts, 'sum'),
+            'max': segment_reduce(close, starts, 'max'),
+            'min': segment_reduce(close, starts, 'min'),
+            'last': segment_reduce(close, starts, 'last'),
+            'first': segment_reduce(open_, starts, 'first'),
+            'volume': segment_reduce(volume, starts, 'sum'),
+        }
+
+    def combine(self, partials, freq):
+        """Combine (week, month) bucket partials into weekly or monthly partials, or monthly partials into yearly ones."""
+        if freq == 'W':
+            labels = partials['week']
+        elif freq == 'M':
+            labels = partials['month']
+        else:
+            labels = period_end(partials['label'], 'Y')
+        # Buckets are in time order, so the buckets of a bin are always adjacent
+        starts = segment_starts(labels)
+        combined = {stat: segment_reduce(partials[stat], starts, how) for stat, how in COMBINE.items()}
+        combined['label'] = labels[starts]
+        return combined
+
+    def finalize(self, partials, freq, column, index_name='Date'):
+        """Build the output columns of one series from combined partials, adding the empty bins between the first and last one."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = partials['sum'][:, column] / partials['count'][:, column]
+        result = pd.DataFrame({
+            f'{self.close}_mean': mean,
+            f'{self.close}_max': partials['max'][:, column],
+            f'{self.close}_min': partials['min'][:, column],
+            f'{self.close}_last': partials['last'][:, column],
+            f'{self.open}_first': partials['first'][:, column],
+            f'{self.volume}_sum': partials['volume'][:, column],
+        }, index=pd.DatetimeIndex(partials['label'], name=index_name))
+        bins = pd.date_range(result.index.min(), result.index.max(), freq=freq, name=index_name)
+        volume_dtype = result[f'{self.volume}_sum'].dtype
+        result = result.reindex(bins)
+        # Resampling sums an empty bin to 0, the other aggregates of an empty bin are NaN
+        result[f'{self.volume}_sum'] = result[f'{self.volume}_sum'].fillna(0).astype(volume_dtype)
+        if self.variations:
+            result['variation_$_abs'] = result[f'{self.close}_last'] - result[f'{self.open}_first']
+            result['variation_%_rel'] = result['variation_$_abs'] / result[f'{self.open}_first'] * 100
+        return result
+
+    def finalize_wide(self, partials, freq, names, index_name='Date'):
+        """Build the output columns of every series at once, as one frame with (series, column) MultiIndex columns."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            columns = {
+                f'{self.close}_mean': partials['sum'] / partials['count'],
+                f'{self.close}_max': partials['max'],
+                f'{self.close}_min': partials['min'],
+                f'{self.close}_last': partials['last'],
+                f'{self.open}_first': partials['first'],
+                f'{self.volume}_sum': partials['volume'],
+            }
+            if self.variations:
+                columns['variation_$_abs'] = partials['last'] - partials['first']
+                columns['variation_%_rel'] = columns['variation_$_abs'] / partials['first'] * 100
+        labels = pd.DatetimeIndex(partials['label'], name=index_name)
+        bins = pd.date_range(labels.min(), labels.max(), freq=freq, name=index_name)
+        frames = {column: pd.DataFrame(values, index=labels, columns=names).reindex(bins) for column, values in columns.items()}
+        frames[f'{self.volume}_sum'] = frames[f'{self.volume}_sum'].fillna(0)
+        return pd.concat(frames, axis=1).swaplevel(axis=1)
+
+    def rollup_wide(self, partials, names, index_name='Date'):
+        """Return the weekly, monthly and yearly wide frames ((series, column) columns) of all series of the bucket partials."""
+        weekly = self.combine(partials, 'W')
+        monthly = self.combine(partials, 'M')
+        yearly = self.combine(monthly, 'Y')
+        return tuple(self.finalize_wide(combined, freq, names, index_name) for combined, freq in ((weekly, 'W'), (monthly, 'M'), (yearly, 'Y')))
+
+    def rollup_partials(self, partials, names, index_name='Date'):
+        """Return {name: (weekly, monthly, yearly)} for every series of the bucket partials, `names` naming the columns in order."""
+        weekly = self.combine(partials, 'W')
+        monthly = self.combine(partials, 'M')
+        yearly = self.combine(monthly, 'Y')
+        return {
+            name: tuple(self.finalize(combined, freq, column, index_name) for combined, freq in ((weekly, 'W'), (monthly, 'M'), (yearly, 'Y')))
+            for column, name in enumerate(names)
+        }
+
+    def rollup(self, df):
+        """Return the weekly, monthly and yearly rollups of a single OHLCV series."""
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index(kind='stable')
+        partials = self.partials(
+            df.index,
+            df[[self.close]].to_numpy(dtype=float),
+            df[[self.open]].to_numpy(dtype=float),
+            df[[self.volume]].to_numpy(),
+        )
+        return self.rollup_partials(partials, [self.close], df.index.name)[self.close]
+
+
+def take_partials(partials, rows):
+    """Select buckets (a boolean mask or positions) of bucket partials."""
+    return {stat: values[rows] for stat, values in partials.items()}
+
+
+def concat_partials(*parts):
+    """Concatenate bucket partials that follow each other in time."""
+    return {stat: np.concatenate([part[stat] for part in parts]) for stat in parts[0]}
+
+
+class IncrementalRollups:
+    """
+    Persisted rollup state of one (ticker, interval) series, so that a refresh only folds in the new bars.
+
+    The state holds the (week, month) bucket partials of every bar seen so far, which never change once their
+    bucket is closed, and the raw bars of the last, still open bucket. New bars (which may overlap and revise the
+    open bucket) are merged with those raw bars and only the buckets from the open one onwards are recomputed.
+    Revised bars before the open bucket would change closed buckets: the state records `history`, a signature
+    of the stored bars before its open bucket given by the caller, who rebuilds the state from the full history
+    when the signature of the stored series no longer matches it.
+
+    Attributes:
+        engine (RollupEngine): Engine used for the bucket partials and the output frames.
+        path (str): Pickle file holding the state.
+        partials (dict): Bucket partials of all bars seen so far, None before the first build.
+        open_bars (pd.DataFrame): Raw close/open/volume bars of the open bucket.
+        history: Signature of the stored bars before the open bucket when the state was last refreshed.
+
+    Methods:
+        rebuild(bars): Recomputes the state from the full history.
+        update(bars): Folds new bars in, returns the number of recomputed buckets or None if a rebuild is needed.
+        window_partials(start, load_bars): Bucket partials of the bars from `start` onwards.
+        rollup(start, load_bars): Weekly, monthly and yearly frames of the bars from `start` onwards.
+        save(): Writes the state atomically.
+    """
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.path = path
+        self.partials = None
+        self.open_bars = None
+        self.history = None
+        if os.path.exists(path):
+            state = pd.read_pickle(path)
+            self.partials, self.open_bars, self.history = state['partials'], state['open_bars'], state.get('history')
+
+    def bars_partials(self, bars):
+        e = self.engine
+        return self.engine.partials(
+            bars.index,
+            bars[[e.close]].to_numpy(dtype=float),
+            bars[[e.open]].to_numpy(dtype=float),
+            bars[[e.volume]].to_numpy(),
+        )
+
+    def open_start(self):
+        """Timestamp of the first bar of the open bucket, new bars from there onwards can be folded in."""
+        return None if self.open_bars is None else self.open_bars.index[0]
+
+    def split_open(self, bars, partials):
+        """Keep the raw bars of the last bucket of `partials`, which are the last rows of `bars`."""
+        e = self.engine
+        days = bars.index.tz_localize(None).values.astype('datetime64[D]')
+        last = (period_end(days, 'W') == partials['week'][-1]) & (period_end(days, 'M') == partials['month'][-1])
+        self.open_bars = bars.loc[last, [e.close, e.open, e.volume]]
+
+    def rebuild(self, bars):
+        bars = bars.sort_index(kind='stable')
+        self.partials = self.bars_partials(bars)
+        self.split_open(bars, self.partials)
+        return len(self.partials['week'])
+
+    def update(self, bars):
+        """Fold new bars in, returns the number of recomputed buckets (0 if nothing changed) or None if a rebuild is needed."""
+        if self.partials is None:
+            return None
+        if bars is None or bars.empty:
+            return 0
+        bars = bars.sort_index(kind='stable')
+        if bars.index[0] < self.open_start():
+            return None
+        e = self.engine
+        merged = pd.concat([self.open_bars, bars[[e.close, e.open, e.volume]]])
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index(kind='stable')
+        if merged.equals(self.open_bars):
+            return 0
+        fresh = self.bars_partials(merged)
+        # The first fresh bucket replaces the open one, the bucket partials before it are final
+        self.partials = concat_partials(take_partials(self.partials, slice(0, -1)), fresh)
+        self.split_open(merged, fresh)
+        return len(fresh['week'])
+
+    def window_partials(self, start, load_bars):
+        """
+        Bucket partials of the bars from `start` (a day boundary, None for the whole history) onwards.
+
+        A bucket that straddles `start` is recomputed from its raw bars, read with `load_bars(start, end)`.
+        """
+        if start is None:
+            return self.partials
+        start = np.datetime64(pd.Timestamp(start).normalize().date(), 'D')
+        week, month = self.partials['week'], self.partials['month']
+        first_day = np.maximum(week - 6, month.astype('datetime64[M]').astype('datetime64[D]'))
+        last_day = np.minimum(week, month)
+        inside = take_partials(self.partials, first_day >= start)
+        straddle = np.flatnonzero((first_day < start) & (last_day >= start))
+        if not len(straddle):
+            return inside
+        end = pd.Timestamp(last_day[straddle[0]]) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+        head = load_bars(pd.Timestamp(start), end)
+        if head is None or head.empty:
+            return inside
+        return concat_partials(self.bars_partials(head.sort_index(kind='stable')), inside)
+
+    def rollup(self, start, load_bars, index_name='Date'):
+        """Weekly, monthly and yearly frames of the bars from `start` onwards, like RollupEngine.rollup on that window, None if it has no bars."""
+        partials = self.window_partials(start, load_bars)
+        if not len(partials['week']):
+            return None
+        return self.engine.rollup_partials(partials, [self.engine.close], index_name)[self.engine.close]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        pd.to_pickle({'partials': self.partials, 'open_bars': self.open_bars, 'history': self.history}, temporary)
+        os.replace(temporary, self.path)
@@ -0,0 +1,324 @@
+"""
+DAG orchestrator of the data pipeline.
+
+The pipeline is declared as stages (fetch, then analytics) instantiated as one task per (ticker, interval), so
+`analytics:BTC-USD:1h` only waits for `fetch:BTC-USD:1h` and the tasks of different series run side by side on
+a pool of worker processes. The preprocessing and model stages plug in as further entries of STAGES, with
+their upstream stages in `depends`, once data_preprocessor.py and the data_models_* scripts have an entry point.
+
+Every task has an input fingerprint, a hash of:
+
+    - the configuration of its stage, restricted to the task's series,
+    - the code version of its stage, a hash of the source of the modules it runs (see analytics_cache.code_version),
+    - the output fingerprints of its upstream tasks,
+    - for fetch tasks, the current bar of the interval (today for '1d', the current hour for '1h'), the market
+      being an input that only changes with time.
+
+and returns an output fingerprint: for a fetch, the hash of the datasets of the series in the dataset catalog,
+for the analytics, the fingerprints recorded in their artifact directories. A task is skipped only when its
+input fingerprint is the one of its last successful run and the files it produced still exist, so a refetch
+bringing no new bars leaves the analytics untouched while a code or configuration change reruns the affected
+tasks.
+
+The state (`pipeline_state/state.json`) is rewritten atomically after every finished task, so a crashed or
+interrupted run is resumed by running the pipeline again: the finished tasks are skipped, the others run.
+A failing task is reported with its traceback and only blocks its downstream tasks. The timings of every task
+are kept in the state and appended to `pipeline_state/runs.jsonl`, one line per run.
+
+    python scripts/run_pipeline.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import logging
+import traceback
+from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from analytics_cache import AnalyticsCache, code_version
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# One stage of the pipeline: run(ticker, interval, config) returns {'output', 'paths', 'timings'}, `modules` are the scripts its code version covers
+Stage = namedtuple('Stage', ['name', 'run', 'depends', 'modules'])
+
+# One task of the DAG, `depends` holds the names of its upstream tasks
+Task = namedtuple('Task', ['name', 'stage', 'ticker', 'interval', 'depends'])
+
+
+def series_config(config, ticker, interval):
+    """A fetcher or analytics configuration restricted to one (ticker, interval), run in the calling process."""
+    combinations = [(period, combination_interval) for period, combination_interval in config['combinations'] if combination_interval == interval]
+    return {**config, 'tickers': [ticker], 'combinations': combinations, 'workers': 1}
+
+
+def run_fetch(ticker, interval, config):
+    from data_fetcher_v2 import CryptoDataFetcher
+    timings = {}
+    started = time.perf_counter()
+    fetcher = CryptoDataFetcher(config)
+    fetcher.run_data_fetcher()
+    timings['fetch'] = time.perf_counter() - started
+    return {'output': fetcher.catalog.fingerprint(ticker, interval), 'paths': [], 'timings': timings}
+
+
+def run_analytics(ticker, interval, config):
+    from data_analytics_v2 import CryptoAnalytics
+    analytics = CryptoAnalytics(config)
+    paths, timings = [], {}
+    for job in analytics.plan_jobs():
+        result = analytics.run_job(job)
+        paths.extend(result['paths'])
+        for phase, seconds in result['timings'].items():
+            timings[phase] = timings.get(phase, 0.0) + seconds
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(f"{path}|{AnalyticsCache.read_fingerprint(path)}\n".encode())
+    return {'output': digest.hexdigest(), 'paths': sorted(paths), 'timings': timings}
+
+
+STAGES = {
+    'fetch': Stage('fetch', run_fetch, [], ['data_fetcher_v2', 'fetch_executor', 'price_store', 'data_windows', 'dataset_catalog', 'online_indicators', 'indicators', 'rollups', 'memory_profile']),
+    'analytics': Stage('analytics', run_analytics, ['fetch'], ['data_analytics_v2', 'rollups', 'indicators', 'analytics_artifacts', 'analytics_cache', 'price_store', 'data_windows', 'dataset_catalog', 'memory_profile']),
+}
+
+
+# pandas frequency units of the minute, hour and day intervals of the data provider
+BAR_UNITS = {'m': 'min', 'h': 'h', 'd': 'D'}
+
+
+def current_bar(interval, now=None):
+    """Start of the bar of `interval` in progress, the fetch tasks of a series are only repeated once it changes."""
+    now = pd.Timestamp(now or datetime.now())
+    count, unit = re.fullmatch(r'(\d+)(m|h|d|wk|mo)', interval).groups()
+    if unit == 'mo':
+        # Bars of several months (3mo) start in the months that are multiples of their length
+        months = (now.year * 12 + now.month - 1) // int(count) * int(count)
+        return str(pd.Timestamp(year=months // 12, month=months % 12 + 1, day=1))
+    if unit == 'wk':
+        # Weekly bars start on Monday
+        return str(now.normalize() - pd.Timedelta(days=now.weekday()))
+    return str(now.floor(count + BAR_UNITS[unit]))
+
+
+def execute_task(stage_name, ticker, interval, config):
+    """Run one task, returning its result record instead of raising."""
+    started = time.perf_counter()
+    result = {'status': 'ok', 'output': None, 'paths': [], 'timings': {}, 'error': None, 'pid': os.getpid()}
+    try:
+        result.update(STAGES[stage_name].run(ticker, interval, config))
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+class PipelineRunner:
+    """
+    Builds the task DAG of the configured series and runs it, skipping the tasks whose inputs are unchanged.
+
+    Attributes:
+        config (dict): Pipeline configuration, with the configuration of every stage.
+        state_path (str): JSON file with the last successful run of every task.
+        state (dict): Task name -> {'input', 'output', 'paths', 'timings', 'seconds', 'finished_at'}.
+
+    Methods:
+        build_tasks(): Returns the tasks of the DAG in dependency order.
+        input_fingerprint(task, outputs): Hashes the inputs of a task.
+        is_up_to_date(task, fingerprint): Checks whether the last run of a task had the same inputs.
+        run(): Runs the DAG and returns the result record of every task.
+        report(records, seconds): Logs the run summary and the slowest tasks.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.state_path = config.get('state', os.path.join('pipeline_state', 'state.json'))
+        self.state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as file:
+                self.state = json.load(file)
+        # Code versions are computed once per run, a task is rerun whenever the source of its stage changed
+        self.versions = {name: code_version(*[os.path.join(SCRIPTS_DIR, f"{module}.py") for module in stage.modules])
+                         for name, stage in STAGES.items()}
+
+    def build_tasks(self):
+        tasks = {}
+        intervals = list(dict.fromkeys(interval for _, interval in self.config['fetch']['combinations']))
+        for stage_name in self.config['stages']:
+            stage = STAGES[stage_name]
+            for ticker in self.config['fetch']['tickers']:
+                for interval in intervals:
+                    depends = [f"{upstream}:{ticker}:{interval}" for upstream in stage.depends if upstream in self.config['stages']]
+                    name = f"{stage_name}:{ticker}:{interval}"
+                    tasks[name] = Task(name, stage_name, ticker, interval, depends)
+        return tasks
+
+    def task_config(self, task):
+        config = series_config(self.config[task.stage], task.ticker, task.interval)
+        if task.stage == 'fetch':
+            # The downloads of a fetch task run on the threads of its own executor, rate limited by its own token
+            # bucket, so the provider's rate and burst are split between the fetch tasks that can run at the same time
+            config['workers'] = self.config['fetch'].get('workers', 1)
+            executor = config.get('executor', {})
+            if executor.get('rate'):
+                share = self.config.get('slots', {}).get('fetch') or max(1, self.config.get('workers') or 1)
+                config['executor'] = {**executor, 'rate': executor['rate'] / share, 'burst': max(1, executor.get('burst', 1) // share)}
+        return config
+
+    def input_fingerprint(self, task, outputs):
+        inputs = {
+            'config': self.task_config(task),
+            'code': self.versions[task.stage],
+            'upstream': {name: outputs[name] for name in task.depends},
+        }
+        if task.stage == 'fetch':
+            inputs['bar'] = current_bar(task.interval)
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, task, fingerprint):
+        if self.config.get('force'):
+            return False
+        record = self.state.get(task.name)
+        return record is not None and record['input'] == fingerprint and all(os.path.exists(path) for path in record['paths'])
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(self.state, file, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def finish(self, task, fingerprint, result):
+        """Record a successful task in the state file, right away so that a crash later in the run keeps it."""
+        self.state[task.name] = {
+            'input': fingerprint,
+            'output': result['output'],
+            'paths': result['paths'],
+            'timings': result['timings'],
+            'seconds': result['seconds'],
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.save_state()
+
+    def run(self):
+        """
+        Run every task once its upstream tasks are done, at most `workers` at a time and `slots[stage]` per stage.
+
+        Returns {task name: {'status': 'ok' | 'skipped' | 'failed' | 'blocked', 'seconds', 'timings', 'error'}}.
+        """
+        started = time.perf_counter()
+        tasks = self.build_tasks()
+        workers = max(1, self.config.get('workers') or 1)
+        slots = self.config.get('slots', {})
+        logging.info(f"Running {len(tasks)} pipeline tasks on {workers} workers.")
+        pending = dict(tasks)
+        outputs, records, running = {}, {}, {}
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            while pending or running:
+                for task in list(pending.values()):
+                    if any(records.get(name, {}).get('status') in ('failed', 'blocked') for name in task.depends):
+                        del pending[task.name]
+                        records[task.name] = {'status': 'blocked', 'seconds': 0.0, 'timings': {}, 'error': None}
+                        logging.warning(f"Pipeline task {task.name} blocked by a failed upstream task.")
+                        continue
+                    if not all(name in outputs for name in task.depends):
+                        continue
+                    fingerprint = self.input_fingerprint(task, outputs)
+                    if self.is_up_to_date(task, fingerprint):
+                        del pending[task.name]
+                        outputs[task.name] = self.state[task.name]['output']
+                        records[task.name] = {'status': 'skipped', 'seconds': 0.0, 'timings': {}, 'error': None}
+                        logging.info(f"Pipeline task {task.name} is up to date, skipped.")
+                        continue
+                    busy = sum(1 for other, _ in running.values() if other.stage == task.stage)
+                    if len(running) >= workers or busy >= slots.get(task.stage, workers):
+                        continue
+                    del pending[task.name]
+                    logging.info(f"Starting pipeline task {task.name}.")
+                    arguments = (task.stage, task.ticker, task.interval, self.task_config(task))
+                    if pool is None:
+                        running[task.name] = (task, fingerprint)
+                        self.complete(task, fingerprint, execute_task(*arguments), outputs, records)
+                        del running[task.name]
+                    else:
+                        running[pool.submit(execute_task, *arguments)] = (task, fingerprint)
+                if not running:
+                    # Every remaining task waits on a skipped or finished one, they are scheduled by the next pass
+                    if pending and not any(all(name in outputs or name in records for name in task.depends) for task in pending.values()):
+                        raise ValueError(f"Pipeline tasks with unknown dependencies: {sorted(pending)}")
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, fingerprint = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        # The worker itself died (e.g. killed or out of memory), the other tasks go on
+                        result = {'status': 'failed', 'output': None, 'paths': [], 'timings': {}, 'error': traceback.format_exc(), 'seconds': 0.0}
+                    self.complete(task, fingerprint, result, outputs, records)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        seconds = time.perf_counter() - started
+        self.report(records, seconds)
+        self.log_run(records, seconds)
+        return records
+
+    def complete(self, task, fingerprint, result, outputs, records):
+        records[task.name] = {name: result[name] for name in ('status', 'seconds', 'timings', 'error')}
+        if result['status'] == 'ok':
+            outputs[task.name] = result['output']
+            self.finish(task, fingerprint, result)
+            logging.info(f"Pipeline task {task.name} finished in {result['seconds']:.2f}s.")
+        else:
+            logging.error(f"Pipeline task {task.name} failed:\n{result['error']}")
+
+    def log_run(self, records, seconds):
+        """Append the per-task timings of the run to runs.jsonl next to the state file."""
+        path = os.path.join(os.path.dirname(self.state_path) or '.', 'runs.jsonl')
+        run = {'finished_at': datetime.now().isoformat(timespec='seconds'), 'seconds': seconds,
+               'tasks': {name: {'status': record['status'], 'seconds': record['seconds'], 'timings': record['timings']} for name, record in records.items()}}
+        with open(path, 'a') as file:
+            file.write(json.dumps(run) + '\n')
+
+    def report(self, records, seconds):
+        counts = {}
+        for record in records.values():
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+        busy = sum(record['seconds'] or 0.0 for record in records.values())
+        logging.info(f"Pipeline finished {len(records)} tasks in {seconds:.2f}s ({busy:.2f}s of task time): "
+                     + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+        ran = [(name, record) for name, record in records.items() if record['status'] in ('ok', 'failed')]
+        for name, record in sorted(ran, key=lambda item: item[1]['seconds'] or 0.0, reverse=True)[:5]:
+            phases = ', '.join(f"{phase} {value:.2f}s" for phase, value in record['timings'].items())
+            logging.info(f"  {name}: {(record['seconds'] or 0.0):.2f}s ({phases})")
+
+
+def pipeline_config():
+    from data_fetcher_v2 import config_fetcher
+    from data_analytics_v2 import config_analytics
+    return {
+        "stages": ["fetch", "analytics"],  # Stages to run, in dependency order, see STAGES
+        "fetch": config_fetcher,  # Fetcher configuration, its tickers and combinations define the (ticker, interval) series of the DAG
+        "analytics": config_analytics,  # Analytics configuration, run for the same series
+        "workers": os.cpu_count(),  # Worker processes running the tasks, 1 runs them one after the other in this process
+        "slots": {"fetch": 2},  # Maximum concurrent tasks of a stage, each fetch task gets its share of the fetcher's executor rate
+        "state": os.path.join('pipeline_state', 'state.json'),  # Last successful run of every task, runs.jsonl is written next to it
+        "force": False,  # Rerun every task even if its inputs are unchanged
+    }
+
+
+if __name__ == '__main__':
+    config_pipeline = pipeline_config()
+    if '--force' in sys.argv[1:]:
+        config_pipeline['force'] = True
+    records = PipelineRunner(config_pipeline).run()
+    sys.exit(1 if any(record['status'] == 'failed' for record in records.values()) else 0)
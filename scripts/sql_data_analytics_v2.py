@@ -1,140 +1,154 @@
-
-import os
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
-
-def mysql_connect():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="admin0000",
-        database="crypto_data"
-    )
-
-class MySQLLogHandler(logging.Handler):
-    def __init__(self, db_connection):
-        super().__init__()
-        self.db_connection = db_connection
-    def emit(self, record):
-        log_message = self.format(record)
-        cursor = self.db_connection.cursor()
-        raw_data_id = None
-        if record.args:
-            if isinstance(record.args, (list, tuple)) and len(record.args) > 0:
-                raw_data_id = record.args[0] if isinstance(record.args[0], int) else None
-            elif isinstance(record.args, dict):
-                raw_data_id = record.args.get('raw_data_id')
-        try:
-            cursor.execute(
-                "INSERT INTO logs (raw_data_id, log_date, log_class, log_method, log_level, message) VALUES (%s, NOW(), %s, %s, %s, %s)",
-                (raw_data_id, record.name, record.funcName, record.levelname, log_message)
-            )
-            self.db_connection.commit()
-        except Error as e:
-            print(f"Failed to log to database: {e}")
-        finally:
-            cursor.close()
+from sql_logging import MySQLLogHandler
+from sql_pool import get_pool
+from sql_ingest import BulkAnalyticsWriter
+from sql_loader import load_frame, PRICES_QUERY
+from memory_profile import apply_profile
+from rollups import RollupEngine
 
 # Custom logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-db_connection = mysql_connect()
-logger.addHandler(MySQLLogHandler(db_connection))
+# Log records are written in batches by a background thread on its own pooled connection
+logger.addHandler(MySQLLogHandler(get_pool()))
+
+# Partial aggregates of every (week, month) bucket of a dataset, the same partials as RollupEngine.partials.
+# Weeks end on Sunday (W-SUN), first/last skip NULL values like the pandas aggregations skip NaN.
+BUCKET_QUERY = """
+SELECT week_end, month_end,
+    COALESCE(SUM(close), 0), COUNT(close), MAX(close), MIN(close),
+    MAX(CASE WHEN last_rank = 1 THEN close END),
+    MAX(CASE WHEN first_rank = 1 THEN open END),
+    CAST(COALESCE(SUM(volume), 0) AS SIGNED)
+FROM (
+    SELECT close, open, volume,
+        DATE(date) + INTERVAL (6 - WEEKDAY(date)) DAY AS week_end,
+        LAST_DAY(date) AS month_end,
+        ROW_NUMBER() OVER (bucket ORDER BY close IS NULL, date DESC, prices.id DESC) AS last_rank,
+        ROW_NUMBER() OVER (bucket ORDER BY open IS NULL, date, prices.id) AS first_rank
+    FROM prices
+    INNER JOIN raw_data ON prices.raw_data_id = raw_data.id
+    WHERE raw_data.ticker = %s AND raw_data.period = %s AND raw_data.frequency = %s
+    WINDOW bucket AS (PARTITION BY DATE(date) + INTERVAL (6 - WEEKDAY(date)) DAY, LAST_DAY(date))
+) AS bars
+GROUP BY week_end, month_end
+ORDER BY week_end, month_end
+"""
 
 class CryptoAnalytics:
-    def __init__(self, config):
+    """
+    Computes the weekly, monthly and yearly analytics of the SQL price data and stores them in the analytics table.
+
+    With `aggregation` set to 'sql' (the default) MySQL groups the prices into (week, month) buckets and only the
+    bucket partials are transferred, the rollup engine then combines them into the output frames. 'pandas' loads
+    every price row and rolls them up client-side, 'validate' runs both and logs their largest difference.
+    """
+    def __init__(self, config, pool=None):
         self.config = config
-        self.connection = mysql_connect()
+        # Connections are opened lazily by the shared pool on first use
+        self.pool = pool or get_pool(config.get('pool_size', 4))
+        # Lowercase SQL column names, the SQL results have no variation columns
+        self.rollups = RollupEngine(close='close', open='open', volume='volume', variations=False)
         logging.info("CryptoAnalytics class initialized with configuration.")
     
     def load_data(self, ticker, period, interval):
-        """ Load data from SQL based on provided ticker, period, and interval. """
+        """ Load data from SQL based on provided ticker, period, and interval, streamed into typed columns. """
         frequency = 'Hourly' if '1h' in interval else 'Daily'
-        cursor = self.connection.cursor()
-        query = """
-        SELECT date, open, high, low, close, adj_close, volume FROM prices
-        INNER JOIN raw_data ON prices.raw_data_id = raw_data.id
-        WHERE raw_data.ticker = %s AND raw_data.period = %s AND raw_data.frequency = %s
-        ORDER BY date
-        """
-        cursor.execute(query, (ticker, period, frequency))
-        data = cursor.fetchall()
-        df = pd.DataFrame(data, columns=['date', 'open', 'high', 'low', 'close', 'adj_close', 'volume'])
-        df.set_index('date', inplace=True)
-        cursor.close()
-        return df if not df.empty else None
-    
+        df = load_frame(self.pool, PRICES_QUERY, (ticker, period, frequency),
+                        chunk_size=self.config.get('chunk_size', 50000), price_dtype=self.config.get('price_dtype', 'float64'))
+        return apply_profile(df, self.config.get('memory_profile', 'default'), f"{ticker} {period} {interval}")
+
+    def load_partials(self, ticker, period, interval):
+        """ Aggregate the prices of a dataset into (week, month) bucket partials inside MySQL, None if it has no rows. """
+        frequency = 'Hourly' if '1h' in interval else 'Daily'
+        with self.pool.cursor(commit=False) as cursor:
+            cursor.execute(BUCKET_QUERY, (ticker, period, frequency))
+            rows = cursor.fetchall()
+        if not rows:
+            return None
+        week, month, total, count, high, low, last, first, volume = zip(*rows)
+        column = lambda values, dtype: np.array(values, dtype=dtype).reshape(-1, 1)
+        return {
+            'week': np.array(week, dtype='datetime64[D]'),
+            'month': np.array(month, dtype='datetime64[D]'),
+            'sum': column(total, float),
+            'count': column(count, np.int64),
+            'max': column(high, float),
+            'min': column(low, float),
+            'last': column(last, float),
+            'first': column(first, float),
+            'volume': column(volume, np.int64),
+        }
+
+    def calculate_analytics_sql(self, ticker, period, interval):
+        """ Calculate the weekly, monthly and yearly analytics from bucket partials aggregated by MySQL. """
+        partials = self.load_partials(ticker, period, interval)
+        if partials is None:
+            return None
+        return self.rollups.rollup_partials(partials, [self.rollups.close], 'date')[self.rollups.close]
+
+    def validate(self, sql_results, pandas_results, ticker, period, interval):
+        """ Log the largest difference between the SQL and the pandas rollups, which only differ by floating point rounding. """
+        for name, sql_df, pandas_df in zip(('Weekly', 'Monthly', 'Yearly'), sql_results, pandas_results):
+            if not sql_df.index.equals(pandas_df.index):
+                logger.error("%s analytics of %s %s %s have different bins in SQL and pandas", name, ticker, period, interval)
+                continue
+            difference = ((sql_df - pandas_df).abs() / pandas_df.abs().where(pandas_df != 0, 1)).max().max()
+            logger.info("%s analytics of %s %s %s: largest relative SQL/pandas difference %.2e", name, ticker, period, interval, difference)
+
     def calculate_analytics(self, df):
-        """ Calculate weekly, monthly, and yearly analytics. """
+        """ Calculate weekly, monthly, and yearly analytics in a single pass over the data. """
         if df is None:
             return None, None, None
         df.index = pd.to_datetime(df.index)
-        weekly = df.resample('W').agg({
-            'close': ['mean', 'max', 'min', 'last'],
-            'open': 'first',
-            'volume': 'sum'
-        })
-        monthly = df.resample('M').agg({
-            'close': ['mean', 'max', 'min', 'last'],
-            'open': 'first',
-            'volume': 'sum'
-        })
-        yearly = df.resample('Y').agg({
-            'close': ['mean', 'max', 'min', 'last'],
-            'open': 'first',
-            'volume': 'sum'
-        })
-        return self.flatten_columns(weekly), self.flatten_columns(monthly), self.flatten_columns(yearly)
-    
-    def flatten_columns(self, resampled_df):
-        """ Flatten the multi-level columns after resampling. """
-        resampled_df.columns = ['_'.join(col).strip() for col in resampled_df.columns.values]
-        print("Flattened columns:", resampled_df.columns)  # Debug print to check column names
-        return resampled_df
+        return self.rollups.rollup(df)
     
     def save_analytics(self, weekly, monthly, yearly, ticker, period, interval):
-        """ Save analytics data to SQL. """
+        """ Save analytics data to SQL, all granularities in one transaction. """
         data_identifier = f"{ticker.replace('-USD', '')}_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}"
-        self.store_results(weekly, 'Weekly', ticker, period, interval, data_identifier)
-        self.store_results(monthly, 'Monthly', ticker, period, interval, data_identifier)
-        self.store_results(yearly, 'Yearly', ticker, period, interval, data_identifier)
-    
+        self.write_results({'Weekly': weekly, 'Monthly': monthly, 'Yearly': yearly}, ticker, period, interval, data_identifier)
+
     def store_results(self, results_df, metric, ticker, period, interval, data_identifier):
         """ Store analytics results into the SQL database. """
-        cursor = self.connection.cursor()
-        calculation_date = datetime.now()
-        if results_df is not None:
-            for column_name in results_df.columns:
-                series = results_df[column_name]
-                for index, value in series.items():  # Correctly use .items() for Series
-                    cursor.execute(
-                        "INSERT INTO analytics (data_identifier, ticker, period, frequency, metric, value_type, value, calculation_date) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
-                        (data_identifier, ticker, period, 'Hourly' if '1h' in interval else 'Daily', metric, column_name, float(value), calculation_date)
-                    )
-                    self.connection.commit()
-        cursor.close()
+        self.write_results({metric: results_df}, ticker, period, interval, data_identifier)
+
+    def write_results(self, results, ticker, period, interval, data_identifier):
+        """ Upsert {metric: frame} results, keyed on data_identifier, metric, value_type and period end. """
+        with self.pool.connection() as connection:
+            writer = BulkAnalyticsWriter(connection, batch_size=self.config.get('batch_size', 5000))
+            stats = writer.write_results(results, data_identifier, ticker, period, 'Hourly' if '1h' in interval else 'Daily', datetime.now())
+        logger.info("Stored analytics values for %s: %d at %.0f rows/s", data_identifier, stats['rows'], stats['rows_per_second'])
 
     def run_analytics(self):
         logging.info("Starting the analytics process for all configured tickers and timeframes.")
+        aggregation = self.config.get('aggregation', 'sql')
         for ticker in self.config['tickers']:
             for period, interval in self.config['combinations']:
-                df = self.load_data(ticker, period, interval)
-                if df is not None:
-                    weekly, monthly, yearly = self.calculate_analytics(df)
-                    self.save_analytics(weekly, monthly, yearly, ticker, period, interval)
+                if aggregation == 'pandas':
+                    results = self.calculate_analytics(self.load_data(ticker, period, interval))
                 else:
+                    results = self.calculate_analytics_sql(ticker, period, interval)
+                if results is None or results[0] is None:
                     logging.warning(f"No data available for analysis for {ticker}, {period}, {interval}.")
+                    continue
+                if aggregation == 'validate':
+                    self.validate(results, self.calculate_analytics(self.load_data(ticker, period, interval)), ticker, period, interval)
+                weekly, monthly, yearly = results
+                self.save_analytics(weekly, monthly, yearly, ticker, period, interval)
     def close(self):
-        if self.connection.is_connected():
-            self.connection.close()
-            logging.info("Database connection closed.")
+        self.pool.close_all()
+        logging.info("Database connections closed.")
 
 
 # Configuration for data fetching
 config_analytics = {
+  "aggregation": "sql",  # 'sql' aggregates the buckets in MySQL, 'pandas' loads every price row, 'validate' runs both and compares them
+  "chunk_size": 50000,  # Rows read per round trip by the streaming price loader
+  "price_dtype": "float64",  # 'float32' halves the memory of the loaded prices
+  "memory_profile": "default",  # 'compact' also drops adj_close when it duplicates close, see memory_profile.py
   "tickers": ["BTC-USD", "ETH-USD", "ADA-USD", "BNB-USD", "SOL-USD"],
   "combinations": [
     ('max', '1d'), 
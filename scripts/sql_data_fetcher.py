@@ -1,9 +1,12 @@
-import mysql.connector
 from mysql.connector import Error
 import pandas as pd
 import yfinance as yf
 from datetime import datetime
 import logging
+from sql_logging import MySQLLogHandler
+from sql_pool import get_pool
+from fetch_executor import ConcurrentFetchExecutor, FetchJob, YahooFinanceProvider
+from sql_ingest import BulkPriceWriter
 
 """
 This script, data_fetcher_v3.py, is designed to fetch and manage cryptocurrency data using the Yahoo Finance API.
@@ -16,72 +19,28 @@ Features:
 - Logs all operations with detailed metadata linking logs to data entries.
 
 Usage:
-Configure the MySQL database parameters and run the script to start fetching data as configured in the `config_fetcher` dictionary.
+Configure the MySQL database parameters in `sql_pool.DB_CONFIG` and run the script to start fetching data as configured in the `config_fetcher` dictionary.
 """
 
-def mysql_connect():
-    return mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="admin0000",
-        database="crypto_data"
-    )
-
-class MySQLLogHandler(logging.Handler):
-    """
-    Fetches cryptocurrency data from Yahoo Finance and stores it in a MySQL database along with operational logs.
-
-    Attributes:
-        config (dict): Configuration dictionary specifying tickers and their respective fetch intervals and periods.
-
-    Methods:
-        fetch_data: Retrieves data from Yahoo Finance for a specified ticker, interval, and period.
-        save_data: Stores fetched data in the MySQL database and logs operations.
-        run: Executes the data fetching and saving process for all configured tickers and intervals.
-        close: Closes the database connection.
-    """
-    def __init__(self, db_connection):
-        super().__init__()
-        self.db_connection = db_connection
-
-    def emit(self, record):
-        log_message = self.format(record)
-        cursor = self.db_connection.cursor()
-        # Properly handle record.args
-        raw_data_id = None
-        if record.args:
-            if isinstance(record.args, (list, tuple)) and len(record.args) > 0:
-                raw_data_id = record.args[0] if isinstance(record.args[0], int) else None
-            elif isinstance(record.args, dict):
-                raw_data_id = record.args.get('raw_data_id')
-
-        try:
-            cursor.execute(
-                "INSERT INTO logs (raw_data_id, log_date, log_class, log_method, log_level, message) VALUES (%s, NOW(), %s, %s, %s, %s)",
-                (raw_data_id, record.name, record.funcName, record.levelname, log_message)
-            )
-            self.db_connection.commit()
-        except Error as e:
-            print(f"Failed to log to database: {e}")
-        finally:
-            cursor.close()
-
-
 # Custom logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-db_connection = mysql_connect()
-logger.addHandler(MySQLLogHandler(db_connection))
+# Log records are written in batches by a background thread on its own pooled connection
+logger.addHandler(MySQLLogHandler(get_pool()))
 
 class CryptoDataFetcher:
-    def __init__(self, config):
+    def __init__(self, config, pool=None):
         self.config = config
-        self.connection = mysql_connect()
+        # Connections are opened lazily by the shared pool on first use
+        self.pool = pool or get_pool(config.get('pool_size', 4))
         logger.info("CryptoDataFetcher initialized with config: %s", config)
 
     def fetch_data(self, ticker, period, interval):
         logger.info("Starting data retrieval for %s, period %s, interval %s", ticker, period, interval)
         data = yf.download(ticker, period=period, interval=interval)
+        return self.prepare_data(data)
+
+    def prepare_data(self, data):
         data.reset_index(inplace=True)
         if 'Datetime' in data.columns:
             data.rename(columns={'Datetime': 'Date'}, inplace=True)
@@ -92,61 +51,70 @@ class CryptoDataFetcher:
             logger.warning("No data retrieved for %s", ticker)
             return
         data_identifier = f"{ticker.replace('-USD', '')}_{period}_{interval}_{datetime.now().strftime('%Y%m%d')}"
-        cursor = self.connection.cursor()
-
-        # Check data freshness
-        cursor.execute("SELECT id FROM raw_data WHERE data_identifier = %s", (data_identifier,))
-        existing_entry = cursor.fetchone()
-        if existing_entry:
-            logger.info("Data already exists for identifier %s with ID %s", data_identifier, existing_entry[0])
-            return
-
-        # Data preparation
-        fetch_date = datetime.now()
-        data_start_date = data['Date'].min()
-        data_end_date = data['Date'].max()
-        data_duration = str(data_end_date - data_start_date)
-        data_size_mb = (data.to_csv(index=False).encode('utf-8').__sizeof__() / 1024 ** 2)
-
-        # Metadata insertion
-        try:
-            cursor.execute(
-                "INSERT INTO raw_data (data_identifier, ticker, frequency, period, time_interval, fetch_date, data_start_date, data_end_date, data_duration, data_size_mb) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                (data_identifier, ticker, 'Hourly' if '1h' in interval else 'Daily', period, interval, fetch_date, data_start_date, data_end_date, data_duration, data_size_mb)
-            )
-            raw_data_id = cursor.lastrowid
-            self.connection.commit()
-            logger.info("Metadata saved with ID %d", raw_data_id)
-        except Error as e:
-            logger.error("Failed to save metadata for %s: %s", ticker, e)
-            return
-
-        # Prices data insertion
-        for _, row in data.iterrows():
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
             try:
-                cursor.execute(
-                    "INSERT INTO prices (raw_data_id, data_identifier, date, open, high, low, close, adj_close, volume) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                    (raw_data_id, data_identifier, row['Date'], row['Open'], row['High'], row['Low'], row['Close'], row['Adj Close'], row['Volume'])
-                )
-                self.connection.commit()
-            except Error as e:
-                logger.error("Failed to insert price data for %s: %s", ticker, e)
-
-        cursor.close()
+                # Check data freshness
+                cursor.execute("SELECT id FROM raw_data WHERE data_identifier = %s", (data_identifier,))
+                existing_entry = cursor.fetchone()
+                if existing_entry:
+                    logger.info("Data already exists for identifier %s with ID %s", data_identifier, existing_entry[0], extra={'raw_data_id': existing_entry[0]})
+                    return
+
+                # Data preparation
+                fetch_date = datetime.now()
+                data_start_date = data['Date'].min()
+                data_end_date = data['Date'].max()
+                data_duration = str(data_end_date - data_start_date)
+                data_size_mb = (data.to_csv(index=False).encode('utf-8').__sizeof__() / 1024 ** 2)
+
+                # Metadata insertion
+                try:
+                    cursor.execute(
+                        "INSERT INTO raw_data (data_identifier, ticker, frequency, period, time_interval, fetch_date, data_start_date, data_end_date, data_duration, data_size_mb) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                        (data_identifier, ticker, 'Hourly' if '1h' in interval else 'Daily', period, interval, fetch_date, data_start_date, data_end_date, data_duration, data_size_mb)
+                    )
+                    raw_data_id = cursor.lastrowid
+                    connection.commit()
+                    logger.info("Metadata saved with ID %d", raw_data_id, extra={'raw_data_id': raw_data_id})
+                except Error as e:
+                    logger.error("Failed to save metadata for %s: %s", ticker, e)
+                    return
+
+                # Prices data insertion, batched with one transaction per chunk
+                writer = BulkPriceWriter(connection, batch_size=self.config.get('batch_size', 5000), method=self.config.get('ingest_method', 'executemany'))
+                try:
+                    stats = writer.insert_prices(raw_data_id, data_identifier, data)
+                    logger.info("Inserted price rows for %s: %d at %.0f rows/s", data_identifier, stats['rows'], stats['rows_per_second'], extra={'raw_data_id': raw_data_id})
+                except (Error, ValueError) as e:
+                    logger.error("Failed to insert price data for %s: %s", ticker, e)
+            finally:
+                cursor.close()
 
     def run(self):
+        workers = self.config.get('workers', 1)
+        if workers > 1:
+            # Downloads run concurrently, saving stays on the executor's single saver thread
+            jobs = [FetchJob(ticker, period, interval) for ticker in self.config['tickers'] for period, interval in self.config['combinations']]
+            executor = ConcurrentFetchExecutor(YahooFinanceProvider(), workers=workers, **self.config.get('executor', {}))
+            executor.run(jobs, lambda job, data: self.save_data(self.prepare_data(data), job.ticker, job.period, job.interval))
+            return
         for ticker in self.config['tickers']:
             for period, interval in self.config['combinations']:
                 data = self.fetch_data(ticker, period, interval)
                 self.save_data(data, ticker, period, interval)
 
     def close(self):
-        if self.connection.is_connected():
-            self.connection.close()
-            logger.info("Database connection closed.")
+        self.pool.close_all()
+        logger.info("Database connections closed.")
 
 # Configuration for data fetching
 config_fetcher = {
+  "workers": 4,  # Concurrent downloads, 1 runs the jobs one after the other
+  "executor": {"rate": 2.0, "burst": 4, "retries": 3, "backoff": 1.0, "timeout": 60.0, "queue_size": 8},
+  "batch_size": 5000,  # Price rows per executemany call and transaction
+  "ingest_method": "executemany",  # 'load_data' uses LOAD DATA LOCAL INFILE, which needs allow_local_infile=True
+  "pool_size": 4,  # Maximum number of pooled database connections
   "tickers": ["XRP-USD"],
   "combinations": [
     ('max', '1d'), 
@@ -165,4 +133,3 @@ if __name__ == '__main__':
         fetcher.run()
     finally:
         fetcher.close()
-        db_connection.close()
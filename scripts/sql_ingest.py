@@ -0,0 +1,241 @@
+"""
+Bulk ingestion of price data into the `prices` table and of analytics results into the `analytics` table.
+
+Rows are converted to native Python values in one vectorized step and written with batched `executemany`
+calls, one transaction per chunk, instead of one INSERT and COMMIT per row. For MySQL the rows can also be
+streamed with `LOAD DATA LOCAL INFILE` from a CSV built in an in-memory buffer (the connection must be opened
+with `allow_local_infile=True`). Analytics frames are melted into one long-format table in a single vectorized
+step and upserted in one transaction, so re-running the analytics for a dataset is idempotent. The writers work
+against any DB-API connection, `sqlite_connect` provides an in-memory SQLite stand-in with the same tables for
+testing without a MySQL server.
+"""
+import io
+import os
+import time
+import logging
+import sqlite3
+import tempfile
+import pandas as pd
+
+PRICE_COLUMNS = ['raw_data_id', 'data_identifier', 'date', 'open', 'high', 'low', 'close', 'adj_close', 'volume']
+ANALYTICS_COLUMNS = ['data_identifier', 'ticker', 'period', 'frequency', 'metric', 'value_type', 'period_end', 'value', 'calculation_date']
+ANALYTICS_KEY = ['data_identifier', 'metric', 'value_type', 'period_end']
+
+
+def sqlite_connect(path=':memory:'):
+    """Open a SQLite connection with the raw_data and prices tables of sql_setup, as a local stand-in for MySQL."""
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+    CREATE TABLE IF NOT EXISTS raw_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_identifier VARCHAR(255),
+        ticker VARCHAR(255),
+        frequency VARCHAR(50),
+        period VARCHAR(255),
+        time_interval VARCHAR(255),
+        fetch_date DATETIME,
+        data_start_date DATETIME,
+        data_end_date DATETIME,
+        data_duration VARCHAR(255),
+        data_size_mb FLOAT
+    );
+    CREATE TABLE IF NOT EXISTS prices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_data_id INT REFERENCES raw_data (id),
+        data_identifier VARCHAR(255),
+        date DATETIME,
+        open FLOAT,
+        high FLOAT,
+        low FLOAT,
+        close FLOAT,
+        adj_close FLOAT,
+        volume BIGINT
+    );
+    CREATE TABLE IF NOT EXISTS analytics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_data_id INT REFERENCES raw_data (id),
+        data_identifier VARCHAR(255),
+        ticker VARCHAR(255),
+        period VARCHAR(255),
+        frequency VARCHAR(50),
+        metric VARCHAR(255),
+        value_type VARCHAR(255),
+        period_end DATE,
+        value FLOAT,
+        calculation_date DATETIME,
+        UNIQUE (data_identifier, metric, value_type, period_end)
+    );
+    """)
+    return connection
+
+
+def default_placeholder(connection):
+    """Return the parameter placeholder of a connection's driver, '?' for SQLite and '%s' for MySQL."""
+    return '?' if isinstance(connection, sqlite3.Connection) else '%s'
+
+
+class BulkPriceWriter:
+    """
+    Writes price rows in batches, reporting the achieved throughput.
+
+    Attributes:
+        connection: DB-API connection (mysql.connector or sqlite3).
+        batch_size (int): Number of rows per executemany call and transaction.
+        method (str): 'executemany' (default, any database) or 'load_data' (MySQL LOAD DATA LOCAL INFILE).
+        placeholder (str): Parameter placeholder of the driver, '%s' for MySQL and '?' for SQLite.
+
+    Methods:
+        build_rows(raw_data_id, data_identifier, data): Converts a price frame into a list of row tuples.
+        check_raw_data(raw_data_id): Raises ValueError if no raw_data row has the given id.
+        insert_prices(raw_data_id, data_identifier, data): Writes a price frame, returns the ingestion statistics.
+    """
+    def __init__(self, connection, batch_size=5000, method='executemany', placeholder=None):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.method = method
+        self.placeholder = placeholder or default_placeholder(connection)
+
+    def build_frame(self, raw_data_id, data_identifier, data):
+        """Select and convert the price columns in one vectorized step, NaN values become NULL."""
+        frame = pd.DataFrame({
+            'raw_data_id': raw_data_id,
+            'data_identifier': data_identifier,
+            'date': pd.to_datetime(data['Date']).dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'open': data['Open'].astype(float),
+            'high': data['High'].astype(float),
+            'low': data['Low'].astype(float),
+            'close': data['Close'].astype(float),
+            'adj_close': data['Adj Close'].astype(float) if 'Adj Close' in data.columns else data['Close'].astype(float),
+            'volume': data['Volume'],
+        })
+        return frame.astype(object).where(frame.notna(), None)
+
+    def build_rows(self, raw_data_id, data_identifier, data):
+        # The object conversion in build_frame yields native Python values that every driver can bind
+        return list(self.build_frame(raw_data_id, data_identifier, data).itertuples(index=False, name=None))
+
+    def insert_executemany(self, raw_data_id, data_identifier, data):
+        placeholders = ', '.join([self.placeholder] * len(PRICE_COLUMNS))
+        query = f"INSERT INTO prices ({', '.join(PRICE_COLUMNS)}) VALUES ({placeholders})"
+        rows = self.build_rows(raw_data_id, data_identifier, data)
+        cursor = self.connection.cursor()
+        try:
+            for offset in range(0, len(rows), self.batch_size):
+                cursor.executemany(query, rows[offset:offset + self.batch_size])
+                self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        return len(rows)
+
+    def insert_load_data(self, raw_data_id, data_identifier, data):
+        frame = self.build_frame(raw_data_id, data_identifier, data)
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False, na_rep='\\N', lineterminator='\n')
+        # mysql.connector can only stream LOAD DATA LOCAL from a file, so the buffer is spilled to a temporary one
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(buffer.getvalue())
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE prices FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                f"LINES TERMINATED BY '\\n' ({', '.join(PRICE_COLUMNS)})",
+                (file.name,)
+            )
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+            os.remove(file.name)
+        return len(frame)
+
+    def check_raw_data(self, raw_data_id):
+        # The partitioned prices table has no foreign key to raw_data, so the reference is checked before writing
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SELECT 1 FROM raw_data WHERE id = {self.placeholder}", (raw_data_id,))
+            found = cursor.fetchone() is not None
+        finally:
+            cursor.close()
+        if not found:
+            raise ValueError(f"No raw_data row with id {raw_data_id}, refusing to write orphaned prices")
+
+    def insert_prices(self, raw_data_id, data_identifier, data):
+        """Write all rows of a price frame and return {'rows', 'seconds', 'rows_per_second'}."""
+        self.check_raw_data(raw_data_id)
+        started = time.perf_counter()
+        if self.method == 'load_data':
+            rows = self.insert_load_data(raw_data_id, data_identifier, data)
+        else:
+            rows = self.insert_executemany(raw_data_id, data_identifier, data)
+        seconds = time.perf_counter() - started
+        stats = {'rows': rows, 'seconds': seconds, 'rows_per_second': rows / seconds if seconds > 0 else float('inf')}
+        logging.debug(f"Ingested {rows} price rows for {data_identifier} via {self.method} in {seconds:.3f}s ({stats['rows_per_second']:.0f} rows/s)")
+        return stats
+
+
+class BulkAnalyticsWriter:
+    """
+    Upserts analytics results in batches, one transaction per dataset.
+
+    Attributes:
+        connection: DB-API connection (mysql.connector or sqlite3).
+        batch_size (int): Number of rows per executemany call.
+        placeholder (str): Parameter placeholder of the driver, '%s' for MySQL and '?' for SQLite.
+
+    Methods:
+        build_frame(results, ...): Melts {metric: frame} results into one long-format frame.
+        write_results(results, ...): Upserts all results of a dataset, returns the ingestion statistics.
+    """
+    def __init__(self, connection, batch_size=5000, placeholder=None):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.placeholder = placeholder or default_placeholder(connection)
+
+    def build_frame(self, results, data_identifier, ticker, period, frequency, calculation_date):
+        """Melt the {metric: results frame} mapping into (metric, value_type, period_end, value) rows, without NaN values."""
+        frames = {metric: df for metric, df in results.items() if df is not None and not df.empty}
+        if not frames:
+            return pd.DataFrame(columns=ANALYTICS_COLUMNS)
+        # stack() turns every (period end, column) cell into a row and drops the NaN cells in the same step
+        long = pd.concat({metric: df.stack() for metric, df in frames.items()}, names=['metric', 'period_end', 'value_type'])
+        long = long.rename('value').reset_index()
+        long['period_end'] = pd.to_datetime(long['period_end']).dt.strftime('%Y-%m-%d')
+        long['value'] = long['value'].astype(float)
+        long['data_identifier'] = data_identifier
+        long['ticker'] = ticker
+        long['period'] = period
+        long['frequency'] = frequency
+        long['calculation_date'] = calculation_date.strftime('%Y-%m-%d %H:%M:%S')
+        return long[ANALYTICS_COLUMNS]
+
+    def upsert_query(self):
+        placeholders = ', '.join([self.placeholder] * len(ANALYTICS_COLUMNS))
+        query = f"INSERT INTO analytics ({', '.join(ANALYTICS_COLUMNS)}) VALUES ({placeholders})"
+        if isinstance(self.connection, sqlite3.Connection):
+            return f"{query} ON CONFLICT ({', '.join(ANALYTICS_KEY)}) DO UPDATE SET value = excluded.value, calculation_date = excluded.calculation_date"
+        return f"{query} ON DUPLICATE KEY UPDATE value = VALUES(value), calculation_date = VALUES(calculation_date)"
+
+    def write_results(self, results, data_identifier, ticker, period, frequency, calculation_date):
+        """Upsert every value of the {metric: frame} results in one transaction and return {'rows', 'seconds', 'rows_per_second'}."""
+        started = time.perf_counter()
+        rows = list(self.build_frame(results, data_identifier, ticker, period, frequency, calculation_date).astype(object).itertuples(index=False, name=None))
+        query = self.upsert_query()
+        cursor = self.connection.cursor()
+        try:
+            for offset in range(0, len(rows), self.batch_size):
+                cursor.executemany(query, rows[offset:offset + self.batch_size])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        seconds = time.perf_counter() - started
+        stats = {'rows': len(rows), 'seconds': seconds, 'rows_per_second': len(rows) / seconds if seconds > 0 else float('inf')}
+        logging.debug(f"Upserted {len(rows)} analytics rows for {data_identifier} in {seconds:.3f}s ({stats['rows_per_second']:.0f} rows/s)")
+        return stats
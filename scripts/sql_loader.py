@@ -0,0 +1,127 @@
+"""
+Streaming, typed loading of query results from MySQL.
+
+`fetchall()` materializes every row as a tuple of Python objects before a DataFrame with object columns is built
+from them, so the peak memory of a load is several times the size of the data. The loaders of this module read
+an unbuffered (server-side) cursor `chunk_size` rows at a time and convert every column of a chunk straight into
+a typed NumPy array: DATETIME columns become datetime64, prices float64 (or float32 when asked for) and volumes
+int64. A volume column holding a NULL becomes float64 with NaN for it, like the prices, rather than a zero that
+could not be told apart from a bar without trades. Only one chunk of Python objects is alive at any time.
+
+    iter_chunks(pool, query, params, columns)   generator of typed DataFrame chunks, for out-of-core consumers
+    load_frame(pool, query, params, columns)    the whole result in one frame, built in preallocated arrays
+
+Both take the result columns as [(name, kind)] with kind 'datetime', 'price', 'volume' (or a NumPy dtype), see
+PRICE_COLUMNS, and are shared by the analytics and the model data loaders.
+"""
+import logging
+import numpy as np
+import pandas as pd
+
+# Result columns of the price queries and how they are typed
+PRICE_COLUMNS = [
+    ('date', 'datetime'),
+    ('open', 'price'),
+    ('high', 'price'),
+    ('low', 'price'),
+    ('close', 'price'),
+    ('adj_close', 'price'),
+    ('volume', 'volume'),
+]
+
+PRICES_QUERY = """
+SELECT date, open, high, low, close, adj_close, volume FROM prices
+INNER JOIN raw_data ON prices.raw_data_id = raw_data.id
+WHERE raw_data.ticker = %s AND raw_data.period = %s AND raw_data.frequency = %s
+ORDER BY date
+"""
+
+
+def column_dtypes(columns, price_dtype=np.float64):
+    kinds = {'datetime': np.dtype('datetime64[us]'), 'price': np.dtype(price_dtype), 'volume': np.dtype(np.int64)}
+    return [(name, kinds[kind] if kind in kinds else np.dtype(kind)) for name, kind in columns]
+
+
+def fill(target, values):
+    """
+    Convert a column of Python values into the typed slice `target`, NULL becoming NaN/NaT.
+
+    Integer slices cannot hold NaN, their NULLs are written as 0 and their positions returned for the caller to
+    turn the column into floats; the returned array is empty otherwise.
+    """
+    try:
+        target[:] = values
+    except TypeError:
+        null = 0 if target.dtype.kind in 'iu' else None
+        target[:] = [null if value is None else value for value in values]
+        if target.dtype.kind in 'iu':
+            return np.flatnonzero([value is None for value in values])
+    return np.empty(0, np.int64)
+
+
+def with_nulls(array, nulls, name):
+    """Return an integer column as float64 with NaN at the positions of its NULLs, unchanged without NULLs."""
+    if not len(nulls):
+        return array
+    logging.info(f"{len(nulls)} NULL values in the integer column {name} loaded as NaN, the column is float64")
+    array = array.astype(np.float64)
+    array[nulls] = np.nan
+    return array
+
+
+def fetch_chunks(pool, query, params, chunk_size):
+    """Yield lists of at most `chunk_size` rows from an unbuffered cursor, the rows are never all held at once."""
+    with pool.connection() as connection:
+        cursor = connection.cursor(buffered=False)
+        exhausted = False
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    exhausted = True
+                    return
+                yield rows
+        finally:
+            if not exhausted and hasattr(connection, 'consume_results'):
+                # The consumer stopped early, the unread rows must be drained before the connection is reused
+                connection.consume_results()
+            cursor.close()
+
+
+def iter_chunks(pool, query, params, columns=PRICE_COLUMNS, chunk_size=50000, price_dtype=np.float64, index='date'):
+    """Yield the result of a query as typed DataFrames of at most `chunk_size` rows, indexed on `index` (None for none)."""
+    dtypes = column_dtypes(columns, price_dtype)
+    for rows in fetch_chunks(pool, query, params, chunk_size):
+        data = {}
+        for position, (name, dtype) in enumerate(dtypes):
+            data[name] = np.empty(len(rows), dtype)
+            data[name] = with_nulls(data[name], fill(data[name], [row[position] for row in rows]), name)
+        df = pd.DataFrame(data, copy=False)
+        yield df.set_index(index) if index else df
+
+
+def load_frame(pool, query, params, columns=PRICE_COLUMNS, chunk_size=50000, price_dtype=np.float64, index='date', expected_rows=None):
+    """
+    Load the whole result of a query into one typed DataFrame, None if it has no rows.
+
+    The columns are preallocated for `expected_rows` (one chunk by default) and grown geometrically, every chunk
+    is converted straight into its slice of the arrays.
+    """
+    dtypes = column_dtypes(columns, price_dtype)
+    capacity = max(expected_rows or chunk_size, 1)
+    arrays = {name: np.empty(capacity, dtype) for name, dtype in dtypes}
+    nulls = {name: [] for name, _ in dtypes}
+    count = 0
+    for rows in fetch_chunks(pool, query, params, chunk_size):
+        if count + len(rows) > capacity:
+            capacity = max(2 * capacity, count + len(rows))
+            arrays = {name: np.resize(array, capacity) for name, array in arrays.items()}
+        for position, (name, _) in enumerate(dtypes):
+            nulls[name].append(count + fill(arrays[name][count:count + len(rows)], [row[position] for row in rows]))
+        count += len(rows)
+    if not count:
+        return None
+    df = pd.DataFrame({name: with_nulls(array[:count], np.concatenate(nulls[name]), name) for name, array in arrays.items()}, copy=False)
+    logging.debug(f"Loaded {count} rows ({df.memory_usage(deep=True).sum() / 1e6:.1f} MB) in chunks of {chunk_size}")
+    return df.set_index(index) if index else df
@@ -0,0 +1,124 @@
+"""
+Non-blocking logging into the MySQL `logs` table.
+
+`MySQLLogHandler.emit` only formats the record and puts it on a bounded queue, so a `logger.info` call in the
+hot path no longer costs a database round trip. A background thread drains the queue and inserts the records
+in batches, whenever `batch_size` records are waiting or `flush_interval` seconds have passed, on a connection
+of its own taken from the shared pool, never the one a data job is using. When the queue is full records are
+either dropped (and counted) or the caller blocks until there is room, depending on the overflow policy. Pending
+records are written on flush() and close(), which logging.shutdown() calls at interpreter exit.
+
+A record is linked to a dataset only through an explicit `extra={'raw_data_id': id}`, and a batch the database
+rejects (e.g. a raw_data_id violating the foreign key) is retried row by row, so one bad record does not take
+the rest of its batch with it.
+"""
+import time
+import queue
+import logging
+import threading
+
+
+class MySQLLogHandler(logging.Handler):
+    """
+    Queue-backed logging handler that writes log records to the `logs` table in batches.
+
+    Attributes:
+        pool (ConnectionPool): Pool the writer thread takes its connection from for every batch.
+        batch_size (int): Number of records written per INSERT batch.
+        flush_interval (float): Maximum number of seconds a record waits before its batch is written.
+        queue_size (int): Maximum number of records waiting to be written.
+        overflow (str): 'drop' discards records when the queue is full, 'block' makes the caller wait.
+
+    Methods:
+        emit(record): Queues a record without touching the database, raw_data_id taken from `extra`.
+        flush(): Blocks until every queued record has been written.
+        close(): Writes pending records and stops the writer thread.
+    """
+    def __init__(self, pool, batch_size=100, flush_interval=2.0, queue_size=10000, overflow='drop'):
+        super().__init__()
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self.records = queue.Queue(maxsize=queue_size)
+        self.stopping = threading.Event()
+        self.writer = threading.Thread(target=self.write_loop, name='MySQLLogHandler', daemon=True)
+        self.writer.start()
+
+    def emit(self, record):
+        # Only an explicit extra={'raw_data_id': ...} links a record to a dataset, message arguments never do
+        raw_data_id = getattr(record, 'raw_data_id', None)
+        try:
+            row = (raw_data_id, record.name, record.funcName, record.levelname, self.format(record))
+            if self.overflow == 'block':
+                self.records.put(row)
+            else:
+                self.records.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def insert_rows(self, rows):
+        with self.pool.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO logs (raw_data_id, log_date, log_class, log_method, log_level, message) VALUES (%s, NOW(), %s, %s, %s, %s)",
+                rows
+            )
+
+    def write_batch(self, rows):
+        """Insert a batch of log rows in one transaction on a pooled connection, row by row if the batch is rejected."""
+        try:
+            self.insert_rows(rows)
+            return
+        except Exception as e:
+            if len(rows) == 1:
+                # Logging the failure through the logging module would feed back into this handler
+                print(f"Failed to log a record to database: {e}")
+                return
+        # Only the rows the database rejects are lost, e.g. a raw_data_id violating the foreign key
+        failed = 0
+        for row in rows:
+            try:
+                self.insert_rows([row])
+            except Exception as e:
+                failed += 1
+                error = e
+        if failed:
+            print(f"Failed to log {failed} of {len(rows)} records to database: {error}")
+
+    def write_loop(self):
+        """Drain the queue in the background, writing a batch when it is full or the flush interval has passed."""
+        while not (self.stopping.is_set() and self.records.empty()):
+            rows = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self.records.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if self.stopping.is_set() and self.records.empty():
+                    break
+            if rows:
+                self.write_batch(rows)
+                for _ in rows:
+                    self.records.task_done()
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        if self.writer.is_alive():
+            self.records.join()
+
+    def close(self):
+        if self.stopping.is_set():
+            # Already closed, e.g. explicitly and then again by logging.shutdown() at exit
+            return super().close()
+        self.stopping.set()
+        self.writer.join()
+        if self.dropped:
+            print(f"MySQLLogHandler dropped {self.dropped} log records because its queue was full.")
+        super().close()
@@ -0,0 +1,164 @@
+"""
+Shared, lazily created MySQL connection pool for the SQL pipeline.
+
+Importing a module no longer opens a connection: connections are only created the first time they are
+acquired, up to a bounded pool size, and are reused across jobs and threads afterwards. An idle connection is
+health-checked before it is handed out again and transparently replaced when the server has dropped it.
+`pool.connection()` and `pool.cursor()` are context managers that always return the connection to the pool,
+the latter also committing on success and rolling back on errors.
+"""
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import mysql.connector
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "admin0000",
+    "database": "crypto_data"
+}
+
+
+def mysql_connect(**overrides):
+    """Open a new MySQL connection with DB_CONFIG, individual settings can be overridden."""
+    return mysql.connector.connect(**{**DB_CONFIG, **overrides})
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of lazily created connections.
+
+    Attributes:
+        factory (callable): Opens a new connection.
+        size (int): Maximum number of open connections.
+        health_check_interval (float): Idle seconds after which a connection is checked before reuse.
+        acquire_timeout (float): Seconds to wait for a free connection before raising TimeoutError.
+
+    Methods:
+        acquire(): Takes a healthy connection from the pool, opening one if needed.
+        release(connection): Returns a connection to the pool.
+        connection(): Context manager around acquire/release.
+        cursor(commit): Context manager yielding a cursor on a pooled connection.
+        close_all(): Closes every idle connection.
+    """
+    def __init__(self, factory=mysql_connect, size=4, health_check_interval=30.0, acquire_timeout=30.0):
+        self.factory = factory
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.idle = []
+        self.open_count = 0
+        self.condition = threading.Condition()
+
+    def is_healthy(self, connection):
+        """Check a connection with a ping (MySQL) or a trivial query (other DB-API drivers)."""
+        try:
+            if hasattr(connection, 'ping'):
+                connection.ping(reconnect=True, attempts=1, delay=0)
+            else:
+                cursor = connection.cursor()
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                cursor.close()
+            return True
+        except Exception as e:
+            logging.warning(f"Discarding unhealthy pooled connection: {e}")
+            return False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            while not self.idle and self.open_count >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    raise TimeoutError(f"No pooled connection became available within {self.acquire_timeout}s")
+            if self.idle:
+                connection, released_at = self.idle.pop()
+            else:
+                connection, released_at = None, None
+                self.open_count += 1
+        try:
+            if connection is not None and time.monotonic() - released_at > self.health_check_interval and not self.is_healthy(connection):
+                self.discard(connection, keep_slot=True)
+                connection = None
+            if connection is None:
+                connection = self.factory()
+            return connection
+        except Exception:
+            with self.condition:
+                self.open_count -= 1
+                self.condition.notify()
+            raise
+
+    def discard(self, connection, keep_slot=False):
+        """Close a broken connection, freeing its slot in the pool unless it is about to be replaced."""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        if not keep_slot:
+            with self.condition:
+                self.open_count -= 1
+                self.condition.notify()
+
+    def release(self, connection):
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """Yield a pooled connection, discarding it instead of returning it to the pool if the block failed on it."""
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception:
+            try:
+                connection.rollback()
+                self.release(connection)
+            except Exception:
+                self.discard(connection)
+            raise
+        else:
+            self.release(connection)
+
+    @contextmanager
+    def cursor(self, commit=True):
+        """Yield a cursor on a pooled connection, committing on success (if `commit`) and rolling back on errors."""
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                if commit:
+                    connection.commit()
+            finally:
+                cursor.close()
+
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.open_count -= len(idle)
+            self.condition.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        logging.info(f"Closed {len(idle)} pooled connections.")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(size=None):
+    """Return the process-wide connection pool, creating it (without connecting) on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(mysql_connect, size=size or 4)
+        elif size is not None and size > _pool.size:
+            _pool.size = size
+        return _pool
@@ -1,5 +1,16 @@
-import mysql.connector
+"""
+Creates the crypto_data database and evolves its schema through versioned migrations.
+
+Every migration is applied once, in order, and recorded in the `schema_migrations` table, so running this
+script again only applies the migrations that are still pending. Usage:
+
+    python scripts/sql_setup.py                  # apply pending migrations
+    python scripts/sql_setup.py --explain        # show the query plans of the hot queries
+    python scripts/sql_setup.py --drop logs      # drop tables (replaces the interactive deletion prompt)
+"""
+import argparse
 from mysql.connector import Error
+from sql_pool import mysql_connect
 
 def create_database(connection):
     cursor = connection.cursor()
@@ -28,104 +39,210 @@ def delete_table(connection, table_name):
     except Error as e:
         print(f"Error deleting table {table_name}: {e}")
 
-def main():
-    db_connection = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        passwd="admin0000",
-        use_pure=True  # Sometimes necessary to avoid bugs in certain MySQL connector versions
-    )
-    create_database(db_connection)
+raw_data_table = """
+CREATE TABLE IF NOT EXISTS raw_data (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    data_identifier VARCHAR(255),
+    ticker VARCHAR(255),
+    frequency VARCHAR(50),
+    period VARCHAR(255),
+    time_interval VARCHAR(255),  # Renamed to avoid conflict with SQL reserved keywords
+    fetch_date DATETIME,
+    data_start_date DATETIME,
+    data_end_date DATETIME,
+    data_duration VARCHAR(255),
+    data_size_mb FLOAT
+);
+"""
 
-    # Reconnect to the specific database to ensure all operations are targeting the correct DB
-    db_connection = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        passwd="admin0000",
-        database="crypto_data",
-        use_pure=True
+prices_table = """
+CREATE TABLE IF NOT EXISTS prices (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    raw_data_id INT,
+    data_identifier VARCHAR(255),
+    date DATETIME,
+    open FLOAT,
+    high FLOAT,
+    low FLOAT,
+    close FLOAT,
+    adj_close FLOAT,
+    volume BIGINT,
+    FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
+);
+"""
+
+analytics_table = """
+CREATE TABLE IF NOT EXISTS analytics (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    raw_data_id INT,
+    data_identifier VARCHAR(255),
+    ticker VARCHAR(255),
+    period VARCHAR(255),
+    frequency VARCHAR(50),
+    metric VARCHAR(255),
+    value_type VARCHAR(255),
+    value FLOAT,
+    calculation_date DATETIME,
+    FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
+);
+"""
+
+logs_table = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    raw_data_id INT,
+    log_date DATETIME,
+    log_class VARCHAR(255),
+    log_method VARCHAR(255),
+    log_level VARCHAR(50),
+    message TEXT,
+    FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
+);
+"""
+
+def drop_foreign_keys(table):
+    """Build a statement factory that drops every foreign key of `table`, looking the constraint names up at migration time."""
+    def statements(cursor):
+        cursor.execute(
+            "SELECT DISTINCT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND REFERENCED_TABLE_NAME IS NOT NULL",
+            (table,)
+        )
+        return [f"ALTER TABLE {table} DROP FOREIGN KEY `{row[0]}`" for row in cursor.fetchall()]
+    return statements
+
+def yearly_partitions(first_year=2010, last_year=2035):
+    """Build the RANGE COLUMNS partition list of the prices table, one partition per year plus a catch-all."""
+    partitions = [f"PARTITION p{year} VALUES LESS THAN ('{year + 1}-01-01')" for year in range(first_year, last_year + 1)]
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return ",\n    ".join(partitions)
+
+# Versioned migrations: (version, description, statements), applied once and in order. A statement is either an SQL
+# string or a callable that receives the cursor and returns the SQL strings to run
+MIGRATIONS = [
+    (1, "Initial schema", [raw_data_table, prices_table, analytics_table, logs_table]),
+    (2, "Unique data identifiers and dataset lookup index on raw_data", [
+        "ALTER TABLE raw_data ADD UNIQUE KEY uq_raw_data_identifier (data_identifier)",
+        "ALTER TABLE raw_data ADD INDEX idx_raw_data_dataset (ticker, period, frequency)",
+    ]),
+    (3, "Lookup index on analytics", [
+        "ALTER TABLE analytics ADD INDEX idx_analytics_lookup (ticker, period, frequency, metric)",
+    ]),
+    (4, "Index prices on (raw_data_id, date) and range-partition it by date", [
+        # Partitioned InnoDB tables cannot have foreign keys, and every unique key must contain the partitioning column.
+        # The constraint names are server-generated, so they are looked up; BulkPriceWriter checks raw_data_id instead.
+        "ALTER TABLE prices ADD INDEX idx_prices_raw_data_date (raw_data_id, date)",
+        drop_foreign_keys('prices'),
+        "ALTER TABLE prices MODIFY date DATETIME NOT NULL",
+        "ALTER TABLE prices DROP PRIMARY KEY, ADD PRIMARY KEY (id, date)",
+        f"ALTER TABLE prices PARTITION BY RANGE COLUMNS (date) (\n    {yearly_partitions()}\n)",
+    ]),
+    (5, "Period end date and idempotent upsert key on analytics", [
+        "ALTER TABLE analytics ADD COLUMN period_end DATE AFTER value_type",
+        "ALTER TABLE analytics ADD UNIQUE KEY uq_analytics_value (data_identifier, metric, value_type, period_end)",
+    ]),
+]
+
+def applied_versions(connection):
+    cursor = connection.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at DATETIME
     )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
 
-    # Create tables
-    raw_data_table = """
-    CREATE TABLE IF NOT EXISTS raw_data (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        data_identifier VARCHAR(255),
-        ticker VARCHAR(255),
-        frequency VARCHAR(50),
-        period VARCHAR(255),
-        time_interval VARCHAR(255),  # Renamed to avoid conflict with SQL reserved keywords
-        fetch_date DATETIME,
-        data_start_date DATETIME,
-        data_end_date DATETIME,
-        data_duration VARCHAR(255),
-        data_size_mb FLOAT
-    );
-    """
-
-    prices_table = """
-    CREATE TABLE IF NOT EXISTS prices (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        raw_data_id INT,
-        data_identifier VARCHAR(255),
-        date DATETIME,
-        open FLOAT,
-        high FLOAT,
-        low FLOAT,
-        close FLOAT,
-        adj_close FLOAT,
-        volume BIGINT,
-        FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
-    );
-    """
-
-    analytics_table = """
-    CREATE TABLE IF NOT EXISTS analytics (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        raw_data_id INT,
-        data_identifier VARCHAR(255),
-        ticker VARCHAR(255),
-        period VARCHAR(255),
-        frequency VARCHAR(50),
-        metric VARCHAR(255),
-        value_type VARCHAR(255),
-        value FLOAT,
-        calculation_date DATETIME,
-        FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
-    );
-    """
-
-    logs_table = """
-    CREATE TABLE IF NOT EXISTS logs (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        raw_data_id INT,
-        log_date DATETIME,
-        log_class VARCHAR(255),
-        log_method VARCHAR(255),
-        log_level VARCHAR(50),
-        message TEXT,
-        FOREIGN KEY (raw_data_id) REFERENCES raw_data (id)
-    );
-    """
-    
-    # Create tables
-    #create_table(db_connection, raw_data_table)
-    #create_table(db_connection, prices_table)
-    #create_table(db_connection, logs_table)
-    create_table(db_connection, analytics_table)
-
-    
-
-    # Interactive deletion
-    while True:
-        table_to_delete = input("Enter table name to delete or type 'exit' to finish: ")
-        if table_to_delete.lower() == 'exit':
+def migrate(connection, target=None):
+    """Apply every pending migration up to `target` (all by default), stopping at the first failure."""
+    applied = applied_versions(connection)
+    cursor = connection.cursor()
+    for version, description, statements in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        try:
+            for statement in statements:
+                for sql in (statement(cursor) if callable(statement) else [statement]):
+                    cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, NOW())",
+                (version, description)
+            )
+            connection.commit()
+            print(f"Applied migration {version}: {description}")
+        except Error as e:
+            # DDL statements commit implicitly in MySQL, so the statements before the failure stay applied
+            print(f"Migration {version} ({description}) failed: {e}")
             break
-        delete_table(db_connection, table_to_delete)
+    cursor.close()
+
+# The hot queries of the pipeline with example parameters, checked by explain_hot_queries
+HOT_QUERIES = {
+    "analytics load_data join": (
+        """SELECT date, open, high, low, close, adj_close, volume FROM prices
+        INNER JOIN raw_data ON prices.raw_data_id = raw_data.id
+        WHERE raw_data.ticker = %s AND raw_data.period = %s AND raw_data.frequency = %s
+        ORDER BY date""",
+        ('BTC-USD', '1y', 'Daily')
+    ),
+    "analytics bucket aggregation": (
+        """SELECT DATE(date) + INTERVAL (6 - WEEKDAY(date)) DAY AS week_end, LAST_DAY(date) AS month_end, SUM(close), COUNT(close)
+        FROM prices INNER JOIN raw_data ON prices.raw_data_id = raw_data.id
+        WHERE raw_data.ticker = %s AND raw_data.period = %s AND raw_data.frequency = %s
+        GROUP BY week_end, month_end""",
+        ('BTC-USD', '1y', 'Hourly')
+    ),
+    "fetcher freshness lookup": (
+        "SELECT id FROM raw_data WHERE data_identifier = %s",
+        ('BTC_1y_1d_20240101',)
+    ),
+    "analytics results lookup": (
+        "SELECT value_type, value FROM analytics WHERE ticker = %s AND period = %s AND frequency = %s AND metric = %s",
+        ('BTC-USD', '1y', 'Daily', 'Weekly')
+    ),
+}
+
+def explain_hot_queries(connection):
+    """Print the query plan of every hot query and flag full table scans. Returns the names of the scanning queries."""
+    cursor = connection.cursor(dictionary=True)
+    scans = []
+    for name, (query, params) in HOT_QUERIES.items():
+        cursor.execute(f"EXPLAIN {query}", params)
+        print(f"-- {name}")
+        for row in cursor.fetchall():
+            print(f"   table={row['table']} type={row['type']} key={row['key']} rows={row['rows']} extra={row['Extra']}")
+            if row['type'] == 'ALL':
+                scans.append(name)
+    cursor.close()
+    for name in scans:
+        print(f"WARNING: '{name}' performs a full table scan")
+    return scans
+
+def main():
+    parser = argparse.ArgumentParser(description="Create and migrate the crypto_data database.")
+    parser.add_argument('--target', type=int, help="Only migrate up to this schema version.")
+    parser.add_argument('--explain', action='store_true', help="Print the query plans of the hot queries.")
+    parser.add_argument('--drop', nargs='+', metavar='TABLE', default=[], help="Tables to drop instead of migrating.")
+    args = parser.parse_args()
 
+    db_connection = mysql_connect(database=None, use_pure=True)  # use_pure avoids bugs in certain MySQL connector versions
+    create_database(db_connection)
+    db_connection.close()
+
+    # Reconnect to the specific database to ensure all operations are targeting the correct DB
+    db_connection = mysql_connect(use_pure=True)
+    if args.drop:
+        for table_name in args.drop:
+            delete_table(db_connection, table_name)
+    else:
+        migrate(db_connection, args.target)
+    if args.explain:
+        explain_hot_queries(db_connection)
     db_connection.close()
 
 if __name__ == "__main__":
     main()
-
-
@@ -0,0 +1,64 @@
+import os
+import random
+import numpy as np
+import pandas as pd
+import pytest
+import price_store
+from price_store import VersionedPriceStore
+
+
+def bars(start, periods, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, periods))
+    index = pd.date_range(start, periods=periods, freq='D', name='Date')
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(1, 1000, periods)}, index=index)
+
+
+def stored_rows(store, ticker, interval):
+    return sum(segment['rows'] for segment in store.read_manifest(ticker, interval)['segments'].values())
+
+
+@pytest.fixture
+def csv_tree(tmp_path):
+    """Two fetch dates of the 1y and 3mo windows of BTC, the second fetch revising no bar."""
+    directory = tmp_path / 'data' / 'BTC' / 'Daily'
+    directory.mkdir(parents=True)
+    first = bars('2023-01-01', 365, 1)
+    second = pd.concat([first, bars('2024-01-01', 10, 2)]).iloc[10:]
+    for date_str, full in (('20240101', first), ('20240111', second)):
+        full.to_csv(directory / f"BTC_1y_1d_{date_str}.csv")
+        full.iloc[-90:].to_csv(directory / f"BTC_3mo_1d_{date_str}.csv")
+    return tmp_path, pd.concat([first, second])
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_migration_stores_every_bar_once_in_any_file_order(csv_tree, monkeypatch, seed):
+    tmp_path, all_bars = csv_tree
+    files = sorted(str(path) for path in (tmp_path / 'data').rglob('*.csv'))
+    random.Random(seed).shuffle(files)
+    monkeypatch.setattr(price_store, 'glob', lambda pattern: list(files))
+    store = VersionedPriceStore(str(tmp_path / 'versions'))
+
+    assert store.migrate_csv_tree(str(tmp_path / 'data')) == 4
+    unique = all_bars[~all_bars.index.duplicated()]
+    assert stored_rows(store, 'BTC-USD', '1d') == len(unique)
+    assert store.snapshots('BTC-USD', '1d') == ['20240101', '20240111']
+    assert len(store.read('BTC-USD', '1d', as_of='20240101')) == 365
+    assert store.read('BTC-USD', '1d').index.min() == pd.Timestamp('2023-01-11')
+
+
+@pytest.mark.parametrize('order', [('3mo', '1y'), ('1y', '3mo')])
+def test_same_day_windows_reuse_the_bars_of_the_earlier_fetch(tmp_path, order):
+    store = VersionedPriceStore(str(tmp_path / 'versions'))
+    first = bars('2023-01-01', 365, 1)
+    store.write(first, 'BTC-USD', '1d', fetch_date='20240101', replace=True)
+    second = pd.concat([first, bars('2024-01-01', 10, 2)]).iloc[10:]
+    windows = {'1y': second, '3mo': second.iloc[-90:]}
+    for period in order:
+        store.write(windows[period], 'BTC-USD', '1d', fetch_date='20240111', replace=True)
+
+    assert stored_rows(store, 'BTC-USD', '1d') == 375
+    latest = store.read('BTC-USD', '1d')
+    pd.testing.assert_index_equal(latest.index, second.index)
+    assert np.allclose(latest['Close'].to_numpy(), second['Close'].to_numpy())
@@ -0,0 +1,71 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from sql_ingest import sqlite_connect, BulkPriceWriter, BulkAnalyticsWriter
+
+
+def price_frame(periods=7):
+    close = np.arange(periods, dtype=float) + 100
+    return pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=periods, freq='D'), 'Open': close, 'High': close + 1,
+                         'Low': close - 1, 'Close': close, 'Adj Close': close, 'Volume': np.arange(periods) * 10})
+
+
+def results(offset=0.0):
+    index = pd.DatetimeIndex(['2024-01-07', '2024-01-14'], name='Date')
+    weekly = pd.DataFrame({'Close_mean': [100.0 + offset, 105.0 + offset], 'Volume_sum': [30.0, np.nan]}, index=index)
+    monthly = pd.DataFrame({'Close_mean': [102.5 + offset]}, index=pd.DatetimeIndex(['2024-01-31'], name='Date'))
+    return {'Weekly': weekly, 'Monthly': monthly}
+
+
+@pytest.fixture
+def connection():
+    connection = sqlite_connect()
+    connection.execute("INSERT INTO raw_data (id, data_identifier, ticker) VALUES (1, 'BTC_1y_1d_20240107', 'BTC-USD')")
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def test_prices_are_written_in_batches_with_nan_as_null(connection):
+    data = price_frame()
+    data.loc[3, 'Close'] = np.nan
+    stats = BulkPriceWriter(connection, batch_size=3).insert_prices(1, 'BTC_1y_1d_20240107', data)
+
+    assert stats['rows'] == 7
+    rows = connection.execute("SELECT date, close, volume FROM prices ORDER BY date").fetchall()
+    assert len(rows) == 7
+    assert rows[0] == ('2024-01-01 00:00:00', 100.0, 0)
+    assert rows[3][1] is None
+
+
+def test_prices_of_an_unknown_raw_data_id_are_refused(connection):
+    with pytest.raises(ValueError):
+        BulkPriceWriter(connection).insert_prices(2, 'ETH_1y_1d_20240107', price_frame())
+    assert connection.execute("SELECT COUNT(*) FROM prices").fetchone()[0] == 0
+
+
+def test_analytics_upsert_is_keyed_on_identifier_metric_value_type_and_period_end(connection):
+    writer = BulkAnalyticsWriter(connection, batch_size=2)
+    stats = writer.write_results(results(), 'BTC_1y_1d_20240107', 'BTC-USD', '1y', 'Daily', datetime(2024, 1, 7))
+
+    # The NaN volume of the second week is not stored
+    assert stats['rows'] == 4
+    rows = connection.execute("SELECT metric, value_type, period_end, value FROM analytics ORDER BY metric, value_type, period_end").fetchall()
+    assert rows == [('Monthly', 'Close_mean', '2024-01-31', 102.5), ('Weekly', 'Close_mean', '2024-01-07', 100.0),
+                    ('Weekly', 'Close_mean', '2024-01-14', 105.0), ('Weekly', 'Volume_sum', '2024-01-07', 30.0)]
+
+
+def test_reingesting_the_same_period_updates_the_values_in_place(connection):
+    writer = BulkAnalyticsWriter(connection)
+    writer.write_results(results(), 'BTC_1y_1d_20240107', 'BTC-USD', '1y', 'Daily', datetime(2024, 1, 7))
+    writer.write_results(results(offset=1.0), 'BTC_1y_1d_20240107', 'BTC-USD', '1y', 'Daily', datetime(2024, 1, 8))
+
+    rows = connection.execute("SELECT metric, value_type, period_end, value, calculation_date FROM analytics ORDER BY metric, value_type, period_end").fetchall()
+    assert len(rows) == 4
+    assert [row[3] for row in rows] == [103.5, 101.0, 106.0, 30.0]
+    assert {row[4] for row in rows} == {'2024-01-08 00:00:00'}
+
+    # Another dataset of the same period end is stored next to it
+    writer.write_results(results(), 'BTC_1y_1d_20240108', 'BTC-USD', '1y', 'Daily', datetime(2024, 1, 8))
+    assert connection.execute("SELECT COUNT(*) FROM analytics").fetchone()[0] == 8